@@ -1,14 +1,44 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context, g
+from werkzeug.middleware.proxy_fix import ProxyFix
+import base64
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from functools import wraps
+import click
 from dotenv import load_dotenv
 load_dotenv() # This loads variables from .env into os.environ
 
 # Import SQLAlchemy components
 from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup, escape
 from sqlalchemy import text as sa_text # Renamed to avoid conflict with 'text' type
+from sqlalchemy import Computed, tuple_
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.pool import NullPool
+
+import insights
+import periods
+import schema
+import statements
+from assets import build_assets, init_assets
+from cache import FragmentCacheExtension, LRUCache, make_cache
+from compression import init_compression
+from currencies import DEFAULT_CURRENCY, currency_symbol, normalize_currency, parse_rate, parse_rates_file
+from passwords import PasswordHashBusy, PasswordHasher
+from metrics import gauge_lines, init_metrics, register_collector, render_metrics
+from importers import IMPORT_FORMATS, chunked, detect_format, iter_import_rows, parse_import_row
+from recurring import FREQUENCIES, due_occurrences
 
 app = Flask(__name__)
 # Load secret key from environment variable for security, or use a default for local dev
@@ -23,8 +53,87 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 # Optional: Disable SQLAlchemy event system if you don't need it
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Upper bound for request bodies (mainly CSV/OFX imports); uploads are streamed, not held in memory
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+
+# Number of reverse proxies (e.g. Render's load balancer) in front of the app; their
+# X-Forwarded-For entries give request.remote_addr the client's address for login throttling
+if int(os.environ.get('TRUSTED_PROXIES', 0)):
+    proxies = int(os.environ['TRUSTED_PROXIES'])
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+# --- Connection Pool ---
+# Pool settings for PostgreSQL (each gunicorn worker gets its own pool, so the database sees up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections). Pre-ping and recycling drop connections
+# the server or Supabase's proxy closed while idle, instead of failing the next request.
+# Set DB_POOLER=pgbouncer when DATABASE_URL points at PgBouncer in transaction mode: PgBouncer
+# does the pooling, so connections are opened per checkout, and prepared statements are disabled
+# because consecutive transactions can land on different server connections.
+def env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() not in ('0', 'false', 'no', 'off', '')
+
+def database_engine_options(url):
+    if not url or not url.startswith(('postgresql', 'postgres://')):
+        return {}
+    if os.environ.get('DB_POOLER', '').lower() == 'pgbouncer':
+        options = {'poolclass': NullPool} # Fresh connections, so no pre-ping needed
+        if url.startswith('postgresql+psycopg:'): # psycopg 3 prepares repeated statements by default
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+    return dict(
+        pool_pre_ping=env_flag('DB_POOL_PRE_PING', '1'),
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    )
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
 db = SQLAlchemy(app)
 
+def pool_stats():
+    # Current state of this process's connection pool (empty for NullPool, which holds no connections)
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {}
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0), # Negative while the pool is still filling up
+    }
+
+# --- Response Cache ---
+# Per-user cache for chart JSON. In-process LRU by default; set CACHE_URL to a
+# redis:// URL to share it between gunicorn workers.
+response_cache = make_cache(
+    os.environ.get('CACHE_URL'),
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 1024)),
+    ttl=int(os.environ.get('CACHE_TTL_SECONDS', 300))
+)
+
+# --- Request Metrics ---
+# Latency, SQL counts/time and template render time per endpoint, served at /metrics.
+# SLOW_QUERY_MS sets the slow-query log threshold; METRICS_TOKEN, if set, is required as a bearer token.
+init_metrics(app)
+
+@register_collector
+def pool_metrics(extra_labels):
+    stats = pool_stats()
+    return gauge_lines('budget_db_pool_connections', 'Connections in this worker\'s pool, by state.',
+                       [((('state', state),), value) for state, value in stats.items()], extra_labels)
+
+# --- Static Assets ---
+# `flask build-assets` writes hashed, resized AVIF/WebP copies of static/ images; url_for('static')
+# then points at them and they are served as immutable. STATIC_MAX_AGE applies to everything else.
+asset_manifest = init_assets(app)
+
+# --- Response Compression ---
+# brotli/gzip for HTML and JSON bodies over COMPRESS_MIN_HTML_BYTES / COMPRESS_MIN_BYTES.
+# Registered after init_metrics so request latency includes the compression time.
+init_compression(app)
+
 # --- SQLAlchemy Models ---
 # These Python classes represent your database tables.
 
@@ -33,7 +142,12 @@ class User(db.Model):
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     username = db.Column(db.Text, unique=True, nullable=False)
     password_hash = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=datetime.now)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+    # Bumped on every transaction/category write; invalidates cached responses (see bump_data_version)
+    data_version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # Currency totals, charts and budgets are reported in (see migrations/0007_currencies.sql)
+    base_currency = db.Column(db.Text, db.ForeignKey('exchange_rates.currency'), nullable=False,
+                              default=DEFAULT_CURRENCY, server_default=DEFAULT_CURRENCY)
 
     # Define relationships for easier access to related data
     categories = db.relationship('Category', backref='user', lazy=True, cascade="all, delete-orphan")
@@ -49,7 +163,7 @@ class Category(db.Model):
     name = db.Column(db.Text, nullable=False)
     type = db.Column(db.Text, nullable=False) # 'income' or 'expense'
     color = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=datetime.now)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
 
     # Note: No 'cascade="all, delete-orphan"' here for transactions
     # because transactions will handle ON DELETE SET NULL for category_id
@@ -57,7 +171,20 @@ class Category(db.Model):
 
     # Add a unique constraint to prevent a user from having two categories with the exact same name
     # This matches the SQL UNIQUE (user_id, name) constraint
-    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='_user_name_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name', name='_user_name_uc'),
+        # Indexes are created by migrations/0002_composite_indexes.sql; declared here so db.create_all() matches
+        db.Index('ix_categories_user_type', 'user_id', 'type'),
+    )
+
+    def to_dict(self):
+        # Plain-dict form used by the templates, the JS dropdowns and the category cache
+        return {
+            'id': self.id,
+            'name': self.name,
+            'type': self.type,
+            'color': self.color
+        }
 
     def __repr__(self):
         return f'<Category {self.name} ({self.type})>'
@@ -69,13 +196,169 @@ class Transaction(db.Model):
     category_id = db.Column(db.BigInteger, db.ForeignKey('categories.id'), nullable=True) # Nullable
     type = db.Column(db.Text, nullable=False) # 'income' or 'expense'
     amount = db.Column(db.Numeric(15, 2), nullable=False)
+    currency = db.Column(db.Text, db.ForeignKey('exchange_rates.currency'), nullable=False, default=DEFAULT_CURRENCY)
     description = db.Column(db.Text, nullable=True)
-    date = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=datetime.now)
-    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=datetime.now)
+    date = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+    # Set on transactions written by the recurring job (see RecurringTransaction)
+    recurring_id = db.Column(db.BigInteger, db.ForeignKey('recurring_transactions.id', ondelete='SET NULL'), nullable=True)
+    # Maintained by PostgreSQL for description search (see migrations/0006_transaction_search.sql);
+    # deferred so ordinary transaction queries don't load it
+    description_tsv = db.deferred(db.Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(description, ''))")))
+
+    # Composite indexes for the per-user query shapes (see migrations/0002_composite_indexes.sql)
+    __table_args__ = (
+        db.Index('ix_transactions_user_type_date', user_id, type, date),
+        db.Index('ix_transactions_user_date_created', user_id, date.desc(), created_at.desc(), id.desc()),
+        db.Index('ix_transactions_user_category', user_id, category_id),
+        # One transaction per schedule and date, so re-running the recurring job is harmless
+        db.Index('ux_transactions_recurring_date', recurring_id, date, unique=True,
+                 postgresql_where=recurring_id.isnot(None)),
+        db.Index('ix_transactions_description_tsv', 'description_tsv', postgresql_using='gin'),
+    )
 
     def __repr__(self):
         return f'<Transaction {self.type} {self.amount}>'
 
+class UserBalance(db.Model):
+    # Materialized all-time totals per user and currency, kept up to date by the transaction write
+    # routes (see apply_transaction_deltas) so the dashboard and account pages don't re-aggregate
+    # history. A user without rows hasn't had their aggregates built yet; get_user_balance() seeds them.
+    __tablename__ = 'user_balances'
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    currency = db.Column(db.Text, primary_key=True, default=DEFAULT_CURRENCY)
+    total_income = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    total_expense = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now, onupdate=periods.now)
+
+    def __repr__(self):
+        return f'<UserBalance {self.user_id} +{self.total_income} -{self.total_expense}>'
+
+class DailyRollup(db.Model):
+    # Pre-aggregated sum/count per (user, day, type, category), maintained alongside user_balances.
+    # The chart endpoints read these instead of grouping raw transactions.
+    __tablename__ = 'daily_rollups'
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    type = db.Column(db.Text, primary_key=True) # 'income' or 'expense'
+    # 0 = uncategorized. Deliberately no FK so the column can be part of the primary key.
+    category_id = db.Column(db.BigInteger, primary_key=True, default=0)
+    currency = db.Column(db.Text, primary_key=True, default=DEFAULT_CURRENCY) # Amounts are in this currency
+    total_amount = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyRollup {self.user_id} {self.day} {self.type} {self.category_id}>'
+
+class Budget(db.Model):
+    # Spending limit on one expense category, or on all expenses when category_id is NULL,
+    # per calendar month or ISO week (Monday start). Spending per period lives in budget_usage.
+    __tablename__ = 'budgets'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.BigInteger, db.ForeignKey('categories.id', ondelete='CASCADE'), nullable=True)
+    period = db.Column(db.Text, nullable=False) # 'month' or 'week'
+    amount = db.Column(db.Numeric(15, 2), nullable=False)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+
+    # See migrations/0004_budgets.sql (which also adds a unique index on (user_id, COALESCE(category_id, 0), period))
+    __table_args__ = (
+        db.Index('ix_budgets_user_category', 'user_id', 'category_id'),
+        db.Index('ix_budgets_category', 'category_id'),
+    )
+
+    def __repr__(self):
+        return f'<Budget {self.user_id} {self.category_id} {self.period} {self.amount}>'
+
+class RecurringTransaction(db.Model):
+    # A schedule (see recurring.py) that `flask run-recurring` turns into ordinary transactions.
+    # next_date is the first occurrence not yet written.
+    __tablename__ = 'recurring_transactions'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.BigInteger, db.ForeignKey('categories.id', ondelete='SET NULL'), nullable=True)
+    type = db.Column(db.Text, nullable=False) # 'income' or 'expense'
+    amount = db.Column(db.Numeric(15, 2), nullable=False)
+    currency = db.Column(db.Text, db.ForeignKey('exchange_rates.currency'), nullable=False, default=DEFAULT_CURRENCY)
+    description = db.Column(db.Text, nullable=True)
+    frequency = db.Column(db.Text, nullable=False) # 'daily', 'weekly', 'monthly' or 'custom' (every N days)
+    interval = db.Column(db.Integer, nullable=False, default=1)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=True)
+    next_date = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+
+    # See migrations/0005_recurring_transactions.sql
+    __table_args__ = (
+        db.Index('ix_recurring_transactions_next_date', 'next_date'),
+        db.Index('ix_recurring_transactions_user', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<RecurringTransaction {self.frequency}/{self.interval} {self.type} {self.amount}>'
+
+class BudgetUsage(db.Model):
+    # Expense total per budget and period, maintained with the other aggregates (see apply_transaction_deltas).
+    # over_limit is decided when spending changes, so readers don't compare against the budget themselves.
+    __tablename__ = 'budget_usage'
+    budget_id = db.Column(db.BigInteger, db.ForeignKey('budgets.id', ondelete='CASCADE'), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    spent = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.BigInteger, nullable=False, default=0)
+    over_limit = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        return f'<BudgetUsage {self.budget_id} {self.period_start} {self.spent}>'
+
+class ExchangeRate(db.Model):
+    # Value of one unit of `currency` in a common reference currency (see currencies.py),
+    # loaded with `flask load-rates` / `flask set-rate`
+    __tablename__ = 'exchange_rates'
+    currency = db.Column(db.Text, primary_key=True)
+    rate = db.Column(db.Numeric(20, 10), nullable=False)
+    updated_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+
+    def __repr__(self):
+        return f'<ExchangeRate {self.currency} {self.rate}>'
+
+class Statement(db.Model):
+    # A user's statement for one month or year, which is also its generation job (see "Statements"
+    # below). run_after is when a worker may claim it next; data_version and source_digest tell
+    # whether the rendered files are still current.
+    __tablename__ = 'statements'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    period = db.Column(db.Text, nullable=False) # 'month' or 'year'
+    period_start = db.Column(db.Date, nullable=False)
+    status = db.Column(db.Text, nullable=False, default='queued') # 'queued', 'running', 'ready' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+    error = db.Column(db.Text, nullable=True)
+    data_version = db.Column(db.BigInteger, nullable=True)
+    source_digest = db.Column(db.Text, nullable=True)
+    generated_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False, default=periods.now)
+
+    # See migrations/0009_statements.sql
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'period_start', name='statements_user_id_period_period_start_key'),
+        db.Index('ix_statements_pending', 'run_after', 'id', postgresql_where=sa_text("status IN ('queued', 'running')")),
+    )
+
+    def __repr__(self):
+        return f'<Statement {self.user_id} {self.period} {self.period_start} {self.status}>'
+
+class StatementFile(db.Model):
+    # One rendered format of a statement; content is deferred so listings don't load the files
+    __tablename__ = 'statement_files'
+    statement_id = db.Column(db.BigInteger, db.ForeignKey('statements.id', ondelete='CASCADE'), primary_key=True)
+    format = db.Column(db.Text, primary_key=True) # 'html', 'csv' or 'pdf'
+    content = db.deferred(db.Column(db.LargeBinary, nullable=False))
+
+    def __repr__(self):
+        return f'<StatementFile {self.statement_id} {self.format}>'
+
 # --- Jinja2 Custom Filters ---
 @app.template_filter('datetimeformat')
 def datetimeformat(value, format='%B %d, %Y'):
@@ -93,6 +376,600 @@ def datetimeformat(value, format='%B %d, %Y'):
         dt_object = value
     return dt_object.strftime(format)
 
+# Symbol for a stored currency code, e.g. {{ schedule.currency|currency_symbol }}
+app.template_filter('currency_symbol')(currency_symbol)
+
+@app.context_processor
+def inject_currency():
+    # Symbol of the logged-in user's base currency, for amounts in totals, charts and budgets
+    base_currency = current_base_currency()
+    return {'base_currency': base_currency, 'currency_symbol': currency_symbol(base_currency)}
+
+# --- Aggregate Maintenance ---
+# Write routes describe each change as signed "deltas" (the old row with sign -1,
+# the new row with sign +1) and apply them in the same DB transaction as the write.
+
+def transaction_delta(t, sign=1):
+    # Snapshot of the fields the aggregates depend on. Take it before mutating/deleting the row.
+    return {
+        'user_id': t.user_id,
+        'type': t.type,
+        'category_id': t.category_id,
+        'currency': t.currency,
+        'date': t.date,
+        'amount': Decimal(str(t.amount)) * sign,
+        'count': sign,
+    }
+
+def rollup_day(value):
+    # Calendar day (in APP_TIMEZONE) a transaction is bucketed under in daily_rollups
+    return periods.local_day(value)
+
+def local_date(column):
+    # SQL counterpart of rollup_day() for a timestamptz column, independent of the session's TimeZone
+    return db.cast(db.func.timezone(periods.APP_TIMEZONE_NAME, column), db.Date)
+
+def bump_data_version(user_ids):
+    # Invalidates every cached response for these users (the version is part of each entry and ETag)
+    db.session.execute(
+        db.update(User).where(User.id.in_(list(user_ids))).values(data_version=User.data_version + 1)
+    )
+    g.pop('user_states', None) # Drop the per-request memo (see get_user_state)
+
+# Adds per-(user, currency) balance deltas in one statement, for users whose aggregates are built
+# (those with at least one balance row); returns those users
+BALANCE_UPSERT_SQL = sa_text('''
+    INSERT INTO user_balances (user_id, currency, total_income, total_expense, transaction_count, updated_at)
+    SELECT d.user_id, d.currency, d.income, d.expense, d.count, CAST(:updated_at AS TIMESTAMPTZ)
+    FROM unnest(CAST(:user_id AS BIGINT[]), CAST(:currency AS TEXT[]), CAST(:income AS NUMERIC[]),
+                CAST(:expense AS NUMERIC[]), CAST(:count AS BIGINT[])) AS d (user_id, currency, income, expense, count)
+    WHERE EXISTS (SELECT 1 FROM user_balances b WHERE b.user_id = d.user_id)
+    ON CONFLICT (user_id, currency) DO UPDATE
+    SET total_income = user_balances.total_income + excluded.total_income,
+        total_expense = user_balances.total_expense + excluded.total_expense,
+        transaction_count = user_balances.transaction_count + excluded.transaction_count,
+        updated_at = excluded.updated_at
+    RETURNING user_id
+''')
+
+ROLLUP_UPSERT_SQL = sa_text('''
+    INSERT INTO daily_rollups (user_id, day, type, category_id, currency, total_amount, transaction_count)
+    SELECT * FROM unnest(CAST(:user_id AS BIGINT[]), CAST(:day AS DATE[]), CAST(:type AS TEXT[]),
+                         CAST(:category_id AS BIGINT[]), CAST(:currency AS TEXT[]),
+                         CAST(:total_amount AS NUMERIC[]), CAST(:transaction_count AS BIGINT[]))
+    ON CONFLICT (user_id, day, type, category_id, currency) DO UPDATE
+    SET total_amount = daily_rollups.total_amount + excluded.total_amount,
+        transaction_count = daily_rollups.transaction_count + excluded.transaction_count
+''')
+
+# Adds expense deltas to every budget they fall under; date_trunc('month'|'week') gives the period start.
+# Usage is kept in the user's base currency, converted through the exchange rates.
+BUDGET_USAGE_UPSERT_SQL = sa_text('''
+    INSERT INTO budget_usage (budget_id, period_start, spent, transaction_count, over_limit)
+    SELECT b.id, CAST(date_trunc(b.period, CAST(d.day AS TIMESTAMP)) AS DATE),
+           round(sum(d.total_amount * x.rate / base.rate), 2), sum(d.transaction_count),
+           round(sum(d.total_amount * x.rate / base.rate), 2) > b.amount
+    FROM unnest(CAST(:user_id AS BIGINT[]), CAST(:day AS DATE[]), CAST(:category_id AS BIGINT[]),
+                CAST(:currency AS TEXT[]), CAST(:total_amount AS NUMERIC[]), CAST(:transaction_count AS BIGINT[]))
+         AS d (user_id, day, category_id, currency, total_amount, transaction_count)
+    JOIN budgets b ON b.user_id = d.user_id AND (b.category_id IS NULL OR b.category_id = d.category_id)
+    JOIN users u ON u.id = d.user_id
+    JOIN exchange_rates x ON x.currency = d.currency
+    JOIN exchange_rates base ON base.currency = u.base_currency
+    GROUP BY b.id, b.amount, 2
+    ON CONFLICT (budget_id, period_start) DO UPDATE
+    SET spent = budget_usage.spent + excluded.spent,
+        transaction_count = budget_usage.transaction_count + excluded.transaction_count,
+        over_limit = budget_usage.spent + excluded.spent > (SELECT amount FROM budgets WHERE id = budget_usage.budget_id)
+    RETURNING budget_id, period_start, spent, over_limit
+''')
+
+def apply_transaction_deltas(deltas):
+    # Sum the deltas per (user, currency) and per rollup key so a batch costs a fixed number of
+    # statements however many users it touches: one upsert each into user_balances, daily_rollups
+    # and budget_usage.
+    # Returns [(budget_id, period_start, spent), ...] for budget periods that are over their limit
+    # after this write, so the caller can warn the user.
+    balance_deltas = {}
+    rollup_deltas = {}
+    for delta in deltas:
+        balance_key = (delta['user_id'], delta['currency'])
+        income, expense, count = balance_deltas.get(balance_key, (Decimal(0), Decimal(0), 0))
+        if delta['type'] == 'income':
+            income += delta['amount']
+        else:
+            expense += delta['amount']
+        balance_deltas[balance_key] = (income, expense, count + delta['count'])
+
+        key = (delta['user_id'], rollup_day(delta['date']), delta['type'], delta['category_id'] or 0,
+               delta['currency'])
+        amount, count = rollup_deltas.get(key, (Decimal(0), 0))
+        rollup_deltas[key] = (amount + delta['amount'], count + delta['count'])
+
+    initialized_users = set()
+    if balance_deltas:
+        # Users without any balance row have never had their aggregates built; they're skipped, and
+        # get_user_balance() will seed them from the transactions table, including this write.
+        keys = list(balance_deltas)
+        result = db.session.execute(BALANCE_UPSERT_SQL, {
+            'user_id': [user_id for user_id, _ in keys],
+            'currency': [currency for _, currency in keys],
+            'income': [balance_deltas[k][0] for k in keys],
+            'expense': [balance_deltas[k][1] for k in keys],
+            'count': [balance_deltas[k][2] for k in keys],
+            'updated_at': periods.now(),
+        })
+        initialized_users = {row.user_id for row in result}
+        bump_data_version({user_id for user_id, _ in keys})
+
+    rollup_rows = [
+        {'user_id': user_id, 'day': day, 'type': t_type, 'category_id': category_id, 'currency': currency,
+         'total_amount': amount, 'transaction_count': count}
+        for (user_id, day, t_type, category_id, currency), (amount, count) in rollup_deltas.items()
+        if user_id in initialized_users and (amount or count) # Edits that cancel out are no-ops
+    ]
+    if not rollup_rows:
+        return []
+
+    # One statement however many keys there are: the rows travel as parallel arrays.
+    # Keys are unique within the batch, as ON CONFLICT DO UPDATE requires.
+    db.session.execute(ROLLUP_UPSERT_SQL, {
+        column: [row[column] for row in rollup_rows]
+        for column in ('user_id', 'day', 'type', 'category_id', 'currency', 'total_amount', 'transaction_count')
+    })
+
+    # Drop buckets that no longer hold any transactions so charts don't show empty years
+    if any(row['transaction_count'] < 0 for row in rollup_rows):
+        db.session.execute(
+            db.delete(DailyRollup).where(
+                DailyRollup.user_id.in_(initialized_users),
+                DailyRollup.transaction_count <= 0
+            )
+        )
+
+    # Usage rows that drop to zero are kept: they're tiny and may fill up again
+    expense_rows = [row for row in rollup_rows if row['type'] == 'expense']
+    if not expense_rows:
+        return []
+    usage = db.session.execute(BUDGET_USAGE_UPSERT_SQL, {
+        column: [row[column] for row in expense_rows]
+        for column in ('user_id', 'day', 'category_id', 'currency', 'total_amount', 'transaction_count')
+    })
+    return [(u.budget_id, u.period_start, u.spent) for u in usage if u.over_limit]
+
+def move_rollup_category(user_id, from_category_id, to_category_id):
+    # Re-buckets a category's rollups (0 = uncategorized) with two set-based statements,
+    # e.g. when a category is deleted and its transactions become uncategorized.
+    source = db.select(
+        DailyRollup.user_id, DailyRollup.day, DailyRollup.type,
+        db.literal(to_category_id or 0, db.BigInteger), DailyRollup.currency,
+        DailyRollup.total_amount, DailyRollup.transaction_count
+    ).where(DailyRollup.user_id == user_id, DailyRollup.category_id == (from_category_id or 0))
+    stmt = pg_insert(DailyRollup).from_select(
+        ['user_id', 'day', 'type', 'category_id', 'currency', 'total_amount', 'transaction_count'], source)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[DailyRollup.user_id, DailyRollup.day, DailyRollup.type, DailyRollup.category_id,
+                        DailyRollup.currency],
+        set_={'total_amount': DailyRollup.total_amount + stmt.excluded.total_amount,
+              'transaction_count': DailyRollup.transaction_count + stmt.excluded.transaction_count}
+    ))
+    db.session.execute(
+        db.delete(DailyRollup).where(DailyRollup.user_id == user_id,
+                                     DailyRollup.category_id == (from_category_id or 0))
+    )
+
+def compute_balance_totals(user_ids=None):
+    # One grouped query over transactions, keyed by (user, currency); users without transactions
+    # get a zero row in their base currency. Used for seeding and by the rebuild command.
+    currency = db.func.coalesce(Transaction.currency, User.base_currency)
+    query = db.session.query(
+        User.id,
+        currency,
+        db.func.coalesce(db.func.sum(Transaction.amount).filter(Transaction.type == 'income'), 0),
+        db.func.coalesce(db.func.sum(Transaction.amount).filter(Transaction.type == 'expense'), 0),
+        db.func.count(Transaction.id)
+    ).outerjoin(Transaction, Transaction.user_id == User.id)\
+    .group_by(User.id, currency)
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+    return {(user_id, currency): (income, expense, count)
+            for user_id, currency, income, expense, count in query.all()}
+
+def rebuild_user_balances(user_ids=None):
+    totals = compute_balance_totals(user_ids)
+    delete_stmt = db.delete(UserBalance)
+    if user_ids is not None:
+        delete_stmt = delete_stmt.where(UserBalance.user_id.in_(user_ids))
+    db.session.execute(delete_stmt) # Drops rows for currencies the user no longer has
+    if totals:
+        db.session.execute(pg_insert(UserBalance).values([
+            {'user_id': user_id, 'currency': currency, 'total_income': income, 'total_expense': expense,
+             'transaction_count': count, 'updated_at': periods.now()}
+            for (user_id, currency), (income, expense, count) in totals.items()
+        ]))
+    return totals
+
+def compute_daily_rollups(user_ids=None):
+    # Same shape as daily_rollups, computed from the transactions table
+    query = db.session.query(
+        Transaction.user_id,
+        local_date(Transaction.date).label('day'),
+        Transaction.type,
+        db.func.coalesce(Transaction.category_id, 0).label('category_id'),
+        Transaction.currency,
+        db.func.sum(Transaction.amount).label('total_amount'),
+        db.func.count(Transaction.id).label('transaction_count')
+    ).group_by(Transaction.user_id, 'day', Transaction.type, 'category_id', Transaction.currency)
+    if user_ids is not None:
+        query = query.filter(Transaction.user_id.in_(user_ids))
+    return query
+
+def rebuild_daily_rollups(user_ids=None):
+    delete_stmt = db.delete(DailyRollup)
+    if user_ids is not None:
+        delete_stmt = delete_stmt.where(DailyRollup.user_id.in_(user_ids))
+    db.session.execute(delete_stmt)
+    db.session.execute(pg_insert(DailyRollup).from_select(
+        ['user_id', 'day', 'type', 'category_id', 'currency', 'total_amount', 'transaction_count'],
+        compute_daily_rollups(user_ids).statement
+    ))
+
+BUDGET_USAGE_REBUILD_SQL = sa_text('''
+    INSERT INTO budget_usage (budget_id, period_start, spent, transaction_count, over_limit)
+    SELECT b.id, CAST(date_trunc(b.period, CAST(r.day AS TIMESTAMP)) AS DATE),
+           round(sum(r.total_amount * x.rate / base.rate), 2), sum(r.transaction_count),
+           round(sum(r.total_amount * x.rate / base.rate), 2) > b.amount
+    FROM budgets b
+    JOIN daily_rollups r ON r.user_id = b.user_id AND r.type = 'expense'
+                        AND (b.category_id IS NULL OR r.category_id = b.category_id)
+    JOIN users u ON u.id = b.user_id
+    JOIN exchange_rates x ON x.currency = r.currency
+    JOIN exchange_rates base ON base.currency = u.base_currency
+    WHERE b.id = ANY(CAST(:budget_ids AS BIGINT[]))
+    GROUP BY b.id, b.amount, 2
+''')
+
+def rebuild_budget_usage(user_ids=None, budget_ids=None, category_ids=None):
+    # Recomputes budget_usage from daily_rollups, for all of some users' budgets, for specific
+    # budgets or for the budgets on some categories
+    query = db.select(Budget.id)
+    if user_ids is not None:
+        query = query.where(Budget.user_id.in_(user_ids))
+    if budget_ids is not None:
+        query = query.where(Budget.id.in_(budget_ids))
+    if category_ids is not None:
+        query = query.where(Budget.category_id.in_(category_ids))
+    ids = db.session.execute(query).scalars().all()
+    if not ids:
+        return
+    db.session.execute(db.delete(BudgetUsage).where(BudgetUsage.budget_id.in_(ids)))
+    db.session.execute(BUDGET_USAGE_REBUILD_SQL, {'budget_ids': ids})
+
+def rebuild_user_aggregates(user_ids=None):
+    # The user_balances row doubles as the "aggregates are built" marker, so always rebuild them together
+    rebuild_daily_rollups(user_ids)
+    rebuild_budget_usage(user_ids)
+    return rebuild_user_balances(user_ids)
+
+def base_rate(user_id):
+    # Scalar subquery for the rate of the user's base currency; uncorrelated, so PostgreSQL
+    # evaluates it once per statement
+    return db.select(ExchangeRate.rate)\
+        .join(User, User.base_currency == ExchangeRate.currency)\
+        .where(User.id == user_id)\
+        .correlate(None)\
+        .scalar_subquery()
+
+def to_base_currency(user_id, table, currency_column):
+    # (table joined to the exchange rate of its currency column, factor that converts its amounts
+    # to the user's base currency). Aggregates multiply by the factor inside SUM, so converting
+    # costs a join against the small rates table rather than a query per currency.
+    rate = db.aliased(ExchangeRate)
+    return db.join(table, rate, rate.currency == currency_column), rate.rate / base_rate(user_id)
+
+def get_user_balance(user_id):
+    # All-time totals in the user's base currency: one query summing their per-currency rows
+    balances, factor = to_base_currency(user_id, UserBalance, UserBalance.currency)
+    query = db.session.query(
+        db.func.round(db.func.sum(UserBalance.total_income * factor), 2).label('total_income'),
+        db.func.round(db.func.sum(UserBalance.total_expense * factor), 2).label('total_expense'),
+        db.func.sum(UserBalance.transaction_count).label('transaction_count')
+    ).select_from(balances).filter(UserBalance.user_id == user_id)
+    balance = query.one()
+    if balance.transaction_count is None:
+        # First read for a user whose aggregates were never built: seed them once. Concurrent
+        # first reads (the dashboard's charts) queue on a per-user lock, and those that waited
+        # find the rows their predecessor committed instead of inserting them again.
+        db.session.execute(sa_text('SELECT pg_advisory_xact_lock(:user_id)'), {'user_id': user_id})
+        balance = query.one()
+        if balance.transaction_count is None:
+            rebuild_user_aggregates([user_id])
+            balance = query.one()
+        db.session.commit() # Also releases the lock
+    return balance
+
+# --- Exchange Rates ---
+# The aggregate queries join exchange_rates directly (see to_base_currency). This in-process copy
+# serves the currency pickers and form validation without a query per request; rates changed by
+# another process (`flask load-rates`) show up there within RATES_CACHE_SECONDS.
+rates_cache = LRUCache(max_entries=1, ttl=int(os.environ.get('RATES_CACHE_SECONDS', 300)))
+
+def get_exchange_rates():
+    # {currency: rate}, sorted by currency
+    rates = rates_cache.get('rates')
+    if rates is None:
+        rates = {r.currency: r.rate for r in ExchangeRate.query.order_by(ExchangeRate.currency)}
+        rates_cache.set('rates', rates)
+    return rates
+
+def current_base_currency():
+    # The logged-in user's base currency, read from users rather than kept in the session so a
+    # change made on another device shows up on the next request
+    if 'user_id' not in session:
+        return DEFAULT_CURRENCY
+    return get_user_state(session['user_id'])[1]
+
+def parse_currency(value, default):
+    # A currency with a loaded rate, or `default` when blank; raises ValueError
+    if not (value or '').strip():
+        return default
+    currency = normalize_currency(value)
+    if currency != default and currency not in get_exchange_rates():
+        raise ValueError(f'No exchange rate is loaded for {currency}.')
+    return currency
+
+def store_exchange_rates(rates):
+    # Upserts {currency: rate}. Budget usage is stored in base currency, so it's rebuilt for the
+    # users holding amounts in another currency, whose cached responses are invalidated too.
+    # Returns those users.
+    now = periods.now()
+    stmt = pg_insert(ExchangeRate).values([
+        {'currency': currency, 'rate': rate, 'updated_at': now} for currency, rate in rates.items()
+    ])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[ExchangeRate.currency],
+        set_={'rate': stmt.excluded.rate, 'updated_at': stmt.excluded.updated_at}
+    ))
+    rates_cache.clear()
+    user_ids = db.session.execute(
+        db.select(UserBalance.user_id).distinct()
+        .join(User, User.id == UserBalance.user_id)
+        .where(UserBalance.currency != User.base_currency)
+    ).scalars().all()
+    if user_ids:
+        rebuild_budget_usage(user_ids=user_ids)
+        bump_data_version(user_ids)
+    return user_ids
+
+# --- Bulk Import ---
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+# Column order for COPY; must match the row dicts built in import_transaction_rows()
+TRANSACTION_COPY_COLUMNS = ('user_id', 'category_id', 'type', 'amount', 'currency', 'description', 'date', 'created_at')
+
+def psycopg_green_mode():
+    # True when psycopg2 has a cooperative wait callback (see post_worker_init in gunicorn.conf.py)
+    try:
+        from psycopg2.extensions import get_wait_callback
+    except ImportError:
+        return False
+    return get_wait_callback() is not None
+
+def insert_transaction_rows(rows):
+    # Writes a batch of transaction rows inside the current session transaction.
+    # psycopg2 gets a single COPY; other drivers fall back to a batched multi-row INSERT,
+    # as does psycopg2 under gevent workers (COPY can't run with a wait callback installed).
+    dbapi_connection = db.session.connection().connection.driver_connection
+    cursor = dbapi_connection.cursor()
+    if not hasattr(cursor, 'copy_expert') or psycopg_green_mode():
+        db.session.execute(db.insert(Transaction), rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # None is written as an empty unquoted field, which COPY reads as NULL
+        writer.writerow([row[column] for column in TRANSACTION_COPY_COLUMNS])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY transactions ({', '.join(TRANSACTION_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+def import_transaction_rows(user_id, stream, fmt, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    # Streams a CSV/OFX upload into the user's transactions, chunk by chunk. Rows that fail
+    # validation are skipped and reported; the caller commits (so an import is all-or-nothing
+    # with respect to database errors). Returns (imported, error_count, first errors).
+    # Raises ValueError for problems with the file as a whole (e.g. a bad CSV header).
+    category_map = {(c['name'].lower(), c['type']): c['id'] for c in get_user_categories(user_id)}
+    base_currency = db.session.query(User.base_currency).filter(User.id == user_id).scalar()
+    created_at = periods.now()
+    imported = 0
+    error_count = 0
+    errors = []
+
+    for chunk in chunked(iter_import_rows(stream, fmt), chunk_size):
+        rows = []
+        for line_number, raw in chunk:
+            try:
+                parsed = parse_import_row(raw)
+                category_id = None
+                if parsed['category']:
+                    category_id = category_map.get((parsed['category'].lower(), parsed['type']))
+                    if category_id is None:
+                        raise ValueError(f'Unknown {parsed["type"]} category "{parsed["category"]}".')
+                currency = parse_currency(parsed['currency'], base_currency) # Rows without one are in base currency
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_number, 'error': str(e)})
+                continue
+            rows.append({
+                'user_id': user_id,
+                'category_id': category_id,
+                'type': parsed['type'],
+                'amount': parsed['amount'],
+                'currency': currency,
+                'description': parsed['description'],
+                'date': periods.localize(parsed['date']),
+                'created_at': created_at,
+            })
+
+        if rows:
+            insert_transaction_rows(rows)
+            apply_transaction_deltas([
+                {'user_id': user_id, 'type': row['type'], 'category_id': row['category_id'],
+                 'currency': row['currency'], 'date': row['date'], 'amount': row['amount'], 'count': 1}
+                for row in rows
+            ])
+            imported += len(rows)
+        if progress:
+            progress(imported, error_count)
+
+    return imported, error_count, errors
+
+# --- Recurring Transactions ---
+RECURRING_BATCH_SIZE = 500 # Schedules per batch (one insert, one update and one commit each)
+
+# Writes a batch of occurrences in one statement; occurrences already written are skipped via
+# the (recurring_id, date) unique index, and only the new rows come back for the aggregates.
+RECURRING_INSERT_SQL = sa_text('''
+    INSERT INTO transactions (user_id, category_id, type, amount, currency, description, date, created_at, recurring_id)
+    SELECT d.user_id, d.category_id, d.type, d.amount, d.currency, d.description, d.date,
+           CAST(:created_at AS TIMESTAMPTZ), d.recurring_id
+    FROM unnest(CAST(:user_id AS BIGINT[]), CAST(:category_id AS BIGINT[]), CAST(:type AS TEXT[]),
+                CAST(:amount AS NUMERIC[]), CAST(:currency AS TEXT[]), CAST(:description AS TEXT[]),
+                CAST(:date AS TIMESTAMPTZ[]), CAST(:recurring_id AS BIGINT[]))
+         AS d (user_id, category_id, type, amount, currency, description, date, recurring_id)
+    ON CONFLICT (recurring_id, date) WHERE recurring_id IS NOT NULL DO NOTHING
+    RETURNING user_id, category_id, type, amount, currency, date
+''')
+
+RECURRING_ADVANCE_SQL = sa_text('''
+    UPDATE recurring_transactions r SET next_date = d.next_date
+    FROM unnest(CAST(:id AS BIGINT[]), CAST(:next_date AS DATE[])) AS d (id, next_date)
+    WHERE r.id = d.id
+''')
+
+def materialize_recurring(through=None, rule_ids=None, batch_size=RECURRING_BATCH_SIZE):
+    # Writes every due occurrence up to `through` (default today) for all users, or only the
+    # given schedules, committing per batch. Safe to run concurrently or after downtime: due
+    # schedules are claimed with SKIP LOCKED, and a catch-up run writes exactly the missing dates.
+    # Returns (transactions created, schedules processed).
+    through = through or periods.today()
+    created = 0
+    processed = 0
+    last_id = 0
+    while True:
+        query = db.select(RecurringTransaction).where(
+            RecurringTransaction.next_date <= through,
+            db.or_(RecurringTransaction.end_date.is_(None),
+                   RecurringTransaction.next_date <= RecurringTransaction.end_date),
+            RecurringTransaction.id > last_id
+        ).order_by(RecurringTransaction.id).limit(batch_size).with_for_update(skip_locked=True)
+        if rule_ids is not None:
+            query = query.where(RecurringTransaction.id.in_(rule_ids))
+        rules = db.session.execute(query).scalars().all()
+        if not rules:
+            break
+        last_id = rules[-1].id
+
+        rows = []
+        advances = []
+        for rule in rules:
+            dates, next_date = due_occurrences(rule.start_date, rule.frequency, rule.interval,
+                                               rule.next_date, through, rule.end_date)
+            for day in dates:
+                rows.append((rule.user_id, rule.category_id, rule.type, rule.amount, rule.currency,
+                             rule.description, periods.day_start(day), rule.id))
+            advances.append((rule.id, next_date))
+
+        if rows:
+            columns = ('user_id', 'category_id', 'type', 'amount', 'currency', 'description', 'date', 'recurring_id')
+            params = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+            params['created_at'] = periods.now()
+            inserted = db.session.execute(RECURRING_INSERT_SQL, params).all()
+            apply_transaction_deltas([
+                {'user_id': r.user_id, 'type': r.type, 'category_id': r.category_id,
+                 'currency': r.currency, 'date': r.date, 'amount': r.amount, 'count': 1}
+                for r in inserted
+            ])
+            created += len(inserted)
+        db.session.execute(RECURRING_ADVANCE_SQL, {
+            'id': [rule_id for rule_id, _ in advances],
+            'next_date': [next_date for _, next_date in advances],
+        })
+        db.session.commit()
+        processed += len(rules)
+    return created, processed
+
+# --- Login Throttling ---
+# Failed sign-ins are counted per username and per client address in login_failures (see
+# migrations/0008_login_failures.sql), in fixed windows of LOGIN_THROTTLE_SECONDS. A key that
+# reaches its limit is refused before its password is hashed, so credential stuffing can't
+# spend the workers' CPU on scrypt. The username limit protects one account; the higher
+# address limit catches one client trying many accounts.
+password_hasher = PasswordHasher()
+LOGIN_THROTTLE_SECONDS = int(os.environ.get('LOGIN_THROTTLE_SECONDS', 900))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', 5))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 50))
+
+# Counts one failure for each key, restarting the count for keys whose window has ended, and
+# prunes other keys' expired rows
+LOGIN_FAILURE_SQL = sa_text('''
+    WITH pruned AS (
+        DELETE FROM login_failures
+        WHERE window_start < CAST(:cutoff AS TIMESTAMPTZ) AND key <> ALL (CAST(:keys AS TEXT[]))
+    )
+    INSERT INTO login_failures (key, failures, window_start)
+    SELECT key, 1, CAST(:now AS TIMESTAMPTZ) FROM unnest(CAST(:keys AS TEXT[])) AS key
+    ON CONFLICT (key) DO UPDATE
+    SET failures = CASE WHEN login_failures.window_start < CAST(:cutoff AS TIMESTAMPTZ) THEN 1
+                        ELSE login_failures.failures + 1 END,
+        window_start = CASE WHEN login_failures.window_start < CAST(:cutoff AS TIMESTAMPTZ) THEN excluded.window_start
+                            ELSE login_failures.window_start END
+''')
+
+def login_throttle_keys(username):
+    return {'user': f'user:{username.strip().lower()}', 'ip': f'ip:{request.remote_addr}'}
+
+def login_lockout(keys):
+    # Seconds until the first locked key's window ends, or 0 if none of the keys is locked out
+    now = periods.now()
+    limits = {keys['user']: LOGIN_MAX_FAILURES_PER_USER, keys['ip']: LOGIN_MAX_FAILURES_PER_IP}
+    rows = db.session.execute(
+        sa_text('SELECT key, failures, window_start FROM login_failures WHERE key = ANY (CAST(:keys AS TEXT[]))'),
+        {'keys': list(limits)}
+    ).all()
+    g.login_failure_keys = {row.key for row in rows}
+    retry_after = 0
+    for row in rows:
+        window_end = row.window_start + timedelta(seconds=LOGIN_THROTTLE_SECONDS)
+        if row.failures >= limits[row.key] and window_end > now:
+            retry_after = max(retry_after, int((window_end - now).total_seconds()) + 1)
+    return retry_after
+
+def record_login_failure(keys):
+    now = periods.now()
+    db.session.execute(LOGIN_FAILURE_SQL, {
+        'keys': list(keys.values()), 'now': now, 'cutoff': now - timedelta(seconds=LOGIN_THROTTLE_SECONDS),
+    })
+
+def clear_login_failures(keys):
+    # A successful sign-in resets the username's count (not the address's); skipped when
+    # login_lockout() saw no row for it
+    if keys['user'] in g.get('login_failure_keys', ()):
+        db.session.execute(sa_text('DELETE FROM login_failures WHERE key = :key'), {'key': keys['user']})
+
+def throttled_login_response(retry_after):
+    flash(f'Too many failed sign-in attempts. Try again in {max(1, retry_after // 60)} minute(s).', 'danger')
+    return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+
+def password_hash_busy_response(template):
+    # Every hashing slot on this machine stayed taken for PASSWORD_HASH_WAIT; ask the client to come back shortly
+    flash('The server is busy. Please try again in a moment.', 'danger')
+    return render_template(template), 503, {'Retry-After': '1'}
+
 # --- Login Required Decorator ---
 def login_required(f):
     @wraps(f)
@@ -103,6 +980,457 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# --- Cached JSON Responses ---
+def get_user_state(user_id):
+    # (data_version, base_currency), memoized for the rest of the request, so the category cache,
+    # the JSON cache and the currency shown on pages share one lookup
+    states = g.setdefault('user_states', {})
+    if user_id not in states:
+        row = db.session.query(User.data_version, User.base_currency).filter(User.id == user_id).first()
+        states[user_id] = (row.data_version or 0, row.base_currency) if row else (0, DEFAULT_CURRENCY)
+    return states[user_id]
+
+def get_data_version(user_id):
+    return get_user_state(user_id)[0]
+
+def cached_json_response(f):
+    # Caches a per-user JSON endpoint by (user, endpoint, query args, today's date), validated
+    # against the user's data_version, and answers matching If-None-Match headers with 304.
+    # Use below @login_required.
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_id = session['user_id']
+        version = get_data_version(user_id)
+
+        # Today's date is part of the key because period windows ('today', 'week', ...) move with it
+        args_key = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        cache_key = f'json:{user_id}:{request.endpoint}:{args_key}:{periods.today().isoformat()}'
+        etag = hashlib.sha1(f'{cache_key}:{version}'.encode()).hexdigest()
+
+        # Weak comparison: compressed responses carry a weak ETag (see compression.py)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            entry = response_cache.get(cache_key)
+            if entry is not None and entry[0] == version:
+                body = entry[1]
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response # Don't cache errors
+                body = response.get_data()
+                response_cache.set(cache_key, (version, body))
+            response = app.response_class(body, mimetype='application/json')
+
+        response.set_etag(etag)
+        # Let the browser keep the payload but revalidate it each time (cheap 304 when unchanged)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
+
+# --- Category Lookups ---
+def user_categories_cache_key(user_id):
+    return f'categories:{user_id}'
+
+def get_user_categories(user_id):
+    # A user's categories as dicts sorted by name, loaded at most once per request and cached
+    # across requests in response_cache, validated against the user's data_version (bumped by
+    # the category routes) so a stale list is never served from another worker's cache.
+    loaded = g.setdefault('user_categories', {})
+    if user_id in loaded:
+        return loaded[user_id]
+
+    version = get_data_version(user_id)
+    cache_key = user_categories_cache_key(user_id)
+    entry = response_cache.get(cache_key)
+    if entry is not None and entry[0] == version:
+        categories = entry[1]
+    else:
+        categories = [c.to_dict() for c in Category.query.filter_by(user_id=user_id).order_by(Category.name)]
+        response_cache.set(cache_key, (version, categories))
+    loaded[user_id] = categories
+    return categories
+
+def invalidate_user_categories(user_id):
+    # The version check already covers this; dropping the entry just frees it right away
+    g.get('user_categories', {}).pop(user_id, None)
+    response_cache.delete(user_categories_cache_key(user_id))
+
+# --- Template Fragment Cache ---
+# Rendered HTML for {% cache %} blocks (category tables and dropdowns) and {% cache_shared %}
+# blocks (the nav). Kept in-process: fragments are cheap to rebuild, so a worker that misses
+# just renders once. Per-user fragments are validated against data_version like the JSON cache,
+# so any write from any worker invalidates them; shared ones only depend on the templates.
+fragment_cache = LRUCache(
+    max_entries=int(os.environ.get('FRAGMENT_CACHE_ENTRIES', 4096)),
+    ttl=int(os.environ.get('CACHE_TTL_SECONDS', 300))
+)
+
+def render_cached_fragment(key_parts, render, shared):
+    key = ':'.join(map(str, key_parts))
+    if shared:
+        cache_key, version = f'fragment:shared:{key}', None
+    elif 'user_id' in session:
+        user_id = session['user_id']
+        cache_key, version = f'fragment:{user_id}:{key}', get_data_version(user_id)
+    else:
+        return render()
+    entry = fragment_cache.get(cache_key)
+    if entry is not None and entry[0] == version:
+        return Markup(entry[1])
+    html = render()
+    fragment_cache.set(cache_key, (version, str(html)))
+    return html
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = render_cached_fragment
+
+
+# --- Category Merges ---
+def merge_category_into(user_id, source_id, target_id):
+    # Moves everything that points at the source category to the target (same user, same type)
+    # and deletes the source, in a fixed number of statements however many transactions it has:
+    # transactions and recurring schedules are re-pointed with one UPDATE each, the rollups are
+    # re-bucketed, and the source's budgets move over unless the target already has one for that
+    # period (those are dropped with the source). Returns the number of transactions moved.
+    moved = db.session.execute(
+        db.update(Transaction)
+        .where(Transaction.user_id == user_id, Transaction.category_id == source_id)
+        .values(category_id=target_id)
+    ).rowcount
+    db.session.execute(
+        db.update(RecurringTransaction)
+        .where(RecurringTransaction.user_id == user_id, RecurringTransaction.category_id == source_id)
+        .values(category_id=target_id)
+    )
+    target_budgets = db.aliased(Budget)
+    db.session.execute(
+        db.update(Budget)
+        .where(Budget.user_id == user_id, Budget.category_id == source_id,
+               ~db.exists().where(target_budgets.category_id == target_id, target_budgets.period == Budget.period))
+        .values(category_id=target_id)
+    )
+    move_rollup_category(user_id, source_id, target_id)
+    rebuild_budget_usage(category_ids=[target_id])
+    # A Core delete, so the ORM doesn't load the (now empty) list of the category's transactions
+    db.session.execute(db.delete(Category).where(Category.id == source_id, Category.user_id == user_id))
+    bump_data_version([user_id])
+    return moved
+
+# --- Query Helpers ---
+
+# Page size for the paginated transaction list (history page / JSON API)
+TRANSACTIONS_PAGE_SIZE = 50
+TRANSACTIONS_PAGE_SIZE_MAX = 200
+
+# Description search: word and word-prefix matches use the tsvector GIN index; a single word
+# at least this long also matches inside longer words (ILIKE), through the pg_trgm index when
+# migrations/0006_transaction_search.sql could create it and by filtering the user's rows if not.
+# Multi-word queries stay on the tsvector index: a trigram scan for a phrase has to intersect
+# the posting lists of every word in it, which is slow when one of them is in most rows.
+SEARCH_SUBSTRING_MIN_LENGTH = 3
+SEARCH_QUERY_MAX_LENGTH = 200
+# Searches matching at most this many rows are paged from their ids (see fetch_transactions_page)
+SEARCH_CANDIDATE_LIMIT = 2000
+SEARCH_OPERATOR_RE = re.compile(r'"|(^|\s)-|\bor\b', re.IGNORECASE)
+
+def transaction_search_filter(q):
+    # websearch_to_tsquery syntax is supported ("quoted phrase", -excluded, or); plain queries
+    # also match word prefixes, so "star" finds "Starbucks" as you type
+    tsquery = db.func.websearch_to_tsquery('simple', q)
+    words = re.findall(r'\w+', q)
+    plain = not SEARCH_OPERATOR_RE.search(q)
+    if words and plain:
+        tsquery = tsquery.op('||')(db.func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words)))
+    match = Transaction.description_tsv.op('@@')(tsquery)
+    if plain and len(q) >= SEARCH_SUBSTRING_MIN_LENGTH and not re.search(r'\s', q):
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', q) + '%'
+        match = db.or_(match, Transaction.description.ilike(pattern, escape='\\'))
+    return match
+
+def highlight_search_matches(description, q):
+    # Escaped description with the query and its words wrapped in <mark>
+    if not description:
+        return Markup('')
+    q = re.sub(r'(^|\s)-\S+', ' ', q) # Excluded words never match
+    terms = {term for term in [q.strip(' "')] + re.findall(r'\w+', q) if term}
+    if not terms:
+        return escape(description)
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts, position = [], 0
+    for match in pattern.finditer(description):
+        parts.append(escape(description[position:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % match.group())
+        position = match.end()
+    parts.append(escape(description[position:]))
+    return Markup('').join(parts)
+
+def parse_transaction_filters(args, user_id):
+    # Builds SQLAlchemy filter clauses from query-string arguments.
+    # Supported: q (description search), type, category_id ('none' = uncategorized), period,
+    # start_date/end_date (YYYY-MM-DD, inclusive), min_amount/max_amount.
+    # Raises ValueError with a user-facing message on bad input.
+    filters = [Transaction.user_id == user_id]
+
+    q = (args.get('q') or '').strip()
+    if q:
+        if len(q) > SEARCH_QUERY_MAX_LENGTH:
+            raise ValueError(f'Search text must be at most {SEARCH_QUERY_MAX_LENGTH} characters.')
+        filters.append(transaction_search_filter(q))
+
+    transaction_type = args.get('type') or args.get('dataType')
+    if transaction_type and transaction_type != 'both':
+        if transaction_type not in ('income', 'expense'):
+            raise ValueError('type must be income, expense or both.')
+        filters.append(Transaction.type == transaction_type)
+
+    category_id = args.get('category_id')
+    if category_id:
+        if category_id == 'none':
+            filters.append(Transaction.category_id.is_(None))
+        else:
+            try:
+                filters.append(Transaction.category_id == int(category_id))
+            except ValueError:
+                raise ValueError('category_id must be an integer or "none".')
+
+    period = args.get('period')
+    if period and period != 'all':
+        window = periods.period_window(period)
+        filters.append(Transaction.date >= window.start)
+        filters.append(Transaction.date < window.end)
+
+    # Days are calendar days in APP_TIMEZONE; the end date is inclusive
+    if args.get('start_date'):
+        filters.append(Transaction.date >= periods.day_start(periods.parse_day(args['start_date'], 'start_date')))
+    if args.get('end_date'):
+        end_day = periods.parse_day(args['end_date'], 'end_date')
+        filters.append(Transaction.date < periods.day_start(end_day + timedelta(days=1)))
+
+    try:
+        if args.get('min_amount'):
+            filters.append(Transaction.amount >= Decimal(args['min_amount']))
+        if args.get('max_amount'):
+            filters.append(Transaction.amount <= Decimal(args['max_amount']))
+    except InvalidOperation:
+        raise ValueError('Amount filters must be numbers.')
+
+    return filters
+
+# Keyset cursors encode the (date, created_at, id) of the last row on a page,
+# so the next page is an index range scan instead of an ever-growing OFFSET.
+def encode_transactions_cursor(transaction):
+    payload = [transaction.date.isoformat(), transaction.created_at.isoformat(), transaction.id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_transactions_cursor(cursor):
+    try:
+        date_str, created_at_str, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(date_str), datetime.fromisoformat(created_at_str), int(transaction_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor.')
+
+def transaction_to_dict(t, category_name=None, category_color=None):
+    return {
+        'id': t.id,
+        'user_id': t.user_id,
+        'category_id': t.category_id,
+        'category_name': category_name,
+        'category_color': category_color,
+        'type': t.type,
+        'amount': float(t.amount), # Convert Decimal to float for JSON/template
+        'currency': t.currency,
+        'currency_symbol': currency_symbol(t.currency),
+        'description': t.description,
+        'date': t.date.isoformat(), # Convert datetime to ISO string for JS
+        'created_at': t.created_at.isoformat()
+    }
+
+# --- Budget Helpers ---
+BUDGET_PERIODS = ('month', 'week')
+
+def budget_period_start(period, today=None):
+    today = today or periods.today()
+    return today.replace(day=1) if period == 'month' else today - timedelta(days=today.weekday())
+
+def get_budget_status(user_id, today=None):
+    # Every budget with its spending in the current month/week: one indexed join over the
+    # budget and usage rows, no aggregation (usage is maintained at write time).
+    month_start = budget_period_start('month', today)
+    week_start = budget_period_start('week', today)
+    current_start = db.case((Budget.period == 'month', month_start), else_=week_start)
+    rows = db.session.query(Budget, Category.name, Category.color, BudgetUsage.spent, BudgetUsage.over_limit)\
+        .outerjoin(Category, Budget.category_id == Category.id)\
+        .outerjoin(BudgetUsage, db.and_(BudgetUsage.budget_id == Budget.id, BudgetUsage.period_start == current_start))\
+        .filter(Budget.user_id == user_id)\
+        .order_by(Budget.period, Category.name.nullsfirst())\
+        .all()
+
+    status = []
+    for budget, name, color, spent, over_limit in rows:
+        spent = spent or Decimal(0)
+        status.append({
+            'id': budget.id,
+            'categoryId': budget.category_id,
+            'name': name or 'All expenses',
+            'color': color or UNCATEGORIZED_COLOR,
+            'period': budget.period,
+            'periodStart': (month_start if budget.period == 'month' else week_start).isoformat(),
+            'limit': float(budget.amount),
+            'spent': float(spent),
+            'remaining': float(budget.amount - spent),
+            'overLimit': bool(over_limit),
+        })
+    return status
+
+def flash_budget_alerts(over_budget):
+    # over_budget is what apply_transaction_deltas returned; only costs a query when something is over
+    if not over_budget:
+        return
+    budgets = {b.id: (b, name) for b, name in db.session.query(Budget, Category.name)
+               .outerjoin(Category, Budget.category_id == Category.id)
+               .filter(Budget.id.in_([budget_id for budget_id, _, _ in over_budget]))}
+    for budget_id, period_start, spent in over_budget:
+        if budget_id not in budgets:
+            continue
+        budget, name = budgets[budget_id]
+        label = 'week of ' + period_start.strftime('%b %d, %Y') if budget.period == 'week' else period_start.strftime('%B %Y')
+        symbol = currency_symbol(current_base_currency())
+        flash(f'Over budget: {name or "All expenses"} for {label} is at {symbol}{spent:,.2f} of {symbol}{budget.amount:,.2f}.', 'danger')
+
+def parse_budget_form(form, user_id):
+    # Returns (category_id or None, period, amount); raises ValueError with a user-facing message
+    category_id = form.get('category_id') or None
+    if category_id is not None:
+        category_id = int(category_id)
+        if not any(c['id'] == category_id and c['type'] == 'expense' for c in get_user_categories(user_id)):
+            raise ValueError('Budgets can only be set on your own expense categories.')
+    period = form.get('period', 'month')
+    if period not in BUDGET_PERIODS:
+        raise ValueError('Budget period must be month or week.')
+    try:
+        amount = Decimal(form.get('amount', '')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError('Invalid budget amount.')
+    if amount <= 0 or amount >= Decimal('1e13'):
+        raise ValueError('Budget amount must be greater than zero.')
+    return category_id, period, amount
+
+def find_duplicate_budget(user_id, category_id, period, exclude_id=None):
+    query = Budget.query.filter(Budget.user_id == user_id, Budget.period == period,
+                                Budget.category_id == category_id if category_id else Budget.category_id.is_(None))
+    if exclude_id is not None:
+        query = query.filter(Budget.id != exclude_id)
+    return query.first()
+
+
+# --- Bulk Edits ---
+BULK_ACTIONS = ('recategorize', 'retype', 'shift_date', 'delete')
+BULK_MAX_IDS = 10000
+BULK_MAX_SHIFT_DAYS = 3650
+
+def parse_bulk_scope(payload, user_id):
+    # Filter clauses for the rows a bulk request targets: explicit `ids`, or a `filter` object
+    # with the same keys as /get_transactions_page's query string. Raises ValueError.
+    ids = payload.get('ids')
+    row_filter = payload.get('filter')
+    if (ids is None) == (row_filter is None):
+        raise ValueError('Provide either ids or filter.')
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise ValueError('ids must be a non-empty list.')
+        if len(ids) > BULK_MAX_IDS:
+            raise ValueError(f'At most {BULK_MAX_IDS} ids per request; use a filter for more.')
+        try:
+            ids = [int(transaction_id) for transaction_id in ids]
+        except (TypeError, ValueError):
+            raise ValueError('ids must be integers.')
+        return [Transaction.user_id == user_id, Transaction.id.in_(ids)]
+    if not isinstance(row_filter, dict) or not row_filter:
+        # An empty filter matches everything; make that explicit rather than a typo away
+        raise ValueError('filter must include at least one condition; use {"period": "all"} for every transaction.')
+    return parse_transaction_filters({key: str(value) for key, value in row_filter.items() if value is not None},
+                                     user_id)
+
+def parse_bulk_category(value, user_id, transaction_type=None):
+    # None/'' = uncategorized; otherwise the user's category (of the given type, if any)
+    if value in (None, '', 'none'):
+        return None
+    try:
+        category_id = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('category_id must be an integer or null.')
+    category = next((c for c in get_user_categories(user_id) if c['id'] == category_id), None)
+    if category is None:
+        raise ValueError('Category not found.')
+    if transaction_type and category['type'] != transaction_type:
+        raise ValueError(f'Category {category["name"]!r} is not an {transaction_type} category.')
+    return category
+
+def bulk_edit_transactions(user_id, payload):
+    # Applies one action to every targeted row with a single UPDATE or DELETE, and keeps the
+    # aggregates in step from per-(day, type, category, currency) sums returned by the same statement.
+    # Returns (rows affected, over-budget periods as from apply_transaction_deltas).
+    # Raises ValueError with a user-facing message on bad input.
+    action = payload.get('action')
+    if action not in BULK_ACTIONS:
+        raise ValueError(f'action must be one of: {", ".join(BULK_ACTIONS)}.')
+    filters = parse_bulk_scope(payload, user_id)
+
+    if action == 'recategorize':
+        category = parse_bulk_category(payload.get('category_id'), user_id)
+        if category is None:
+            values = {'category_id': None}
+        else:
+            # Categories are typed; rows of the other type are left alone
+            values = {'category_id': category['id']}
+            filters.append(Transaction.type == category['type'])
+    elif action == 'retype':
+        transaction_type = payload.get('type')
+        if transaction_type not in ('income', 'expense'):
+            raise ValueError('type must be income or expense.')
+        category = parse_bulk_category(payload.get('category_id'), user_id, transaction_type)
+        # The old category belongs to the old type, so rows move to the given category or none
+        values = {'type': transaction_type, 'category_id': category['id'] if category else None}
+        filters.append(Transaction.type != transaction_type)
+    elif action == 'shift_date':
+        try:
+            days = int(payload.get('days'))
+        except (TypeError, ValueError):
+            raise ValueError('days must be an integer.')
+        if not days or abs(days) > BULK_MAX_SHIFT_DAYS:
+            raise ValueError(f'days must be non-zero and at most {BULK_MAX_SHIFT_DAYS} either way.')
+        values = {'date': Transaction.date + timedelta(days=days)}
+
+    columns = (Transaction.id, Transaction.date, Transaction.type, Transaction.category_id, Transaction.currency,
+               Transaction.amount)
+    if action == 'delete':
+        changed = db.delete(Transaction).where(*filters).returning(*columns).cte('changed')
+        sides = [(-1, changed)]
+    else:
+        changed = db.update(Transaction).where(*filters).values(**values).returning(*columns).cte('changed')
+        # Every part of the statement sees the same snapshot, so this reads the rows as they
+        # were before the UPDATE above
+        before = db.select(*columns).join(changed, changed.c.id == Transaction.id).subquery('before')
+        sides = [(-1, before), (1, changed)]
+
+    grouped = db.union_all(*[
+        db.select(db.literal(sign).label('sign'), local_date(rows.c.date).label('day'), rows.c.type,
+                  rows.c.category_id, rows.c.currency, db.func.sum(rows.c.amount).label('amount'),
+                  db.func.count().label('count'))
+        .group_by(local_date(rows.c.date), rows.c.type, rows.c.category_id, rows.c.currency)
+        for sign, rows in sides
+    ])
+    groups = db.session.execute(grouped).all()
+
+    over_budget = apply_transaction_deltas([
+        {'user_id': user_id, 'type': group.type, 'category_id': group.category_id, 'currency': group.currency,
+         'date': group.day, 'amount': group.amount * group.sign, 'count': group.count * group.sign}
+        for group in groups
+    ])
+    affected = sum(group.count for group in groups if group.sign == sides[-1][0])
+    return affected, over_budget
+
 # --- Routes ---
 
 @app.route('/')
@@ -122,10 +1450,17 @@ def register():
             flash('Username already exists. Please choose a different one.', 'danger')
             return redirect(url_for('register'))
 
-        hashed_password = generate_password_hash(password)
-        new_user = User(username=username, password_hash=hashed_password, created_at=datetime.now())
+        try:
+            hashed_password = password_hasher.hash(password)
+        except PasswordHashBusy:
+            return password_hash_busy_response('register.html')
+        new_user = User(username=username, password_hash=hashed_password, created_at=periods.now())
         db.session.add(new_user)
         try:
+            db.session.flush() # Assigns new_user.id
+            # A brand-new user has no history, so their running totals start at zero
+            db.session.add(UserBalance(user_id=new_user.id, currency=DEFAULT_CURRENCY,
+                                       total_income=0, total_expense=0, transaction_count=0))
             db.session.commit()
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
@@ -141,14 +1476,38 @@ def login():
         username = request.form['username']
         password = request.form['password']
 
-        user = User.query.filter_by(username=username).first()
+        keys = login_throttle_keys(username)
+        retry_after = login_lockout(keys)
+        if retry_after:
+            return throttled_login_response(retry_after)
+
+        user = db.session.execute(
+            db.select(User.id, User.username, User.password_hash).filter_by(username=username)
+        ).first()
+        db.session.commit() # Give the connection back to the pool while the password is hashed
 
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = user is not None and password_hasher.verify(user.password_hash, password)
+        except PasswordHashBusy:
+            return password_hash_busy_response('login.html')
+
+        if valid:
+            if password_hasher.needs_rehash(user.password_hash):
+                # PASSWORD_HASH_METHOD changed since this hash was made; upgrade it while we have the password
+                try:
+                    db.session.execute(db.update(User).where(User.id == user.id)
+                                       .values(password_hash=password_hasher.hash(password)))
+                except PasswordHashBusy:
+                    pass # Upgraded on a later sign-in instead
+            clear_login_failures(keys)
+            db.session.commit()
             session['user_id'] = user.id
             session['username'] = user.username # Store username in session
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
+            record_login_failure(keys)
+            db.session.commit()
             flash('Invalid username or password.', 'danger')
             return redirect(url_for('login'))
     return render_template('login.html')
@@ -165,17 +1524,13 @@ def logout():
 @login_required
 def dashboard():
     user_id = session['user_id']
-    
-    # Calculate total income and expenses for all time
-    total_income = db.session.query(db.func.sum(Transaction.amount))\
-        .filter(Transaction.user_id == user_id, Transaction.type == 'income')\
-        .scalar() or 0
 
-    total_expense = db.session.query(db.func.sum(Transaction.amount))\
-        .filter(Transaction.user_id == user_id, Transaction.type == 'expense')\
-        .scalar() or 0
+    # All-time totals come from the materialized balance row (a primary-key lookup)
+    balance = get_user_balance(user_id)
 
-    return render_template('dashboard.html', total_income=float(total_income), total_expense=float(total_expense))
+    # Over-limit flags are stored with the usage rows, so this is a plain join, not an aggregate
+    return render_template('dashboard.html', total_income=float(balance.total_income), total_expense=float(balance.total_expense),
+                           budgets=get_budget_status(user_id))
 
 
 @app.route('/add_transaction', methods=['POST'])
@@ -190,11 +1545,17 @@ def add_transaction():
 
     # Convert date string to datetime object
     try:
-        transaction_date = datetime.strptime(date_str, '%Y-%m-%d')
+        transaction_date = periods.localize(datetime.strptime(date_str, '%Y-%m-%d'))
     except ValueError:
         flash('Invalid date format. Please use YYYY-MM-DD.', 'danger')
         return redirect(url_for('income') if transaction_type == 'income' else url_for('expense'))
 
+    try:
+        currency = parse_currency(request.form.get('currency'), current_base_currency())
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('income') if transaction_type == 'income' else url_for('expense'))
+
     # Ensure category_id is None if empty string (for nullable foreign key)
     if not category_id:
         category_id = None
@@ -206,14 +1567,17 @@ def add_transaction():
         category_id=category_id,
         type=transaction_type,
         amount=amount,
+        currency=currency,
         description=description,
         date=transaction_date,
-        created_at=datetime.now()
+        created_at=periods.now()
     )
     db.session.add(new_transaction)
     try:
+        over_budget = apply_transaction_deltas([transaction_delta(new_transaction)])
         db.session.commit()
         flash(f'{transaction_type.capitalize()} added successfully!', 'success')
+        flash_budget_alerts(over_budget)
     except Exception as e:
         db.session.rollback()
         flash(f'An error occurred: {e}', 'danger')
@@ -225,60 +1589,197 @@ def add_transaction():
 @login_required
 def income():
     user_id = session['user_id']
-    income_categories = Category.query.filter_by(user_id=user_id, type='income').all()
-    # Fetch all categories to pass to JS for dropdown (can be filtered by type on frontend)
-    all_categories = Category.query.filter_by(user_id=user_id).all()
-    return render_template('income.html', categories=income_categories, all_categories=[c.to_dict() for c in all_categories])
+    # One (cached) category list serves both the form dropdown and the JS
+    all_categories = get_user_categories(user_id)
+    income_categories = [c for c in all_categories if c['type'] == 'income']
+    return render_template('income.html', categories=income_categories, all_categories=all_categories,
+                           currencies=list(get_exchange_rates()))
 
 @app.route('/expense')
 @login_required
 def expense():
     user_id = session['user_id']
-    expense_categories = Category.query.filter_by(user_id=user_id, type='expense').all()
-    # Fetch all categories to pass to JS for dropdown (can be filtered by type on frontend)
-    all_categories = Category.query.filter_by(user_id=user_id).all()
-    return render_template('expense.html', categories=expense_categories, all_categories=[c.to_dict() for c in all_categories])
+    # One (cached) category list serves both the form dropdown and the JS
+    all_categories = get_user_categories(user_id)
+    expense_categories = [c for c in all_categories if c['type'] == 'expense']
+    return render_template('expense.html', categories=expense_categories, all_categories=all_categories,
+                           currencies=list(get_exchange_rates()))
 
 
 @app.route('/history')
 @login_required
 def history():
     user_id = session['user_id']
-    
-    # Fetch all transactions and categories for the logged-in user
-    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.date.desc(), Transaction.created_at.desc()).all()
-    categories = Category.query.filter_by(user_id=user_id).all()
-
-    # Create a dictionary for quick category lookup by ID
-    category_map = {c.id: c for c in categories}
-
-    # Prepare transactions data for the template, including category name and color
-    transactions_for_template = []
-    for t in transactions:
-        category_name = None
-        category_color = None
-        if t.category_id and t.category_id in category_map:
-            category_name = category_map[t.category_id].name
-            category_color = category_map[t.category_id].color
-        transactions_for_template.append({
-            'id': t.id,
-            'user_id': t.user_id,
-            'category_id': t.category_id,
-            'category_name': category_name,
-            'category_color': category_color,
-            'type': t.type,
-            'amount': float(t.amount), # Convert Decimal to float for JSON/template
-            'description': t.description,
-            'date': t.date.isoformat(), # Convert datetime to ISO string for JS
-            'created_at': t.created_at.isoformat()
-        })
-    
-    # Pass all categories to the template for the edit modal dropdown (to be used by JS)
-    all_categories = Category.query.filter_by(user_id=user_id).all()
-    all_categories_for_js = [{'id': c.id, 'name': c.name, 'type': c.type, 'color': c.color} for c in all_categories]
 
+    # Transactions are loaded page by page from /get_transactions_page by the template,
+    # so only the categories (for the filter and edit modal dropdowns) are needed here.
+    return render_template('history.html', all_categories=get_user_categories(user_id),
+                           currencies=list(get_exchange_rates()))
+
+
+def fetch_transactions_page(args, user_id):
+    # One keyset page of (Transaction, category name, category color) rows matching the
+    # query-string filters, plus the cursor for the next page. Raises ValueError on bad input.
+    filters = parse_transaction_filters(args, user_id)
+    try:
+        limit = int(args.get('limit', TRANSACTIONS_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer.')
+    if limit < 1:
+        raise ValueError('limit must be at least 1.')
+    limit = min(limit, TRANSACTIONS_PAGE_SIZE_MAX)
+    if (args.get('q') or '').strip():
+        # PostgreSQL has no statistics for rare words (it assumes 0.5% of rows match), so for
+        # them it would walk the date index past every one of the user's rows. Probe the search
+        # index first: when the matches are few, sort just those ids; when they are many, the
+        # date-ordered walk finds a page quickly anyway.
+        match_ids = db.session.query(Transaction.id).filter(*filters).limit(SEARCH_CANDIDATE_LIMIT + 1).all()
+        if len(match_ids) <= SEARCH_CANDIDATE_LIMIT:
+            filters = [Transaction.id.in_([transaction_id for transaction_id, in match_ids])]
+    cursor = args.get('cursor')
+    if cursor:
+        # Rows strictly "after" the cursor in (date desc, created_at desc, id desc) order
+        filters.append(tuple_(Transaction.date, Transaction.created_at, Transaction.id) <
+                       tuple_(*decode_transactions_cursor(cursor)))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = db.session.query(Transaction, Category.name, Category.color)\
+        .outerjoin(Category, Transaction.category_id == Category.id)\
+        .filter(*filters)\
+        .order_by(Transaction.date.desc(), Transaction.created_at.desc(), Transaction.id.desc())\
+        .limit(limit + 1)\
+        .all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_transactions_cursor(rows[-1][0]) if has_more else None
+    return rows, next_cursor
+
+
+@app.route('/get_transactions_page')
+@login_required
+def get_transactions_page():
+    user_id = session['user_id']
+
+    try:
+        rows, next_cursor = fetch_transactions_page(request.args, user_id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(transactions=[transaction_to_dict(t, name, color) for t, name, color in rows],
+                   nextCursor=next_cursor)
+
+
+@app.route('/search_transactions')
+@login_required
+def search_transactions():
+    # Same filters and paging as /get_transactions_page, but `q` is required and each result
+    # carries description_highlight: the escaped description with matches wrapped in <mark>
+    user_id = session['user_id']
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify(error='q is required.'), 400
+
+    try:
+        rows, next_cursor = fetch_transactions_page(request.args, user_id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    transactions = []
+    for t, name, color in rows:
+        transaction = transaction_to_dict(t, name, color)
+        transaction['description_highlight'] = str(highlight_search_matches(t.description, q))
+        transactions.append(transaction)
+    return jsonify(transactions=transactions, nextCursor=next_cursor)
+
+
+# Rows fetched per round trip from the server-side cursor, and emitted per response chunk
+EXPORT_BATCH_SIZE = 1000
+
+# Same leading columns as the CSV importer expects, so an export can be re-imported
+EXPORT_COLUMNS = ('date', 'amount', 'type', 'category', 'description', 'currency', 'id', 'created_at')
+
+@app.route('/export_transactions')
+@login_required
+def export_transactions():
+    user_id = session['user_id']
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify(error='format must be csv or ndjson.'), 400
+    try:
+        filters = parse_transaction_filters(request.args, user_id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    # yield_per streams rows through a server-side cursor instead of loading the whole result
+    query = db.select(
+        Transaction.date, Transaction.amount, Transaction.type, Category.name,
+        Transaction.description, Transaction.currency, Transaction.id, Transaction.created_at
+    ).outerjoin(Category, Transaction.category_id == Category.id)\
+    .where(*filters)\
+    .order_by(Transaction.date.desc(), Transaction.created_at.desc(), Transaction.id.desc())\
+    .execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def export_row(row):
+        return {
+            'date': periods.local_day(row.date).isoformat(),
+            'amount': str(row.amount),
+            'type': row.type,
+            'category': row.name or '',
+            'description': row.description or '',
+            'currency': row.currency,
+            'id': row.id,
+            'created_at': row.created_at.isoformat(),
+        }
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue() # Header goes out before the query runs
+        for batch in db.session.execute(query).partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            for row in batch:
+                values = export_row(row)
+                writer.writerow([values[column] for column in EXPORT_COLUMNS])
+            yield buffer.getvalue()
+
+    def generate_ndjson():
+        yield '' # Send headers right away
+        for batch in db.session.execute(query).partitions():
+            yield ''.join(json.dumps(export_row(row)) + '\n' for row in batch)
+
+    if export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    filename = f'transactions-{periods.today().strftime("%Y%m%d")}.{export_format}'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
-    return render_template('history.html', transactions=transactions_for_template, all_categories=all_categories_for_js)
+
+@app.route('/import_transactions', methods=['POST'])
+@login_required
+def import_transactions():
+    user_id = session['user_id']
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify(error='Please choose a file to import.'), 400
+
+    try:
+        fmt = detect_format(upload.filename, request.form.get('format'))
+        imported, error_count, errors = import_transaction_rows(user_id, upload.stream, fmt)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(error=f'An error occurred: {e}'), 500
+
+    return jsonify(imported=imported, errorCount=error_count, errors=errors)
 
 
 @app.route('/edit_transaction/<int:transaction_id>', methods=['POST'])
@@ -291,6 +1792,8 @@ def edit_transaction(transaction_id):
         flash('Transaction not found or you do not have permission to edit it.', 'danger')
         return redirect(url_for('history'))
 
+    old_delta = transaction_delta(transaction, sign=-1)
+
     transaction.category_id = request.form.get('category_id')
     # Ensure category_id is None if empty string (for nullable foreign key)
     if not transaction.category_id:
@@ -298,14 +1801,22 @@ def edit_transaction(transaction_id):
     else:
         transaction.category_id = int(transaction.category_id) # Convert to int
 
+    try:
+        transaction.currency = parse_currency(request.form.get('currency'), transaction.currency)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('history'))
+
     transaction.amount = float(request.form['amount'])
     transaction.description = request.form['description']
-    transaction.date = datetime.strptime(request.form['date'], '%Y-%m-%d')
+    transaction.date = periods.localize(datetime.strptime(request.form['date'], '%Y-%m-%d'))
     transaction.type = request.form['type'] # Update type as well if allowed by the form
 
     try:
+        over_budget = apply_transaction_deltas([old_delta, transaction_delta(transaction)])
         db.session.commit()
         flash('Transaction updated successfully!', 'success')
+        flash_budget_alerts(over_budget)
     except Exception as e:
         db.session.rollback()
         flash(f'An error occurred: {e}', 'danger')
@@ -323,8 +1834,10 @@ def delete_transaction(transaction_id):
         flash('Transaction not found or you do not have permission to delete it.', 'danger')
         return redirect(url_for('history'))
 
+    old_delta = transaction_delta(transaction, sign=-1)
     db.session.delete(transaction)
     try:
+        apply_transaction_deltas([old_delta])
         db.session.commit()
         flash('Transaction deleted successfully!', 'success')
     except Exception as e:
@@ -333,12 +1846,40 @@ def delete_transaction(transaction_id):
     
     return redirect(url_for('history'))
 
+@app.route('/bulk_transactions', methods=['POST'])
+@login_required
+def bulk_transactions():
+    # JSON API for editing many transactions at once, e.g.
+    #   {"action": "recategorize", "ids": [1, 2, 3], "category_id": 7}
+    #   {"action": "delete", "filter": {"category_id": "none", "end_date": "2023-12-31"}}
+    # Actions: recategorize (category_id, null = uncategorized), retype (type, optional category_id),
+    # shift_date (days, may be negative) and delete. Returns the number of rows affected.
+    user_id = session['user_id']
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error='Expected a JSON object.'), 400
+
+    try:
+        affected, over_budget = bulk_edit_transactions(user_id, payload)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    except IntegrityError:
+        # e.g. shifting a recurring transaction onto a date its schedule already has
+        db.session.rollback()
+        return jsonify(error='The change conflicts with existing transactions.'), 409
+
+    return jsonify(action=payload['action'], affected=affected,
+                   overBudget=[{'budgetId': budget_id, 'periodStart': period_start.isoformat(), 'spent': float(spent)}
+                               for budget_id, period_start, spent in over_budget])
+
+
 @app.route('/categories')
 @login_required
 def categories():
     user_id = session['user_id']
-    all_categories = Category.query.filter_by(user_id=user_id).order_by(Category.name).all()
-    return render_template('categories.html', categories=all_categories)
+    return render_template('categories.html', categories=get_user_categories(user_id))
 
 @app.route('/add_category', methods=['POST'])
 @login_required
@@ -354,10 +1895,12 @@ def add_category():
         flash(f'A {category_type} category with the name "{name}" already exists.', 'danger')
         return redirect(url_for('categories'))
 
-    new_category = Category(user_id=user_id, name=name, type=category_type, color=color, created_at=datetime.now())
+    new_category = Category(user_id=user_id, name=name, type=category_type, color=color, created_at=periods.now())
     db.session.add(new_category)
     try:
+        bump_data_version([user_id])
         db.session.commit()
+        invalidate_user_categories(user_id)
         flash(f'Category "{name}" added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -396,7 +1939,9 @@ def edit_category(category_id):
     category.color = color
 
     try:
+        bump_data_version([user_id])
         db.session.commit()
+        invalidate_user_categories(user_id)
         flash('Category updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -414,13 +1959,17 @@ def delete_category(category_id):
         flash('Category not found or you do not have permission to delete it.', 'danger')
         return redirect(url_for('categories'))
 
-    # If ON DELETE SET NULL is configured for transactions.category_id,
-    # associated transactions will automatically have their category_id set to NULL.
-    # No manual update here is needed if FK is set up correctly.
-
-    db.session.delete(category)
+    # ON DELETE SET NULL on transactions.category_id makes the category's transactions
+    # Uncategorized in the database. A Core delete (rather than db.session.delete) keeps the ORM
+    # from loading every one of those transactions first just to null their category_id.
+    # The rollups have no FK, so move this category's buckets to "uncategorized" ourselves.
+    # To keep the transactions categorized, merge the category into another one instead.
     try:
+        db.session.execute(db.delete(Category).where(Category.id == category_id, Category.user_id == user_id))
+        move_rollup_category(user_id, category_id, None)
+        bump_data_version([user_id])
         db.session.commit()
+        invalidate_user_categories(user_id)
         flash('Category deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -428,6 +1977,219 @@ def delete_category(category_id):
     
     return redirect(url_for('categories'))
 
+@app.route('/merge_category/<int:category_id>', methods=['POST'])
+@login_required
+def merge_category(category_id):
+    user_id = session['user_id']
+    categories = {c['id']: c for c in get_user_categories(user_id)}
+    source = categories.get(category_id)
+    target = categories.get(request.form.get('target_category_id', type=int))
+
+    if not source:
+        flash('Category not found or you do not have permission to merge it.', 'danger')
+        return redirect(url_for('categories'))
+    if not target or target['id'] == source['id'] or target['type'] != source['type']:
+        flash(f'Choose another {source["type"]} category to merge "{source["name"]}" into.', 'danger')
+        return redirect(url_for('categories'))
+
+    try:
+        moved = merge_category_into(user_id, source['id'], target['id'])
+        db.session.commit()
+        invalidate_user_categories(user_id)
+        flash(f'Merged "{source["name"]}" into "{target["name"]}" ({moved} transaction(s) moved).', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred: {e}', 'danger')
+
+    return redirect(url_for('categories'))
+
+@app.route('/budgets')
+@login_required
+def budgets():
+    user_id = session['user_id']
+    get_user_balance(user_id) # Makes sure the aggregates budgets are computed from exist
+    expense_categories = [c for c in get_user_categories(user_id) if c['type'] == 'expense']
+    return render_template('budgets.html', budgets=get_budget_status(user_id), categories=expense_categories)
+
+@app.route('/add_budget', methods=['POST'])
+@login_required
+def add_budget():
+    user_id = session['user_id']
+    try:
+        category_id, period, amount = parse_budget_form(request.form, user_id)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('budgets'))
+
+    if find_duplicate_budget(user_id, category_id, period):
+        flash(f'You already have a {period}ly budget for that category.', 'danger')
+        return redirect(url_for('budgets'))
+
+    new_budget = Budget(user_id=user_id, category_id=category_id, period=period, amount=amount, created_at=periods.now())
+    db.session.add(new_budget)
+    try:
+        db.session.flush()
+        # Spending before the budget existed counts too; computed once from the rollups
+        rebuild_budget_usage(budget_ids=[new_budget.id])
+        bump_data_version([user_id])
+        db.session.commit()
+        flash('Budget added successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred: {e}', 'danger')
+
+    return redirect(url_for('budgets'))
+
+@app.route('/edit_budget/<int:budget_id>', methods=['POST'])
+@login_required
+def edit_budget(budget_id):
+    user_id = session['user_id']
+    budget = Budget.query.filter_by(id=budget_id, user_id=user_id).first()
+
+    if not budget:
+        flash('Budget not found or you do not have permission to edit it.', 'danger')
+        return redirect(url_for('budgets'))
+
+    try:
+        category_id, period, amount = parse_budget_form(request.form, user_id)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('budgets'))
+
+    if find_duplicate_budget(user_id, category_id, period, exclude_id=budget_id):
+        flash(f'You already have a {period}ly budget for that category.', 'danger')
+        return redirect(url_for('budgets'))
+
+    budget.category_id = category_id
+    budget.period = period
+    budget.amount = amount
+
+    try:
+        db.session.flush()
+        rebuild_budget_usage(budget_ids=[budget_id]) # Period, scope or limit may have changed
+        bump_data_version([user_id])
+        db.session.commit()
+        flash('Budget updated successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred: {e}', 'danger')
+
+    return redirect(url_for('budgets'))
+
+@app.route('/delete_budget/<int:budget_id>', methods=['POST'])
+@login_required
+def delete_budget(budget_id):
+    user_id = session['user_id']
+    budget = Budget.query.filter_by(id=budget_id, user_id=user_id).first()
+
+    if not budget:
+        flash('Budget not found or you do not have permission to delete it.', 'danger')
+        return redirect(url_for('budgets'))
+
+    db.session.delete(budget) # budget_usage rows cascade
+    try:
+        bump_data_version([user_id])
+        db.session.commit()
+        flash('Budget deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred: {e}', 'danger')
+
+    return redirect(url_for('budgets'))
+
+@app.route('/recurring')
+@login_required
+def recurring():
+    user_id = session['user_id']
+    schedules = db.session.query(RecurringTransaction, Category.name)\
+        .outerjoin(Category, RecurringTransaction.category_id == Category.id)\
+        .filter(RecurringTransaction.user_id == user_id)\
+        .order_by(RecurringTransaction.next_date, RecurringTransaction.id)\
+        .all()
+    return render_template('recurring.html', schedules=schedules, all_categories=get_user_categories(user_id),
+                           frequencies=FREQUENCIES, today=periods.today().isoformat(),
+                           currencies=list(get_exchange_rates()))
+
+@app.route('/add_recurring', methods=['POST'])
+@login_required
+def add_recurring():
+    user_id = session['user_id']
+    transaction_type = request.form['type']
+    category_id = request.form.get('category_id') or None
+    frequency = request.form['frequency']
+    description = request.form.get('description', '').strip() or None
+
+    try:
+        amount = Decimal(request.form['amount']).quantize(Decimal('0.01'))
+        interval = int(request.form.get('interval') or 1)
+        start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date() if request.form.get('end_date') else None
+    except (InvalidOperation, ValueError):
+        flash('Invalid amount, interval or date. Please use YYYY-MM-DD for dates.', 'danger')
+        return redirect(url_for('recurring'))
+
+    try:
+        currency = parse_currency(request.form.get('currency'), current_base_currency())
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('recurring'))
+
+    if category_id is not None:
+        category_id = int(category_id)
+        if not any(c['id'] == category_id and c['type'] == transaction_type for c in get_user_categories(user_id)):
+            flash('Please pick one of your categories of the same type.', 'danger')
+            return redirect(url_for('recurring'))
+    if transaction_type not in ('income', 'expense') or frequency not in FREQUENCIES:
+        flash('Invalid type or frequency.', 'danger')
+        return redirect(url_for('recurring'))
+    if amount <= 0 or interval < 1 or (end_date and end_date < start_date):
+        flash('Amount and interval must be positive, and the end date can\'t be before the start date.', 'danger')
+        return redirect(url_for('recurring'))
+
+    schedule = RecurringTransaction(
+        user_id=user_id, category_id=category_id, type=transaction_type, amount=amount, currency=currency,
+        description=description, frequency=frequency, interval=interval,
+        start_date=start_date, end_date=end_date, next_date=start_date, created_at=periods.now()
+    )
+    db.session.add(schedule)
+    try:
+        db.session.commit()
+        # Occurrences up to today (e.g. a start date in the past) are written right away
+        created, _ = materialize_recurring(rule_ids=[schedule.id])
+        flash(f'Recurring {transaction_type} added successfully! {created} transaction(s) recorded so far.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred: {e}', 'danger')
+
+    return redirect(url_for('recurring'))
+
+@app.route('/delete_recurring/<int:recurring_id>', methods=['POST'])
+@login_required
+def delete_recurring(recurring_id):
+    user_id = session['user_id']
+    schedule = RecurringTransaction.query.filter_by(id=recurring_id, user_id=user_id).first()
+
+    if not schedule:
+        flash('Recurring transaction not found or you do not have permission to delete it.', 'danger')
+        return redirect(url_for('recurring'))
+
+    # Transactions it already wrote stay (their recurring_id is set to NULL by the FK)
+    db.session.delete(schedule)
+    try:
+        db.session.commit()
+        flash('Recurring transaction stopped. Past transactions were kept.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred: {e}', 'danger')
+
+    return redirect(url_for('recurring'))
+
+@app.route('/get_budget_status')
+@login_required
+@cached_json_response
+def get_budget_status_data():
+    return jsonify(budgets=get_budget_status(session['user_id']))
+
 @app.route('/account')
 @login_required
 def account():
@@ -438,26 +2200,51 @@ def account():
         flash('User not found.', 'danger')
         return redirect(url_for('login'))
 
-    # Calculate total income and expenses for all time for the user
-    all_time_income = db.session.query(db.func.sum(Transaction.amount))\
-        .filter(Transaction.user_id == user_id, Transaction.type == 'income')\
-        .scalar() or 0.0
-
-    all_expense = db.session.query(db.func.sum(Transaction.amount))\
-        .filter(Transaction.user_id == user_id, Transaction.type == 'expense')\
-        .scalar() or 0.0
-
-    # Get number of transactions
-    total_transactions = Transaction.query.filter_by(user_id=user_id).count()
+    # All-time totals and transaction count come from the materialized balance row
+    balance = get_user_balance(user_id)
 
     # Get user creation date
     member_since = user.created_at
 
     return render_template('account.html',
-                           total_income=float(all_time_income),
-                           total_expense=float(all_expense),
-                           total_transactions=total_transactions,
-                           member_since=member_since)
+                           total_income=float(balance.total_income),
+                           total_expense=float(balance.total_expense),
+                           total_transactions=balance.transaction_count,
+                           member_since=member_since,
+                           user_base_currency=user.base_currency,
+                           currencies=list(get_exchange_rates()))
+
+@app.route('/set_base_currency', methods=['POST'])
+@login_required
+def set_base_currency():
+    user_id = session['user_id']
+    user = db.session.get(User, user_id)
+    try:
+        currency = parse_currency(request.form.get('base_currency'), user.base_currency)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('account'))
+
+    if currency != user.base_currency:
+        # Budget limits are amounts in the base currency, so they're converted along with it
+        def rate(code):
+            return db.select(ExchangeRate.rate).where(ExchangeRate.currency == code).scalar_subquery()
+        db.session.execute(
+            db.update(Budget).where(Budget.user_id == user_id)
+            .values(amount=db.func.greatest(db.func.round(Budget.amount * rate(user.base_currency) / rate(currency), 2), 0.01))
+        )
+        user.base_currency = currency
+        try:
+            db.session.flush()
+            rebuild_budget_usage(user_ids=[user_id])
+            bump_data_version([user_id])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'An error occurred: {e}', 'danger')
+            return redirect(url_for('account'))
+    flash(f'Totals, charts and budgets are now shown in {currency}.', 'success')
+    return redirect(url_for('account'))
 
 @app.route('/about')
 def about():
@@ -467,77 +2254,98 @@ def about():
 def contact():
     return render_template('contact.html')
 
-@app.route('/get_transactions_data')
-@login_required
-def get_transactions_data():
-    user_id = session['user_id']
-    period = request.args.get('period', 'month')
-    data_type = request.args.get('dataType', 'expense') # 'expense' or 'income' or 'both'
-
-    end_date = datetime.now()
-    if period == 'today':
-        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'week':
-        start_date = end_date - timedelta(days=end_date.weekday()) # Monday of current week
-        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'month':
-        start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'year':
-        start_date = end_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    else: # 'all'
-        start_date = datetime.min # Or a very early date, e.g., datetime(2000, 1, 1)
-
-    # Base query filters
-    base_filters = [
-        Transaction.user_id == user_id,
-        Transaction.date >= start_date,
-        Transaction.date <= end_date
-    ]
-
-    if data_type != 'both': # Add type filter only if not 'both'
-        base_filters.append(Transaction.type == data_type)
-
-    # Group by category and sum amounts
-    results = db.session.query(
-        Category.name,
-        Category.color,
-        db.func.sum(Transaction.amount).label('total_amount')
-    ).outerjoin(Category, Transaction.category_id == Category.id)\
-    .filter(*base_filters)\
-    .group_by(Category.name, Category.color)\
-    .all()
-
-    # Handle uncategorized transactions separately
-    # This filter also needs to respect the data_type if not 'both'
-    uncategorized_query = db.session.query(
-        db.func.sum(Transaction.amount)
-    ).filter(
-        Transaction.user_id == user_id,
-        Transaction.date >= start_date,
-        Transaction.date <= end_date,
-        Transaction.category_id.is_(None) # Filter for NULL category_id
-    )
-    if data_type != 'both':
-        uncategorized_query = uncategorized_query.filter(Transaction.type == data_type)
-
-    uncategorized_sum = uncategorized_query.scalar() or 0.0
-
-
-    chart_data = []
+@app.route('/metrics')
+def metrics():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# --- Chart Helpers ---
+# Shared by the per-chart endpoints and the combined /get_dashboard_data endpoint.
+
+CHART_COLORS = {'expense': '#fc5723', 'income': '#28a745', 'both': '#6c757d'} # Neutral gray for 'both'
+UNCATEGORIZED_COLOR = '#CCCCCC' # Default gray for uncategorized
+
+def chart_source(user_id, window):
+    # Returns (source, filters) where source maps 'table', 'type', 'category_id', 'amount' (in the
+    # user's base currency) and 'bucket' to the columns to aggregate, with 'bucket' comparable to
+    # chart_buckets()' bucket column. Hourly buckets come from the raw transactions, which the
+    # daily rollups can't answer; every other window reads the rollups.
+    if window.unit == 'hour':
+        table, factor = to_base_currency(user_id, Transaction, Transaction.currency)
+        source = {
+            'table': table,
+            'type': Transaction.type,
+            'category_id': Transaction.category_id,
+            'amount': Transaction.amount * factor,
+            'bucket': db.func.date_trunc('hour', db.func.timezone(periods.APP_TIMEZONE_NAME, Transaction.date)),
+        }
+        filters = [
+            Transaction.user_id == user_id,
+            Transaction.date >= window.start,
+            Transaction.date < window.end
+        ]
+        return source, filters
+
+    get_user_balance(user_id) # Makes sure the user's rollups have been built
+    day = db.cast(DailyRollup.day, db.TIMESTAMP)
+    table, factor = to_base_currency(user_id, DailyRollup, DailyRollup.currency)
+    source = {
+        'table': table,
+        'type': DailyRollup.type,
+        'category_id': DailyRollup.category_id,
+        'amount': DailyRollup.total_amount * factor,
+        'bucket': DailyRollup.day if window.unit == 'day' else db.cast(db.func.date_trunc(window.unit, day), db.Date),
+    }
+    # Rollups are per (APP_TIMEZONE) day, so compare calendar days
+    filters = [DailyRollup.user_id == user_id, DailyRollup.day <= window.last_day]
+    if window.start is not None:
+        filters.append(DailyRollup.day >= window.first_day)
+    return source, filters
+
+def chart_buckets(user_id, window):
+    # Subquery (bucket, label) with one row per bucket of the window, from generate_series, so
+    # the charts' outer joins return empty buckets with no rows to sum instead of leaving gaps.
+    # Labels are formatted by to_char; see periods.bucket_label_format.
+    last = db.cast(window.last_bucket, db.TIMESTAMP)
+    if window.first_bucket is None: # 'all': from the year of the user's first rollup
+        first_day = db.select(db.func.min(DailyRollup.day)).where(DailyRollup.user_id == user_id).scalar_subquery()
+        first = db.func.coalesce(db.func.date_trunc('year', db.cast(first_day, db.TIMESTAMP)), last)
+    else:
+        first = db.cast(window.first_bucket, db.TIMESTAMP)
+    series = db.func.generate_series(first, last, db.literal_column(f"interval '1 {window.unit}'"))\
+        .table_valued('bucket').render_derived()
+    bucket = series.c.bucket if window.unit == 'hour' else db.cast(series.c.bucket, db.Date)
+    return db.select(
+        bucket.label('bucket'),
+        db.func.to_char(series.c.bucket, periods.bucket_label_format(window)).label('label')
+    ).select_from(series).subquery('buckets')
+
+def chart_window(args):
+    # Period selector or custom start_date/end_date range; raises ValueError
+    return periods.window_from_args(args)
+
+def build_category_chart(totals):
+    # totals: [(category name or None, color, amount), ...]; None = uncategorized
     labels = []
     amounts = []
     colors = []
 
-    for name, color, total_amount in results:
+    uncategorized_sum = 0.0
+    for name, color, total_amount in totals:
         if name:
             labels.append(name)
             amounts.append(float(total_amount))
             colors.append(color)
+        else:
+            uncategorized_sum += float(total_amount)
 
     if uncategorized_sum > 0:
         labels.append('Uncategorized')
-        amounts.append(float(uncategorized_sum))
-        colors.append('#CCCCCC') # Default gray for uncategorized
+        amounts.append(uncategorized_sum)
+        colors.append(UNCATEGORIZED_COLOR)
 
     # Prepare data for Chart.js
     chart_js_data = {
@@ -557,148 +2365,703 @@ def get_transactions_data():
             'color': colors[i],
             'value': amounts[i]
         })
-    
+
     # Sort legend data by value (descending)
     legend_data.sort(key=lambda x: x['value'], reverse=True)
 
+    return {'chartData': chart_js_data, 'legendData': legend_data}
 
-    return jsonify(chartData=chart_js_data, legendData=legend_data)
+def build_bar_chart(data_type, period, labels, amounts):
+    # For 'both' income and expense, if bar chart needs a unified color, you might pick a neutral one
+    # or handle it in the frontend. For now, if data_type is 'both', we'll just use a default color, as we can't easily assign
+    # income/expense specific colors to combined bars without more complex logic.
+    color = CHART_COLORS.get(data_type, CHART_COLORS['both'])
+    return {
+        'chartData': {
+            'labels': labels,
+            'datasets': [{
+                'label': f'{data_type.capitalize()} by {period}',
+                'data': amounts,
+                'backgroundColor': color,
+                'borderColor': color,
+                'borderWidth': 1
+            }]
+        }
+    }
+
+
+@app.route('/get_transactions_data')
+@login_required
+@cached_json_response
+def get_transactions_data():
+    user_id = session['user_id']
+    data_type = request.args.get('dataType', 'expense') # 'expense' or 'income' or 'both'
+
+    try:
+        window = chart_window(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    source, filters = chart_source(user_id, window)
+
+    if data_type != 'both': # Add type filter only if not 'both'
+        filters.append(source['type'] == data_type)
+
+    # Group by category and sum amounts. Uncategorized rows match no category,
+    # so they come back as a single row with a NULL name.
+    results = db.session.query(
+        Category.name,
+        Category.color,
+        db.func.sum(source['amount']).label('total_amount')
+    ).select_from(source['table'])\
+    .outerjoin(Category, source['category_id'] == Category.id)\
+    .filter(*filters)\
+    .group_by(Category.name, Category.color)\
+    .all()
+
+    return jsonify(**build_category_chart(results))
 
 
 @app.route('/get_transactions_bar_data')
 @login_required
+@cached_json_response
 def get_transactions_bar_data():
     user_id = session['user_id']
-    period = request.args.get('period', 'month')
     data_type = request.args.get('dataType', 'expense') # 'expense' or 'income' or 'both'
 
-    end_date = datetime.now()
-    if period == 'today':
-        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'week':
-        start_date = end_date - timedelta(days=end_date.weekday())
-        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'month':
-        start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'year':
-        start_date = end_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    else: # 'all'
-        start_date = datetime.min
-
-    # Base query filters
-    base_filters = [
-        Transaction.user_id == user_id,
-        Transaction.date >= start_date,
-        Transaction.date <= end_date
-    ]
+    try:
+        window = chart_window(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    source, filters = chart_source(user_id, window)
 
     if data_type != 'both': # Add type filter only if not 'both'
-        base_filters.append(Transaction.type == data_type)
+        filters.append(source['type'] == data_type)
+
+    # Every bucket comes back, in order; the filters sit in the join so empty buckets survive
+    buckets = chart_buckets(user_id, window)
+    rows = db.session.query(
+        buckets.c.label,
+        db.func.coalesce(db.func.sum(source['amount']), 0).label('total')
+    ).select_from(buckets)\
+    .outerjoin(source['table'], db.and_(source['bucket'] == buckets.c.bucket, *filters))\
+    .group_by(buckets.c.bucket, buckets.c.label)\
+    .order_by(buckets.c.bucket)\
+    .all()
 
+    return jsonify(**build_bar_chart(data_type, window.period, [row.label for row in rows],
+                                     [float(row.total) for row in rows]))
 
-    if period == 'today': # Group by hour
-        raw_data = db.session.query(
-            db.func.date_trunc('hour', Transaction.date).label('hour'),
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(*base_filters)\
-        .group_by(db.func.date_trunc('hour', Transaction.date))\
-        .order_by('hour')\
-        .all()
-        # Create a full list of hours for labels
-        full_labels = [datetime.now().replace(hour=h, minute=0, second=0, microsecond=0).strftime('%H:00') for h in range(24)]
-        data_map = {item.hour.strftime('%H:00'): float(item.total) for item in raw_data}
-        amounts = [data_map.get(label, 0) for label in full_labels]
-        labels = full_labels
-
-    elif period == 'week': # Group by day of week
-        raw_data = db.session.query(
-            db.func.date_trunc('day', Transaction.date).label('day'),
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(*base_filters)\
-        .group_by(db.func.date_trunc('day', Transaction.date))\
-        .order_by('day')\
-        .all()
-        # Create a full list of days for labels (Mon-Sun)
-        current_week_days = [(start_date + timedelta(days=i)).strftime('%a %d') for i in range(7)]
-        data_map = {item.day.strftime('%a %d'): float(item.total) for item in raw_data}
-        amounts = [data_map.get(label, 0) for label in current_week_days]
-        labels = current_week_days
-
-    elif period == 'month': # Group by day of month
-        raw_data = db.session.query(
-            db.func.date_trunc('day', Transaction.date).label('day'),
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(*base_filters)\
-        .group_by(db.func.date_trunc('day', Transaction.date))\
-        .order_by('day')\
-        .all()
-        # Create a full list of days for labels
-        num_days = (end_date - start_date).days + 1
-        full_labels = [(start_date + timedelta(days=i)).strftime('%d') for i in range(num_days)]
-        data_map = {item.day.strftime('%d'): float(item.total) for item in raw_data}
-        amounts = [data_map.get(label, 0) for label in full_labels]
-        labels = full_labels
-
-    elif period == 'year': # Group by month of year
-        raw_data = db.session.query(
-            db.func.date_trunc('month', Transaction.date).label('month'),
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(*base_filters)\
-        .group_by(db.func.date_trunc('month', Transaction.date))\
-        .order_by('month')\
-        .all()
-        # Create a full list of months for labels
-        full_labels = [datetime(end_date.year, m, 1).strftime('%b') for m in range(1, 13)]
-        data_map = {item.month.strftime('%b'): float(item.total) for item in raw_data}
-        amounts = [data_map.get(label, 0) for label in full_labels]
-        labels = full_labels
-
-    else: # 'all' - Group by year
-        raw_data = db.session.query(
-            db.func.date_trunc('year', Transaction.date).label('year'),
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(*base_filters)\
-        .group_by(db.func.date_trunc('year', Transaction.date))\
-        .order_by('year')\
-        .all()
-        labels = [str(int(item.year.year)) for item in raw_data] # Extract year as integer
-        amounts = [float(item.total) for item in raw_data]
 
-    # For 'both' income and expense, if bar chart needs a unified color, you might pick a neutral one
-    # or handle it in the frontend. For now, it will use the expense color by default, which can be adjusted.
-    # A more sophisticated approach for 'both' might involve two datasets or a different visualization.
-    # For now, if data_type is 'both', we'll just use a default color, as we can't easily assign
-    # income/expense specific colors to combined bars without more complex logic.
-    chart_js_data = {
-        'labels': labels,
-        'datasets': [{
-            'label': f'{data_type.capitalize()} by {period}',
-            'data': amounts,
-            'backgroundColor': '#fc5723' if data_type == 'expense' else ('#28a745' if data_type == 'income' else '#6c757d'), # Neutral gray for 'both'
-            'borderColor': '#fc5723' if data_type == 'expense' else ('#28a745' if data_type == 'income' else '#6c757d'),
-            'borderWidth': 1
-        }]
-    }
+@app.route('/get_dashboard_data')
+@login_required
+@cached_json_response
+def get_dashboard_data():
+    # Everything the dashboard/history charts need for one period (or start_date/end_date range),
+    # from a single grouped query: per requested dataType a category breakdown ('pie') and a
+    # time series ('bar'), plus income/expense totals for the period.
+    user_id = session['user_id']
+    data_types = [t for t in request.args.get('dataTypes', 'expense').split(',') if t in ('income', 'expense', 'both')]
+    if not data_types:
+        return jsonify(error='dataTypes must list income, expense and/or both.'), 400
 
-    return jsonify(chartData=chart_js_data)
+    try:
+        window = chart_window(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    source, filters = chart_source(user_id, window)
+
+    # One row per (bucket, type, category) in bucket order, plus a row with a NULL type for each
+    # empty bucket; both types are always fetched for the totals
+    buckets = chart_buckets(user_id, window)
+    categorized = db.outerjoin(source['table'], Category, source['category_id'] == Category.id)
+    rows = db.session.query(
+        buckets.c.bucket,
+        buckets.c.label,
+        source['type'].label('type'),
+        Category.name,
+        Category.color,
+        db.func.sum(source['amount']).label('total')
+    ).select_from(buckets)\
+    .outerjoin(categorized, db.and_(source['bucket'] == buckets.c.bucket, *filters))\
+    .group_by(buckets.c.bucket, buckets.c.label, source['type'], Category.name, Category.color)\
+    .order_by(buckets.c.bucket)\
+    .all()
 
-# Helper to convert category object to dict for JSON serialization
-# (Used in income/expense/history templates to pass categories to JS)
-def category_to_dict(self):
-    return {
-        'id': self.id,
-        'name': self.name,
-        'type': self.type,
-        'color': self.color
+    labels = []
+    bucket_index = {}
+    totals = {'income': Decimal(0), 'expense': Decimal(0)}
+    for row in rows:
+        if row.bucket not in bucket_index:
+            bucket_index[row.bucket] = len(labels)
+            labels.append(row.label)
+        if row.type:
+            totals[row.type] += row.total
+
+    by_type = {}
+    for data_type in data_types:
+        category_totals = {}
+        amounts = [0.0] * len(labels)
+        for row in rows:
+            if row.type is None or (data_type != 'both' and row.type != data_type):
+                continue
+            category_totals[(row.name, row.color)] = category_totals.get((row.name, row.color), 0) + row.total
+            amounts[bucket_index[row.bucket]] += float(row.total)
+
+        by_type[data_type] = {
+            'pie': build_category_chart([(name, color, total) for (name, color), total in category_totals.items()]),
+            'bar': build_bar_chart(data_type, window.period, labels, amounts),
+        }
+
+    return jsonify(period=window.period,
+                   totals={'income': float(totals['income']), 'expense': float(totals['expense'])},
+                   byType=by_type)
+
+
+# --- Spending Insights ---
+# The user's daily expense rollups as three parallel arrays in one row, amounts in the base
+# currency. Days are date.toordinal() values (0001-01-01 is 1); rows in different currencies for
+# the same (day, category) are summed by insights.DailySeries. One row of arrays converts to
+# NumPy far faster than thousands of row objects with Decimal and date columns.
+DAILY_EXPENSE_SERIES_SQL = sa_text('''
+    SELECT array_agg(r.day - DATE '0001-01-01' + 1) AS day_ordinals,
+           array_agg(r.category_id) AS category_ids,
+           array_agg(CAST(r.total_amount AS FLOAT8) * CAST(x.rate / base.rate AS FLOAT8)) AS amounts
+    FROM daily_rollups r
+    JOIN exchange_rates x ON x.currency = r.currency
+    CROSS JOIN (SELECT e.rate FROM exchange_rates e JOIN users u ON u.base_currency = e.currency
+                WHERE u.id = :user_id) AS base
+    WHERE r.user_id = :user_id AND r.type = 'expense'
+''')
+
+# The largest expense of each flagged (day, category), in the user's base currency
+UNUSUAL_DAY_TRANSACTIONS_SQL = sa_text('''
+    SELECT DISTINCT ON (f.day, f.category_id) f.day, f.category_id, t.id, t.date, t.description,
+           t.amount, t.currency, round(t.amount * x.rate / base.rate, 2) AS base_amount
+    FROM unnest(CAST(:days AS DATE[]), CAST(:category_ids AS BIGINT[])) AS f (day, category_id)
+    JOIN transactions t ON t.user_id = :user_id AND t.type = 'expense'
+        AND t.date >= timezone(:tz, CAST(f.day AS TIMESTAMP))
+        AND t.date < timezone(:tz, CAST(f.day + 1 AS TIMESTAMP))
+        AND coalesce(t.category_id, 0) = f.category_id
+    JOIN exchange_rates x ON x.currency = t.currency
+    CROSS JOIN (SELECT r.rate FROM exchange_rates r JOIN users u ON u.base_currency = r.currency
+                WHERE u.id = :user_id) AS base
+    ORDER BY f.day, f.category_id, t.amount * x.rate DESC, t.id
+''')
+
+@app.route('/get_spending_insights')
+@login_required
+@cached_json_response
+def get_spending_insights():
+    # Rolling averages, month-over-month change per category, an end-of-month forecast and
+    # unusual spending days, computed by insights.py from the user's daily expense series (one
+    # query over the rollups), plus one query for the transactions behind the unusual days.
+    # Cached per user until their next write, like the chart endpoints.
+    user_id = session['user_id']
+    try:
+        n_days = int(request.args.get('days', 90))
+    except ValueError:
+        return jsonify(error='days must be a whole number.'), 400
+    if not 7 <= n_days <= 366:
+        return jsonify(error='days must be between 7 and 366.'), 400
+
+    get_user_balance(user_id) # Makes sure the user's rollups have been built
+    row = db.session.execute(DAILY_EXPENSE_SERIES_SQL, {'user_id': user_id}).one()
+    series = insights.DailySeries(row.day_ordinals or [], row.category_ids or [], row.amounts or [],
+                                  periods.today()) # The arrays are NULL with no expenses at all
+
+    categories = {c['id']: c for c in get_user_categories(user_id)}
+    def category_fields(category_id):
+        category = categories.get(category_id)
+        if category is None: # 0 = uncategorized (or a category deleted since)
+            return {'categoryId': None, 'category': 'Uncategorized', 'color': UNCATEGORIZED_COLOR}
+        return {'categoryId': category_id, 'category': category['name'], 'color': category['color']}
+
+    month_over_month = []
+    for category_id, (this_month, same_days, last_month) in insights.month_over_month(series).items():
+        if this_month or last_month:
+            month_over_month.append({
+                **category_fields(category_id),
+                'thisMonth': this_month,
+                'lastMonthToDate': same_days,
+                'lastMonth': last_month,
+                'change': round((this_month - same_days) / same_days, 4) if same_days else None,
+            })
+    month_over_month.sort(key=lambda c: c['thisMonth'], reverse=True)
+
+    unusual = []
+    flagged = insights.unusual_days(series)
+    if flagged:
+        largest = {(r.day, r.category_id): r for r in db.session.execute(UNUSUAL_DAY_TRANSACTIONS_SQL, {
+            'days': [day for day, *_ in flagged], 'category_ids': [category_id for _, category_id, *_ in flagged],
+            'user_id': user_id, 'tz': periods.APP_TIMEZONE_NAME,
+        })}
+        for day, category_id, amount, mean, z_score in flagged:
+            t = largest.get((day, category_id))
+            unusual.append({
+                'date': day.isoformat(),
+                **category_fields(category_id),
+                'amount': amount,
+                'typicalAmount': mean,
+                'zScore': z_score,
+                'largestTransaction': t and {
+                    'id': t.id, 'date': t.date.isoformat(), 'description': t.description,
+                    'amount': float(t.amount), 'currency': t.currency, 'baseAmount': float(t.base_amount),
+                },
+            })
+
+    return jsonify(currency=current_base_currency(),
+                   daily=insights.rolling_averages(series, n_days),
+                   monthOverMonth=month_over_month,
+                   forecast=insights.month_forecast(series),
+                   unusualDays=unusual)
+
+
+# --- Statements ---
+# Monthly and yearly statements (summary, category breakdown and transaction list) are rendered
+# to HTML, CSV and (with fpdf2) PDF by `flask run-statements` worker processes, not in requests.
+# The statements table is the job queue (see migrations/0009_statements.sql): a request or
+# `flask queue-statements` queues a row, and a worker claims it with SKIP LOCKED, renders it and
+# stores the files in statement_files. A write to the user's data marks their ready statements
+# for a check; the worker re-renders only those whose period's data digest changed.
+STATEMENT_FORMATS = statements.available_formats()
+STATEMENT_LEASE_SECONDS = int(os.environ.get('STATEMENT_LEASE_SECONDS', 600)) # Before a stalled job is retried
+STATEMENT_MAX_ATTEMPTS = 5
+STATEMENT_RETRY_SECONDS = 60 # Doubles after each failed attempt
+STATEMENT_LIST_LIMIT = int(os.environ.get('STATEMENT_LIST_LIMIT', 2000)) # Transactions listed in HTML/PDF; the CSV has all
+STATEMENT_CSV_COLUMNS = ('date', 'amount', 'type', 'category', 'description', 'currency', 'base_amount', 'id')
+
+# Queues one period's statement for the selected users. An existing statement is re-queued only
+# if it failed, or if it is ready but the user's data changed since it was checked.
+STATEMENT_QUEUE_SQL = '''
+    INSERT INTO statements (user_id, period, period_start)
+    SELECT u.id, CAST(:period AS TEXT), CAST(:period_start AS DATE) FROM users u
+    WHERE {users}
+    ON CONFLICT (user_id, period, period_start) DO UPDATE
+    SET status = 'queued', run_after = now(), attempts = 0, error = NULL
+    WHERE statements.status = 'failed'
+       OR (statements.status = 'ready' AND statements.data_version IS DISTINCT FROM
+           (SELECT data_version FROM users WHERE id = statements.user_id))
+    RETURNING id
+'''
+STATEMENT_QUEUE_USERS_SQL = sa_text(STATEMENT_QUEUE_SQL.format(users='u.id = ANY(CAST(:user_ids AS BIGINT[]))'))
+# Month-end batch: every user with a transaction in the period
+STATEMENT_QUEUE_ACTIVE_SQL = sa_text(STATEMENT_QUEUE_SQL.format(users='''EXISTS (
+        SELECT 1 FROM transactions t WHERE t.user_id = u.id AND t.date >= :start AND t.date < :end)'''))
+
+# Takes the next due job (or one whose worker's claim expired) and claims it until the lease ends
+STATEMENT_CLAIM_SQL = sa_text('''
+    UPDATE statements s
+    SET status = 'running', attempts = s.attempts + 1, run_after = now() + make_interval(secs => :lease_seconds)
+    WHERE s.id = (SELECT id FROM statements
+                  WHERE status IN ('queued', 'running') AND run_after <= now()
+                  ORDER BY run_after, id LIMIT 1 FOR UPDATE SKIP LOCKED)
+    RETURNING s.id, s.user_id, s.period, s.period_start, s.source_digest, s.attempts
+''')
+
+# Digest of everything a statement shows for the period, computed in the database so an
+# unchanged period is detected without fetching its transactions
+STATEMENT_DIGEST_SQL = sa_text('''
+    SELECT md5(coalesce(string_agg(concat_ws('|', t.id, t.date, t.type, t.amount, t.currency, t.category_id,
+                                             c.name, t.description), E'\\n' ORDER BY t.id), ''))
+    FROM transactions t LEFT JOIN categories c ON c.id = t.category_id
+    WHERE t.user_id = :user_id AND t.date >= :start AND t.date < :end
+''')
+
+def statement_window(period, period_start):
+    # (first instant, first instant after) of a statement period in APP_TIMEZONE
+    return periods.day_start(period_start), periods.day_start(statements.period_end(period, period_start))
+
+def queue_statements(period, period_start, user_ids=None):
+    # Queues the statement of the given users, or of every user active in the period;
+    # returns the ids of the statements queued (not those already current or in progress)
+    if user_ids is not None:
+        query, params = STATEMENT_QUEUE_USERS_SQL, {'user_ids': list(user_ids)}
+    else:
+        start, end = statement_window(period, period_start)
+        query, params = STATEMENT_QUEUE_ACTIVE_SQL, {'start': start, 'end': end}
+    queued = db.session.execute(query, {'period': period, 'period_start': period_start, **params}).scalars().all()
+    db.session.commit()
+    return queued
+
+def generate_statement(job):
+    # Renders and stores a claimed statement's files, unless its period's data is unchanged since
+    # the last rendering. Returns True if the files were (re)written. The caller commits.
+    user = db.session.execute(db.select(User.username, User.data_version, User.base_currency)
+                              .where(User.id == job.user_id)).one()
+    start, end = statement_window(job.period, job.period_start)
+    source = db.session.execute(STATEMENT_DIGEST_SQL, {'user_id': job.user_id, 'start': start, 'end': end}).scalar()
+    digest = hashlib.sha1(f'{statements.LAYOUT_VERSION}:{",".join(STATEMENT_FORMATS)}:{user.username}:'
+                          f'{user.base_currency}:{source}'.encode()).hexdigest()
+    done = db.update(Statement).where(Statement.id == job.id)\
+        .values(status='ready', attempts=0, error=None, data_version=user.data_version)
+    if digest == job.source_digest:
+        db.session.execute(done)
+        return False
+
+    # Amounts are converted to the base currency at the rates current when the statement is rendered
+    table, factor = to_base_currency(job.user_id, Transaction, Transaction.currency)
+    filters = (Transaction.user_id == job.user_id, Transaction.date >= start, Transaction.date < end)
+    breakdown = db.session.query(
+        Transaction.type, Category.name, Category.color,
+        db.func.count().label('count'),
+        db.func.round(db.func.sum(Transaction.amount * factor), 2).label('amount')
+    ).select_from(table).outerjoin(Category, Transaction.category_id == Category.id)\
+    .filter(*filters)\
+    .group_by(Transaction.type, Category.name, Category.color)\
+    .all()
+    totals = {'income': Decimal(0), 'expense': Decimal(0)}
+    for row in breakdown:
+        totals[row.type] += row.amount
+    categories = [{
+        'type': row.type, 'name': row.name or 'Uncategorized', 'color': row.color or UNCATEGORIZED_COLOR,
+        'count': row.count, 'amount': row.amount,
+        'share': float(row.amount / totals[row.type]) if totals[row.type] else 0.0,
+    } for row in sorted(breakdown, key=lambda r: (r.type != 'income', -r.amount))]
+
+    # The CSV gets every transaction, written as rows stream in; HTML and PDF list the first ones
+    rows = db.select(
+        Transaction.id, Transaction.date, Transaction.type, Transaction.amount, Transaction.currency,
+        Transaction.description, Category.name, db.func.round(Transaction.amount * factor, 2).label('base_amount')
+    ).select_from(table).outerjoin(Category, Transaction.category_id == Category.id)\
+    .where(*filters)\
+    .order_by(Transaction.date, Transaction.id)\
+    .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(STATEMENT_CSV_COLUMNS)
+    listed = []
+    for batch in db.session.execute(rows).partitions():
+        for row in batch:
+            values = {
+                'date': periods.local_day(row.date).isoformat(),
+                'amount': row.amount,
+                'type': row.type,
+                'category': row.name or 'Uncategorized',
+                'description': row.description or '',
+                'currency': row.currency,
+                'base_amount': row.base_amount,
+                'id': row.id,
+            }
+            writer.writerow([values[column] for column in STATEMENT_CSV_COLUMNS])
+            if len(listed) < STATEMENT_LIST_LIMIT:
+                listed.append(values)
+
+    statement = {
+        'username': user.username,
+        'label': statements.period_label(job.period, job.period_start),
+        'first_day': job.period_start,
+        'last_day': statements.period_end(job.period, job.period_start) - timedelta(days=1),
+        'currency': user.base_currency,
+        'generated_at': periods.now(),
+        'income': totals['income'],
+        'expense': totals['expense'],
+        'net': totals['income'] - totals['expense'],
+        'transaction_count': sum(row.count for row in breakdown),
+        'categories': categories,
+        'transactions': listed,
+        'unlisted': sum(row.count for row in breakdown) - len(listed),
+    }
+    # Rendered through the Jinja environment directly: workers have no request for the context processors
+    files = {
+        'html': app.jinja_env.get_template('statement.html').render(statement=statement).encode(),
+        'csv': buffer.getvalue().encode(),
     }
+    if 'pdf' in STATEMENT_FORMATS:
+        files['pdf'] = statements.render_pdf(statement)
+
+    db.session.execute(db.delete(StatementFile).where(StatementFile.statement_id == job.id))
+    db.session.execute(db.insert(StatementFile), [
+        {'statement_id': job.id, 'format': fmt, 'content': content} for fmt, content in files.items()
+    ])
+    db.session.execute(done.values(source_digest=digest, generated_at=statement['generated_at']))
+    return True
+
+def fail_statement(job, error):
+    # Retries with a doubling delay, then gives up; the error is shown on the statements page
+    retry = job.attempts < STATEMENT_MAX_ATTEMPTS
+    db.session.execute(db.update(Statement).where(Statement.id == job.id).values(
+        status='queued' if retry else 'failed',
+        run_after=db.func.now() + timedelta(seconds=STATEMENT_RETRY_SECONDS * 2 ** (job.attempts - 1)),
+        error=str(error)[:500],
+    ))
+    db.session.commit()
+
+def run_statement_worker(burst=False, poll_seconds=5):
+    # Body of one `flask run-statements` worker process: claims and generates statements one at
+    # a time. Returns the number processed once the queue is empty (burst), or runs until stopped.
+    processed = 0
+    with app.app_context():
+        while True:
+            job = db.session.execute(STATEMENT_CLAIM_SQL, {'lease_seconds': STATEMENT_LEASE_SECONDS}).one_or_none()
+            db.session.commit()
+            if job is None:
+                if burst:
+                    return processed
+                time.sleep(poll_seconds)
+                continue
+            try:
+                generate_statement(job)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception('Statement %s failed (attempt %s)', job.id, job.attempts)
+                fail_statement(job, e)
+            processed += 1
+
+@app.route('/statements')
+@login_required
+def account_statements():
+    user_id = session['user_id']
+    # Statements rendered before the user's latest write go back to the workers for a check
+    db.session.execute(
+        db.update(Statement)
+        .where(Statement.user_id == user_id, Statement.status == 'ready',
+               Statement.data_version != get_data_version(user_id))
+        .values(status='queued', run_after=db.func.now())
+    )
+    db.session.commit()
+
+    rows = Statement.query.filter_by(user_id=user_id)\
+        .order_by(Statement.period_start.desc(), Statement.period.desc())\
+        .all()
+    files = {}
+    for statement_id, fmt, size in db.session.query(
+        StatementFile.statement_id, StatementFile.format, db.func.octet_length(StatementFile.content)
+    ).join(Statement).filter(Statement.user_id == user_id):
+        files.setdefault(statement_id, {})[fmt] = size
+
+    # Periods offered in the form, grouped into months and years; the current ones are partial
+    today = periods.today()
+    choices = {'month': [], 'year': []}
+    for period, start in statements.recent_periods(today):
+        label = statements.period_label(period, start)
+        if start == statements.period_start(period, today):
+            label += ' (so far)'
+        choices[period].append((statements.statement_key(period, start), label))
+    return render_template('statements.html', statements=rows, files=files, formats=STATEMENT_FORMATS,
+                           choices=choices,
+                           default_choice=statements.statement_key('month', statements.previous_period_start('month', today)),
+                           period_label=statements.period_label,
+                           pending=any(s.status in ('queued', 'running') for s in rows))
+
+@app.route('/request_statement', methods=['POST'])
+@login_required
+def request_statement():
+    user_id = session['user_id']
+    try:
+        period, period_start = statements.parse_statement_key(request.form.get('statement'))
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('account_statements'))
+    if period_start > periods.today():
+        flash('Statements can only be made for periods that have started.', 'danger')
+        return redirect(url_for('account_statements'))
+
+    label = statements.period_label(period, period_start)
+    if queue_statements(period, period_start, user_ids=[user_id]):
+        flash(f'Your {label} statement is being prepared. It will be listed here when it is ready.', 'success')
+    else:
+        flash(f'Your {label} statement is already up to date or being prepared.', 'info')
+    return redirect(url_for('account_statements'))
+
+@app.route('/statements/<int:statement_id>/<fmt>')
+@login_required
+def download_statement(statement_id, fmt):
+    user_id = session['user_id']
+    if fmt not in statements.FORMAT_MIMETYPES:
+        return jsonify(error='format must be html, csv or pdf.'), 400
+    row = db.session.query(StatementFile.content, Statement.period, Statement.period_start, Statement.source_digest)\
+        .join(Statement)\
+        .filter(Statement.id == statement_id, Statement.user_id == user_id, StatementFile.format == fmt)\
+        .first()
+    if row is None:
+        return jsonify(error='Statement not found.'), 404
+
+    etag = f'{row.source_digest}-{fmt}'
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        filename = f'statement-{statements.statement_key(row.period, row.period_start).split(":")[1]}.{fmt}'
+        # HTML opens in the browser (and prints from there); CSV and PDF download
+        disposition = 'inline' if fmt == 'html' else 'attachment'
+        response = app.response_class(row.content, mimetype=statements.FORMAT_MIMETYPES[fmt],
+                                      headers={'Content-Disposition': f'{disposition}; filename="{filename}"'})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# --- CLI Commands ---
+# Run with e.g. `flask --app app rebuild-aggregates`
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending SQL migrations from migrations/."""
+    applied = schema.apply_migrations(db.engine, echo=click.echo)
+    click.echo(f'{len(applied)} migration(s) applied.' if applied else 'Database is up to date.')
+
+@app.cli.command('db-status')
+def db_status_command():
+    """List SQL migrations that have not been applied yet."""
+    pending = schema.pending_migrations(db.engine)
+    for version, _ in pending:
+        click.echo(f'pending: {version}')
+    click.echo(f'{len(pending)} pending migration(s).')
+
+@app.cli.command('rebuild-aggregates')
+@click.option('--user-id', type=int, multiple=True, help='Only rebuild these users (repeatable). Defaults to all users.')
+@click.option('--dry-run', is_flag=True, help='Report users whose stored aggregates drifted, without writing.')
+def rebuild_aggregates_command(user_id, dry_run):
+    """Recompute user_balances and daily_rollups from the transactions table."""
+    user_ids = list(user_id) or None
+
+    if dry_run:
+        balance_query = UserBalance.query.filter(UserBalance.user_id.in_(user_ids)) if user_ids else UserBalance.query
+        stored = {(b.user_id, b.currency): b for b in balance_query}
+        built_users = {uid for uid, _ in stored}
+        zero = (0, 0, 0)
+        drifted = set()
+        actual = compute_balance_totals(user_ids)
+        for key in stored.keys() | actual.keys():
+            uid, currency = key
+            if uid not in built_users:
+                continue # Not built yet; seeded on first read
+            b = stored.get(key)
+            stored_totals = (b.total_income, b.total_expense, b.transaction_count) if b else zero
+            if stored_totals != actual.get(key, zero):
+                drifted.add(uid)
+                click.echo(f'user {uid} ({currency}): stored {stored_totals} != actual {actual.get(key, zero)}')
+        click.echo(f'{len(drifted)} user(s) with drifted balances.')
+
+        rollup_query = DailyRollup.query.filter(DailyRollup.user_id.in_(built_users))
+        stored_rollups = {(r.user_id, r.day, r.type, r.category_id, r.currency): (r.total_amount, r.transaction_count)
+                          for r in rollup_query}
+        actual_rollups = {(r.user_id, r.day, r.type, r.category_id, r.currency): (r.total_amount, r.transaction_count)
+                          for r in compute_daily_rollups(list(built_users))}
+        drifted_users = {key[0] for key in stored_rollups.keys() | actual_rollups.keys()
+                         if stored_rollups.get(key) != actual_rollups.get(key)}
+        for uid in sorted(drifted_users):
+            click.echo(f'user {uid}: daily rollups differ from transactions')
+        click.echo(f'{len(drifted_users)} user(s) with drifted rollups.')
+        return
+
+    totals = rebuild_user_aggregates(user_ids)
+    db.session.commit()
+    click.echo(f'Rebuilt balances and daily rollups for {len({uid for uid, _ in totals})} user(s).')
+
+@app.cli.command('load-rates')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def load_rates_command(path):
+    """Load exchange rates from a CSV file of currency,rate rows."""
+    try:
+        with open(path, 'rb') as f:
+            rates = parse_rates_file(f)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if not rates:
+        raise click.ClickException('No rates found in the file.')
+    user_ids = store_exchange_rates(rates)
+    db.session.commit()
+    click.echo(f'Loaded {len(rates)} rate(s); budget usage rebuilt for {len(user_ids)} multi-currency user(s).')
+
+@app.cli.command('set-rate')
+@click.argument('currency')
+@click.argument('rate')
+def set_rate_command(currency, rate):
+    """Set the exchange rate of one CURRENCY (value of one unit in the reference currency)."""
+    try:
+        rates = {normalize_currency(currency): parse_rate(rate)}
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    user_ids = store_exchange_rates(rates)
+    db.session.commit()
+    click.echo(f'{currency.upper()} = {rate}; budget usage rebuilt for {len(user_ids)} multi-currency user(s).')
+
+@app.cli.command('build-assets')
+@click.option('--force', is_flag=True, help='Re-encode every image, even if unchanged.')
+def build_assets_command(force):
+    """Write hashed, resized AVIF/WebP variants of static/ images and their manifest."""
+    try:
+        manifest = build_assets(app.static_folder, force=force, log=click.echo)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    asset_manifest.load()
+    click.echo(f'{len(manifest)} images listed in static/dist/manifest.json.')
+
+@app.cli.command('run-recurring')
+@click.option('--through', type=click.DateTime(formats=['%Y-%m-%d']), help='Write occurrences up to this date (default today).')
+@click.option('--batch-size', type=int, default=RECURRING_BATCH_SIZE, show_default=True, help='Schedules per batch.')
+@click.option('--every', type=int, default=0, help='Keep running as a worker, repeating every N seconds.')
+def run_recurring_command(through, batch_size, every):
+    """Write due occurrences of all recurring transactions (idempotent)."""
+    while True:
+        created, processed = materialize_recurring(through.date() if through else None, batch_size=batch_size)
+        click.echo(f'{created} transaction(s) created from {processed} due schedule(s).')
+        if not every:
+            return
+        time.sleep(every)
+
+@app.cli.command('queue-statements')
+@click.option('--period', type=click.Choice(statements.PERIODS), default='month', show_default=True)
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m', '%Y']),
+              help='Any day of the period (default: the last complete month or year).')
+@click.option('--user-id', type=int, multiple=True, help='Only these users (repeatable). Defaults to every user with transactions in the period.')
+def queue_statements_command(period, start, user_id):
+    """Queue statements for a month or year, e.g. from a month-end cron job."""
+    if start:
+        period_start = statements.period_start(period, start.date())
+    else:
+        period_start = statements.previous_period_start(period, periods.today())
+    queued = queue_statements(period, period_start, user_ids=user_id or None)
+    click.echo(f'{len(queued)} {statements.period_label(period, period_start)} statement(s) queued.')
+
+@app.cli.command('run-statements')
+@click.option('--workers', type=click.IntRange(min=1), default=2, show_default=True, help='Worker processes.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty instead of waiting for more jobs.')
+@click.option('--poll', type=float, default=5, show_default=True, help='Seconds between checks of an empty queue.')
+def run_statements_command(workers, burst, poll):
+    """Generate queued statements on a pool of worker processes."""
+    # Spawned rather than forked, so no process inherits another's database connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(run_statement_worker, burst, poll) for _ in range(workers)]
+        processed = sum(future.result() for future in futures)
+    click.echo(f'{processed} statement(s) processed.')
+
+@app.cli.command('import-transactions')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per COPY batch.')
+def import_transactions_command(username, path, fmt, chunk_size):
+    """Import a CSV or OFX file into USERNAME's transactions."""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'User "{username}" not found.')
+
+    started = time.perf_counter()
+    def report_progress(imported, error_count):
+        click.echo(f'\r{imported} rows imported, {error_count} skipped...', nl=False)
+
+    try:
+        with open(path, 'rb') as f:
+            imported, error_count, errors = import_transaction_rows(
+                user.id, f, detect_format(path, fmt), chunk_size=chunk_size, progress=report_progress)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
 
-# Dynamically add to_dict method to Category model
-Category.to_dict = category_to_dict
+    click.echo('')
+    for error in errors:
+        click.echo(f'line {error["line"]}: {error["error"]}')
+    if error_count > len(errors):
+        click.echo(f'... and {error_count - len(errors)} more skipped rows')
+    click.echo(f'Imported {imported} rows ({error_count} skipped) in {elapsed:.2f}s '
+               f'({imported / elapsed if elapsed else 0:.0f} rows/s).')
 
 
 if __name__ == '__main__':
-    # When running locally, ensure tables are created (only if you don't use migrations)
-    # For production with Alembic, you would run 'alembic upgrade head'
-    # with app.app_context():
-    #     db.create_all() # This creates tables based on models - use with caution in production!
+    # The schema is managed by the SQL files in migrations/.
+    # Run 'flask --app app db-upgrade' before starting the app (locally and on deploy).
     app.run(debug=True)
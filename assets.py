@@ -0,0 +1,219 @@
+# --- Static Assets ---
+# Build step and Flask integration for the images in static/.
+#
+# build_assets() (run with `flask build-assets`) writes, for every image in static/:
+#   - a content-hashed copy of the original, e.g. dist/vinc.3f9a1c2e04.png
+#   - resized AVIF, WebP and original-format variants at the ASSET_WIDTHS narrower than the
+#     source, e.g. dist/vinc-192.1b2c3d4e5f.webp
+# and records them in static/dist/manifest.json. Building needs the optional Pillow package;
+# AVIF is skipped when Pillow was built without it. Unchanged sources are not re-encoded and
+# outputs that are no longer in the manifest are deleted. The app itself only reads the manifest.
+#
+# init_assets(app) wires the manifest in:
+#   - url_for('static', filename='vinc.png') resolves to the hashed copy when there is one
+#   - templates get static_srcset(filename, fmt) and picture(filename, alt, sizes, **attrs)
+#   - hashed files are served with `Cache-Control: public, max-age=31536000, immutable`; other
+#     static files get STATIC_MAX_AGE seconds (default 3600) and then revalidate by ETag
+
+import hashlib
+import io
+import json
+import os
+
+from flask import request, url_for
+from markupsafe import Markup, escape
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError: # Optional dependency, only needed to run the build
+    Image = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+IMAGE_SUFFIXES = {'.png': 'png', '.jpg': 'jpeg', '.jpeg': 'jpeg'}
+# Rendered sizes in the templates are 20-96 CSS px, so these cover 1x-4x screens
+ASSET_WIDTHS = (96, 192, 384, 768)
+# Modern formats first: <picture> uses the first <source> the browser supports
+MODERN_FORMATS = ('avif', 'webp')
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'png': 'image/png', 'jpeg': 'image/jpeg'}
+SAVE_OPTIONS = {
+    'avif': {'quality': 60},
+    'webp': {'quality': 80, 'method': 6},
+    'png': {'optimize': True},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'png': 'png', 'jpeg': 'jpg'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _write_hashed(out_dir, stem, ext, data):
+    name = f'{stem}.{_digest(data)}.{ext}'
+    path = os.path.join(out_dir, name)
+    if not os.path.exists(path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return f'{DIST_DIR}/{name}'
+
+
+def _encode(image, fmt):
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def available_formats():
+    if Image is None:
+        return ()
+    return tuple(fmt for fmt in MODERN_FORMATS if features.check(fmt))
+
+
+def build_image(source_path, out_dir, fmt, formats, widths=ASSET_WIDTHS):
+    with open(source_path, 'rb') as f:
+        source = f.read()
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    entry = {
+        'source_hash': _digest(source),
+        'file': _write_hashed(out_dir, stem, EXTENSIONS[fmt], source),
+        'variants': {},
+    }
+    with Image.open(source_path) as opened:
+        image = ImageOps.exif_transpose(opened)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode == 'P' else 'RGB')
+        entry['width'], entry['height'] = image.size
+        for width in sorted({min(w, image.width) for w in widths}):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for variant_fmt in (*formats, fmt):
+                path = _write_hashed(out_dir, f'{stem}-{width}', EXTENSIONS[variant_fmt], _encode(resized, variant_fmt))
+                entry['variants'].setdefault(variant_fmt, []).append([width, path])
+    return entry
+
+
+def build_assets(static_dir, widths=ASSET_WIDTHS, force=False, log=print):
+    if Image is None:
+        raise RuntimeError('Building assets needs Pillow: pip install Pillow')
+    formats = available_formats()
+    out_dir = os.path.join(static_dir, DIST_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    previous = {} if force else load_manifest(static_dir)
+
+    manifest = {}
+    for name in sorted(os.listdir(static_dir)):
+        fmt = IMAGE_SUFFIXES.get(os.path.splitext(name)[1].lower())
+        path = os.path.join(static_dir, name)
+        if fmt is None or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            source_hash = _digest(f.read())
+        entry = previous.get(name)
+        if (entry and entry['source_hash'] == source_hash and set(entry['variants']) == {*formats, fmt}
+                and all(os.path.exists(os.path.join(static_dir, p)) for p in _entry_paths(entry))):
+            manifest[name] = entry
+            continue
+        manifest[name] = build_image(path, out_dir, fmt, formats, widths)
+        best_fmt = (formats or (fmt,))[0]
+        width, largest = manifest[name]['variants'][best_fmt][-1]
+        log(f'{name}: {os.path.getsize(path) / 1024:.0f} KB -> '
+            f'{os.path.getsize(os.path.join(static_dir, largest)) / 1024:.0f} KB as {best_fmt} at {width}px')
+
+    keep = {os.path.basename(p) for entry in manifest.values() for p in _entry_paths(entry)} | {MANIFEST_NAME}
+    for name in os.listdir(out_dir):
+        if name not in keep:
+            os.remove(os.path.join(out_dir, name))
+
+    tmp_path = os.path.join(out_dir, f'{MANIFEST_NAME}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_NAME))
+    return manifest
+
+
+def _entry_paths(entry):
+    yield entry['file']
+    for variants in entry['variants'].values():
+        for _, path in variants:
+            yield path
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class AssetManifest:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.load()
+
+    def load(self):
+        self.entries = load_manifest(self.static_dir)
+        self.hashed = {p for entry in self.entries.values() for p in _entry_paths(entry)}
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    def is_hashed(self, filename):
+        return filename in self.hashed
+
+
+def init_assets(app, static_max_age=None):
+    if static_max_age is None:
+        static_max_age = int(os.environ.get('STATIC_MAX_AGE', 3600))
+    manifest = AssetManifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static':
+            entry = manifest.get(values.get('filename'))
+            if entry:
+                values['filename'] = entry['file']
+
+    # Flask's static view asks the app for the max-age of each file it sends
+    def get_send_file_max_age(filename):
+        return IMMUTABLE_MAX_AGE if manifest.is_hashed(filename) else static_max_age
+    app.get_send_file_max_age = get_send_file_max_age
+
+    @app.after_request
+    def mark_hashed_files_immutable(response):
+        if request.endpoint == 'static' and manifest.is_hashed((request.view_args or {}).get('filename')):
+            response.cache_control.immutable = True
+        return response
+
+    def static_srcset(filename, fmt=None):
+        # `url 96w, url 192w, ...` for one format (the source's own by default); '' when not built
+        entry = manifest.get(filename)
+        if not entry:
+            return ''
+        variants = entry['variants'].get(fmt or IMAGE_SUFFIXES[os.path.splitext(filename)[1].lower()], ())
+        return ', '.join(f"{url_for('static', filename=path)} {width}w" for width, path in variants)
+
+    def picture(filename, alt, sizes, **attrs):
+        # <picture> with AVIF/WebP sources and a resized fallback <img>; a plain <img> when not built
+        entry = manifest.get(filename)
+        img_attrs = {'src': url_for('static', filename=filename), 'alt': alt, 'decoding': 'async'}
+        if entry:
+            img_attrs.update(srcset=static_srcset(filename), sizes=sizes)
+        img_attrs.update((key.rstrip('_').replace('_', '-'), value) for key, value in attrs.items())
+        img = '<img ' + ' '.join(f'{key}="{escape(value)}"' for key, value in img_attrs.items()) + '>'
+        if not entry:
+            return Markup(img)
+        sources = ''.join(f'<source type="{MIME_TYPES[fmt]}" srcset="{escape(static_srcset(filename, fmt))}" sizes="{escape(sizes)}">'
+                          for fmt in MODERN_FORMATS if fmt in entry['variants'])
+        # display: contents keeps the <img> laid out as a direct child of the surrounding flex box
+        return Markup(f'<picture style="display: contents">{sources}{img}</picture>')
+
+    app.jinja_env.globals.update(static_srcset=static_srcset, picture=picture)
+    return manifest
@@ -0,0 +1,98 @@
+# Concurrency benchmark: compares requests per second per gunicorn worker between the
+# sync and gevent worker classes (see gunicorn.conf.py) when many requests arrive at once.
+# A local Postgres answers in microseconds, so bench/latency.gunicorn.conf.py adds a
+# per-statement delay (--latency-ms) to model the round trip to a hosted database;
+# that wait is what gevent overlaps.
+#
+# Usage (DATABASE_URL must point at a local, disposable database; gevent mode needs
+# `pip install gevent psycogreen`):
+#     python bench/concurrency.py [--size 1k] [--requests 400] [--concurrency 20] [--latency-ms 20]
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datagen import SIZES, ensure_user  # noqa: E402
+from run import BENCH_DIR, free_port, http_request, percentile, prepare_database, session_opener, start_gunicorn  # noqa: E402
+
+LATENCY_CONFIG = os.path.join(BENCH_DIR, 'latency.gunicorn.conf.py')
+
+# The read routes the dashboard and history pages call in parallel
+CONCURRENT_ROUTES = [
+    '/get_dashboard_data?period=month&dataTypes=income,expense',
+    '/get_transactions_data?period=year&dataType=expense',
+    '/get_transactions_bar_data?period=week&dataType=income',
+    '/get_transactions_page',
+    '/dashboard',
+]
+
+
+def run_mode(worker_class, user_id, username, n_requests, concurrency, latency_ms):
+    port = free_port()
+    process = start_gunicorn(port, 1, worker_class, config=LATENCY_CONFIG,
+                             extra_env={'BENCH_DB_LATENCY_MS': str(latency_ms)})
+    base_url = f'http://127.0.0.1:{port}'
+    opener = session_opener(user_id, username)
+    urls = [CONCURRENT_ROUTES[i % len(CONCURRENT_ROUTES)] for i in range(n_requests)]
+    try:
+        for url in CONCURRENT_ROUTES: # Warm up the worker and its response cache
+            http_request(opener, base_url, 'GET', url, None)
+
+        def timed(url):
+            started = time.perf_counter()
+            status = http_request(opener, base_url, 'GET', url, None)
+            return status, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed, urls))
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    failed = [status for status, _ in outcomes if status >= 400]
+    if failed:
+        raise SystemExit(f'{worker_class}: HTTP {failed[0]}')
+    latencies = [latency for _, latency in outcomes]
+    return {
+        'throughput_rps': round(n_requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sync and gevent gunicorn workers under concurrent load.')
+    parser.add_argument('--size', choices=list(SIZES), default='1k')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=20, help='Concurrent client connections')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Simulated database round trip per statement')
+    parser.add_argument('--modes', default='sync,gevent', help='Worker classes to compare')
+    parser.add_argument('--force', action='store_true', help='Allow a non-local DATABASE_URL')
+    args = parser.parse_args()
+
+    prepare_database(args.force)
+    user_id, username = ensure_user(args.size)
+    print(f'{args.requests} requests, {args.concurrency} concurrent, {args.latency_ms} ms per statement, 1 worker')
+    print(f'{"worker class":14} {"req/s":>8} {"p50 ms":>9} {"p99 ms":>9}')
+    results = {}
+    for worker_class in args.modes.split(','):
+        results[worker_class] = run_mode(worker_class, user_id, username, args.requests, args.concurrency,
+                                         args.latency_ms)
+        r = results[worker_class]
+        print(f'{worker_class:14} {r["throughput_rps"]:>8} {r["p50_ms"]:>9} {r["p99_ms"]:>9}')
+
+    if 'sync' in results and len(results) > 1:
+        for worker_class, r in results.items():
+            if worker_class != 'sync':
+                print(f'{worker_class} vs sync: {r["throughput_rps"] / results["sync"]["throughput_rps"]:.1f}x throughput')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
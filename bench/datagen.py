@@ -0,0 +1,72 @@
+# Synthetic data for the benchmark suite: one user per size, each with that many
+# transactions spread across 10 categories and 3 years (see scripts/route_probe.py).
+# Users are named bench_<size>_1, so runs can reuse data seeded earlier.
+#
+# Usage (DATABASE_URL must point at a local, disposable database):
+#     python bench/datagen.py [--sizes 1k,100k,1M] [--reseed] [--drop]
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from sqlalchemy import text  # noqa: E402
+
+from route_probe import app, db, delete_seeded_users, prepare_database, seed_users  # noqa: E402
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1M': 1_000_000}
+
+
+def size_prefix(size):
+    return f'bench_{size}_'
+
+
+def parse_sizes(value):
+    sizes = [s.strip() for s in value.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'Unknown size(s) {", ".join(unknown)}; use {", ".join(SIZES)}.')
+    return sizes
+
+
+def find_user(size):
+    # (user_id, username) of the seeded user for this size, or None
+    with app.app_context():
+        row = db.session.execute(text(
+            'SELECT id, username FROM users WHERE username = :username'
+        ), {'username': size_prefix(size) + '1'}).first()
+        return (row.id, row.username) if row else None
+
+
+def ensure_user(size, reseed=False):
+    if reseed:
+        delete_seeded_users(size_prefix(size))
+    existing = find_user(size)
+    if existing:
+        return existing
+    print(f'Seeding {size} transactions...', flush=True)
+    return seed_users(1, SIZES[size], prefix=size_prefix(size))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed benchmark users.')
+    parser.add_argument('--sizes', type=parse_sizes, default=list(SIZES))
+    parser.add_argument('--reseed', action='store_true', help='Drop and recreate existing benchmark users')
+    parser.add_argument('--drop', action='store_true', help='Only delete the benchmark users')
+    parser.add_argument('--force', action='store_true', help='Allow a non-local DATABASE_URL')
+    args = parser.parse_args()
+
+    prepare_database(args.force)
+    for size in args.sizes:
+        if args.drop:
+            delete_seeded_users(size_prefix(size))
+            print(f'Dropped {size}')
+        else:
+            user_id, username = ensure_user(size, args.reseed)
+            print(f'{size}: user {username} (id {user_id})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,25 @@
+# Gunicorn config used by bench/concurrency.py: the app's gunicorn.conf.py plus a fixed
+# delay before every SQL statement (BENCH_DB_LATENCY_MS, default 20), standing in for the
+# network round trip to a remote database that a local Postgres doesn't have.
+# Under gevent, time.sleep is monkey-patched, so the delay yields like a real socket wait.
+
+import os
+import time
+
+with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')) as f:
+    exec(f.read())
+
+_app_post_worker_init = post_worker_init  # noqa: F821 (defined by the exec above)
+
+
+def post_worker_init(worker):
+    _app_post_worker_init(worker)
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    delay = float(os.environ.get('BENCH_DB_LATENCY_MS', 20)) / 1000
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def simulate_network_latency(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(delay)
@@ -0,0 +1,150 @@
+# Login benchmark: measures sign-in throughput on one or more gunicorn workers, and how the
+# dashboard responds while a burst of logins is being hashed, with password hashing inline
+# (PASSWORD_HASH_SLOTS=0) and under the machine-wide slot cap (see passwords.py). A second
+# phase sends wrong passwords for one account and reports how fast the throttled attempts
+# are refused.
+#
+# Usage (DATABASE_URL must point at a local, disposable database; gevent mode needs
+# `pip install gevent psycogreen`):
+#     python bench/login.py [--worker-class gevent] [--workers 1] [--logins 200] [--concurrency 16]
+#                           [--modes inline,slots] [--stuffing 200]
+
+import argparse
+import os
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text  # noqa: E402
+
+from datagen import ensure_user  # noqa: E402
+from run import free_port, http_request, percentile, prepare_database, session_opener, start_gunicorn  # noqa: E402
+from route_probe import app, db, delete_seeded_users  # noqa: E402
+from app import password_hasher  # noqa: E402
+
+LOGIN_USER_PREFIX = 'bench_login_'
+PASSWORD = 'bench-password'
+MODES = {'inline': {'PASSWORD_HASH_SLOTS': '0'}, 'slots': {}}
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None # A successful login is the 302 itself
+
+
+def seed_login_users(n_users):
+    delete_seeded_users(LOGIN_USER_PREFIX)
+    with app.app_context():
+        db.session.execute(text(
+            "INSERT INTO users (username, password_hash, created_at) "
+            "SELECT :prefix || n, :password_hash, now() FROM generate_series(1, :n_users) AS n"
+        ), {'prefix': LOGIN_USER_PREFIX, 'password_hash': password_hasher.hash(PASSWORD), 'n_users': n_users})
+        db.session.commit()
+    return [f'{LOGIN_USER_PREFIX}{n}' for n in range(1, n_users + 1)]
+
+
+def clear_login_failures():
+    with app.app_context():
+        db.session.execute(text('DELETE FROM login_failures'))
+        db.session.commit()
+
+
+def timed_login(base_url, username, password):
+    opener = urllib.request.build_opener(NoRedirect)
+    started = time.perf_counter()
+    status = http_request(opener, base_url, 'POST', '/login', {'username': username, 'password': password})
+    return status, time.perf_counter() - started
+
+
+def run_mode(mode, worker_class, workers, usernames, dashboard_user, n_logins, concurrency, n_stuffing):
+    clear_login_failures()
+    port = free_port()
+    process = start_gunicorn(port, workers, worker_class, extra_env=MODES[mode])
+    base_url = f'http://127.0.0.1:{port}'
+    dashboard = session_opener(*dashboard_user)
+    try:
+        http_request(dashboard, base_url, 'GET', '/dashboard', None) # Warm up
+        timed_login(base_url, usernames[0], PASSWORD)
+
+        # Poll the dashboard from one client for as long as the login burst runs
+        burst_done = threading.Event()
+        dashboard_latencies = []
+
+        def poll_dashboard():
+            while not burst_done.is_set():
+                started = time.perf_counter()
+                http_request(dashboard, base_url, 'GET', '/dashboard', None)
+                dashboard_latencies.append(time.perf_counter() - started)
+
+        poller = threading.Thread(target=poll_dashboard)
+        poller.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            logins = list(pool.map(lambda i: timed_login(base_url, usernames[i % len(usernames)], PASSWORD),
+                                   range(n_logins)))
+        elapsed = time.perf_counter() - started
+        burst_done.set()
+        poller.join()
+
+        # Credential stuffing against one account: only the first few attempts are hashed
+        started = time.perf_counter()
+        stuffing = [timed_login(base_url, usernames[-1], f'guess-{i}')[0] for i in range(n_stuffing)]
+        stuffing_elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    statuses = [status for status, _ in logins]
+    failed = [status for status in statuses if status not in (302, 503)]
+    if failed:
+        raise SystemExit(f'{mode}: login returned HTTP {failed[0]}')
+    latencies = [latency for status, latency in logins if status == 302]
+    return {
+        'logins_per_s': round(statuses.count(302) / elapsed, 1),
+        'login_p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'login_p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'busy_503': statuses.count(503),
+        'dashboard_p50_ms': round(percentile(dashboard_latencies, 0.5) * 1000, 1),
+        'dashboard_p99_ms': round(percentile(dashboard_latencies, 0.99) * 1000, 1),
+        'throttled_429': stuffing.count(429),
+        'stuffing_per_s': round(n_stuffing / stuffing_elapsed, 1) if n_stuffing else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark login throughput, hashing inline vs under the slot cap.')
+    parser.add_argument('--worker-class', default='gevent', help='gunicorn worker class (sync or gevent)')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent login clients')
+    parser.add_argument('--users', type=int, default=20, help='Distinct accounts to sign in to')
+    parser.add_argument('--stuffing', type=int, default=200, help='Wrong-password attempts against one account')
+    parser.add_argument('--modes', default='inline,slots', help='Hashing modes to compare')
+    parser.add_argument('--force', action='store_true', help='Allow a non-local DATABASE_URL')
+    args = parser.parse_args()
+
+    prepare_database(args.force)
+    usernames = seed_login_users(args.users)
+    dashboard_user = ensure_user('1k')
+    print(f'{args.logins} logins, {args.concurrency} concurrent, {args.workers} {args.worker_class} worker(s), '
+          f'hash method {password_hasher.method}')
+    columns = ('logins_per_s', 'login_p50_ms', 'login_p99_ms', 'busy_503', 'dashboard_p50_ms', 'dashboard_p99_ms',
+               'throttled_429', 'stuffing_per_s')
+    print(f'{"mode":8}' + ''.join(f'{column:>17}' for column in columns))
+    try:
+        for mode in args.modes.split(','):
+            result = run_mode(mode, args.worker_class, args.workers, usernames, dashboard_user, args.logins, args.concurrency,
+                              args.stuffing)
+            print(f'{mode:8}' + ''.join(f'{result[column]:>17}' for column in columns))
+    finally:
+        delete_seeded_users(LOGIN_USER_PREFIX)
+        clear_login_failures()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# Benchmark suite: drives the main routes for users of each data size (bench/datagen.py)
+# through the Flask test client or a local gunicorn, and reports p50/p99 latency,
+# throughput, SQL statements per request and peak RSS. Results can be saved as a
+# JSON baseline and later runs compared against it.
+#
+# Usage (DATABASE_URL must point at a local, disposable database):
+#     python bench/run.py [--sizes 1k,100k] [--target client|gunicorn] [--requests 50]
+#                         [--baseline bench/baseline.json] [--save-baseline] [--threshold 0.25]
+#
+# --target client  runs in-process; the response cache is cleared before every request
+#                  unless --warm-cache is given, so chart routes measure their queries.
+# --target gunicorn starts `gunicorn app:app` on a local port (one sync worker by default,
+#                  so its /metrics give exact statement counts) and sends real HTTP requests.
+# Exits with status 1 if any result regressed past the threshold.
+
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.cookiejar import Cookie, CookieJar
+from urllib.parse import urlencode
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+sys.path.insert(0, BENCH_DIR)
+
+from sqlalchemy import text  # noqa: E402
+
+from datagen import SIZES, ensure_user, parse_sizes  # noqa: E402
+from route_probe import app, capture_sql, db, logged_in_client, prepare_database, sample_ids  # noqa: E402
+from app import response_cache  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+BENCH_DESCRIPTION = 'bench write'
+
+
+def bench_routes(user_id):
+    # (name, method, url, form data); the write routes run last and clean up after themselves
+    transaction_id, category_id = sample_ids(user_id)
+    form = {'type': 'expense', 'category_id': str(category_id), 'amount': '12.34',
+            'description': BENCH_DESCRIPTION, 'date': date.today().isoformat()}
+    edit_form = dict(form, description='bench edit') # Keeps the edited row out of the delete run
+    routes = [
+        ('dashboard', 'GET', '/dashboard', None),
+        ('history', 'GET', '/history', None),
+        ('get_transactions_page', 'GET', '/get_transactions_page', None),
+        # Seeded descriptions are "Probe transaction N": ~1,100 matches at 1M rows, and every row
+        ('search_transactions (few)', 'GET', '/search_transactions?q=transaction%20777', None),
+        ('search_transactions (common)', 'GET', '/search_transactions?q=prob', None),
+    ]
+    for period in ('week', 'month', 'year', 'all'):
+        routes.append((f'get_transactions_data ({period})', 'GET',
+                       f'/get_transactions_data?period={period}&dataType=expense', None))
+        routes.append((f'get_transactions_bar_data ({period})', 'GET',
+                       f'/get_transactions_bar_data?period={period}&dataType=expense', None))
+    routes.append(('get_dashboard_data (month)', 'GET',
+                   '/get_dashboard_data?period=month&dataTypes=income,expense,both', None))
+    routes += [
+        ('add_transaction', 'POST', '/add_transaction', form),
+        ('edit_transaction', 'POST', f'/edit_transaction/{transaction_id}', edit_form),
+        ('delete_transaction', 'POST', '/delete_transaction/{id}', None), # One row added above per request
+    ]
+    return routes
+
+
+def bench_transaction_ids(user_id):
+    with app.app_context():
+        return db.session.execute(text(
+            'SELECT id FROM transactions WHERE user_id = :u AND description = :d ORDER BY id'
+        ), {'u': user_id, 'd': BENCH_DESCRIPTION}).scalars().all()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, statements):
+    return {
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'queries_per_request': None if statements is None else round(statements / len(latencies), 1),
+    }
+
+
+# --- Test client target ---
+
+def run_client(user_id, username, n_requests, warm_cache):
+    client = logged_in_client(user_id, username)
+    results = {}
+    for name, method, url, data in bench_routes(user_id):
+        urls = [url] * n_requests
+        if '{id}' in url:
+            urls = [url.format(id=i) for i in bench_transaction_ids(user_id)[:n_requests]]
+        latencies = []
+        statement_count = 0
+        started = time.perf_counter()
+        for target in urls:
+            if not warm_cache:
+                response_cache.clear()
+            with capture_sql() as statements:
+                request_started = time.perf_counter()
+                response = client.post(target, data=data) if method == 'POST' else client.get(target)
+                latencies.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                raise SystemExit(f'{name}: HTTP {response.status_code}')
+            statement_count += len(statements)
+        results[name] = summarize(latencies, time.perf_counter() - started, statement_count)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results, round(peak_rss_mb, 1)
+
+
+# --- Gunicorn target ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(port, workers, worker_class, config=os.path.join(ROOT_DIR, 'gunicorn.conf.py'), extra_env=None):
+    command = [sys.executable, '-m', 'gunicorn', '-c', config, '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--worker-class', worker_class, '--log-level', 'warning', 'app:app']
+    # WEB_WORKER_CLASS also picks the matching pool defaults in gunicorn.conf.py
+    env = dict(os.environ, SLOW_QUERY_MS='0', WEB_WORKER_CLASS=worker_class, **(extra_env or {}))
+    env.pop('METRICS_TOKEN', None) # The statement counts are scraped from /metrics
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/about', timeout=1)
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn did not start within 30 seconds')
+
+
+def session_opener(user_id, username):
+    # Signs a session cookie with the app's secret key instead of going through /login,
+    # which would need a known password for the seeded user
+    with app.test_request_context():
+        cookie_value = app.session_interface.get_signing_serializer(app).dumps(
+            {'user_id': user_id, 'username': username})
+    jar = CookieJar()
+    jar.set_cookie(Cookie(0, app.config['SESSION_COOKIE_NAME'], cookie_value, None, False, '127.0.0.1', False,
+                          False, '/', True, False, None, False, None, None, {}))
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None # The write routes redirect; the redirect target isn't part of the measurement
+
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), NoRedirect)
+
+
+def http_request(opener, base_url, method, url, data):
+    body = urlencode(data or {}).encode() if method == 'POST' else None
+    try:
+        with opener.open(base_url + url, data=body, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def scrape_statements(opener, base_url):
+    # {endpoint: statements} summed over the workers' /metrics (exact with a single worker)
+    totals = {}
+    with opener.open(base_url + '/metrics', timeout=10) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith('budget_db_statements_total{'):
+                labels, value = line.rsplit(' ', 1)
+                endpoint = labels.split('endpoint="', 1)[1].split('"', 1)[0]
+                totals[endpoint] = totals.get(endpoint, 0) + float(value)
+    return totals
+
+
+def worker_peak_rss_mb(process):
+    # Largest VmHWM among gunicorn's worker processes (Linux only)
+    peak = 0
+    try:
+        with open(f'/proc/{process.pid}/task/{process.pid}/children') as f:
+            pids = f.read().split()
+        for pid in pids:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak, int(line.split()[1]))
+    except OSError:
+        return None
+    return round(peak / 1024, 1)
+
+
+def run_gunicorn(user_id, username, n_requests, workers, worker_class, concurrency):
+    port = free_port()
+    process = start_gunicorn(port, workers, worker_class)
+    base_url = f'http://127.0.0.1:{port}'
+    opener = session_opener(user_id, username)
+    results = {}
+    try:
+        for name, method, url, data in bench_routes(user_id):
+            urls = [url] * n_requests
+            if '{id}' in url:
+                urls = [url.format(id=i) for i in bench_transaction_ids(user_id)[:n_requests]]
+            endpoint = url.split('?')[0].strip('/').split('/')[0]
+            before = scrape_statements(opener, base_url).get(endpoint, 0)
+
+            def timed(target):
+                request_started = time.perf_counter()
+                status = http_request(opener, base_url, method, target, data)
+                return status, time.perf_counter() - request_started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(timed, urls))
+            elapsed = time.perf_counter() - started
+            failed = [status for status, _ in outcomes if status >= 400]
+            if failed:
+                raise SystemExit(f'{name}: HTTP {failed[0]}')
+
+            statements = scrape_statements(opener, base_url).get(endpoint, 0) - before if workers == 1 else None
+            results[name] = summarize([latency for _, latency in outcomes], elapsed, statements)
+        return results, worker_peak_rss_mb(process)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+# --- Baselines ---
+
+def compare(results, baseline, threshold):
+    # Flags latency more than `threshold` above the baseline and any increase in queries per request
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if previous.get(metric) and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f'{name}: {metric} {previous[metric]} -> {current[metric]}')
+        if previous.get('queries_per_request') is not None and current['queries_per_request'] is not None \
+                and current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f'{name}: queries/request {previous["queries_per_request"]} -> '
+                               f'{current["queries_per_request"]}')
+    return regressions
+
+
+def print_table(title, results, peak_rss_mb):
+    print(f'\n{title} (peak RSS {peak_rss_mb} MB)')
+    print(f'{"route":44} {"p50 ms":>9} {"p99 ms":>9} {"req/s":>8} {"queries":>8}')
+    for name, r in results.items():
+        queries = '-' if r['queries_per_request'] is None else r['queries_per_request']
+        print(f'{name:44} {r["p50_ms"]:>9} {r["p99_ms"]:>9} {r["throughput_rps"]:>8} {queries:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the app routes against seeded users.')
+    parser.add_argument('--sizes', type=parse_sizes, default=['1k', '100k'], help=f'Any of {", ".join(SIZES)}')
+    parser.add_argument('--target', choices=('client', 'gunicorn'), default='client')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per route')
+    parser.add_argument('--warm-cache', action='store_true', help='Client target: keep the response cache between requests')
+    parser.add_argument('--workers', type=int, default=1, help='Gunicorn target: worker processes')
+    parser.add_argument('--worker-class', default='sync', help='Gunicorn target: worker class')
+    parser.add_argument('--concurrency', type=int, default=1, help='Gunicorn target: concurrent client threads')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Write these results to --baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed latency increase before flagging')
+    parser.add_argument('--force', action='store_true', help='Allow a non-local DATABASE_URL')
+    args = parser.parse_args()
+
+    prepare_database(args.force)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    regressions = []
+    for size in args.sizes:
+        user_id, username = ensure_user(size)
+        if args.target == 'client':
+            results, peak_rss_mb = run_client(user_id, username, args.requests, args.warm_cache)
+        else:
+            results, peak_rss_mb = run_gunicorn(user_id, username, args.requests, args.workers,
+                                                args.worker_class, args.concurrency)
+        key = f'{args.target}:{size}'
+        print_table(key, results, peak_rss_mb)
+        regressions += [f'{key} {r}' for r in compare(results, baselines.get(key, {}), args.threshold)]
+        baselines[key] = results
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'\nBaseline written to {args.baseline}')
+
+    if regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print('  ' + regression)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# --- Caching ---
+# Small key/value caches used by app.py for per-user response caching.
+# Entries are plain picklable values; invalidation is done by the caller
+# (app.py stores the user's data_version alongside each value).
+#
+# Backends:
+#   LRUCache   - in-process, bounded, with a per-entry TTL (default)
+#   RedisCache - shared between gunicorn workers; needs the optional `redis` package
+#
+# Configure with CACHE_URL (e.g. redis://localhost:6379/0), CACHE_MAX_ENTRIES and CACHE_TTL_SECONDS.
+#
+# FragmentCacheExtension adds a Jinja {% cache %} tag for caching rendered template fragments;
+# the app decides how they are keyed and validated (see render_cached_fragment in app.py).
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+try:
+    import redis
+except ImportError: # Optional dependency, only needed when CACHE_URL points at Redis
+    redis = None
+
+
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key) # Mark as most recently used
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False) # Evict the least recently used entry
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    def __init__(self, url, ttl=300, prefix='budget:'):
+        if redis is None:
+            raise RuntimeError('CACHE_URL is set but the redis package is not installed (pip install redis).')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_cache(url=None, max_entries=1024, ttl=300):
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisCache(url, ttl=ttl)
+    return LRUCache(max_entries=max_entries, ttl=ttl)
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'name', key, ... %}...{% endcache %} caches the body per user;
+    # {% cache_shared 'name', ... %}...{% endcache_shared %} caches it once for every user.
+    # Both hand the key parts and a callable that renders the body to
+    # environment.fragment_cache(key_parts, render, shared), which returns the markup.
+    tags = {'cache', 'cache_shared'}
+
+    def parse(self, parser):
+        token = next(parser.stream)
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements((f'name:end{token.value}',), drop_needle=True)
+        shared = nodes.Const(token.value == 'cache_shared')
+        call = self.call_method('_render', [nodes.List(key_parts), shared])
+        return nodes.CallBlock(call, [], [], body).set_lineno(token.lineno)
+
+    def _render(self, key_parts, shared, caller):
+        return self.environment.fragment_cache(tuple(key_parts), caller, shared)
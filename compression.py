@@ -0,0 +1,68 @@
+# --- Response Compression ---
+# Compresses HTML, JSON and other text responses with brotli or gzip, whichever the client
+# prefers in Accept-Encoding (brotli needs the optional `brotli` package; gzip otherwise).
+#
+# init_compression(app) adds an after_request hook that skips:
+#   - bodies under the size threshold: COMPRESS_MIN_HTML_BYTES (default 1024) for HTML and
+#     COMPRESS_MIN_BYTES (default 512) for JSON and other text
+#   - streamed responses (exports), which are sent as they are produced
+#   - responses that are already encoded, and 304s/HEADs with no body
+# A compressed response's ETag becomes weak, since the bytes differ from the identity encoding;
+# If-None-Match checks must therefore use weak comparison (see cached_json_response in app.py).
+
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError: # Optional dependency; gzip is always available
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5 # Higher levels cost far more CPU per response for a few % smaller bodies
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml',
+}
+
+
+def _encoders():
+    encoders = {}
+    if brotli is not None:
+        encoders['br'] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+    encoders['gzip'] = lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return encoders
+
+
+def init_compression(app, min_html_bytes=None, min_bytes=None):
+    if min_html_bytes is None:
+        min_html_bytes = int(os.environ.get('COMPRESS_MIN_HTML_BYTES', 1024))
+    if min_bytes is None:
+        min_bytes = int(os.environ.get('COMPRESS_MIN_BYTES', 512))
+    encoders = _encoders()
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed or request.method == 'HEAD'
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        encoding = request.accept_encodings.best_match(list(encoders))
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < (min_html_bytes if response.mimetype == 'text/html' else min_bytes):
+            return response
+
+        response.set_data(encoders[encoding](data))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
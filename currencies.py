@@ -0,0 +1,68 @@
+# --- Currencies ---
+# Currency codes, display symbols and exchange-rate files. Amounts are stored in their own
+# currency; app.py converts them to each user's base currency inside the aggregate queries by
+# joining the exchange_rates table (see migrations/0007_currencies.sql).
+#
+# A rate is the value of one unit of the currency in a common reference currency, so only the
+# ratio between two rates matters: amount * rate(from) / rate(to). Rates files are CSV with
+# `currency,rate` rows; a header row and lines starting with # are skipped, e.g.
+#     currency,rate
+#     PHP,1
+#     USD,56.25
+#     EUR,61.10
+
+import csv
+import io
+import re
+from decimal import Decimal, InvalidOperation
+
+# Currency of existing rows and base currency of new users; matches migrations/0007_currencies.sql
+DEFAULT_CURRENCY = 'PHP'
+
+CURRENCY_RE = re.compile(r'^[A-Z]{3}$') # ISO 4217 alphabetic code
+
+CURRENCY_SYMBOLS = {
+    'PHP': '₱', 'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'CNY': '¥', 'KRW': '₩', 'INR': '₹',
+    'AUD': 'A$', 'CAD': 'C$', 'SGD': 'S$', 'HKD': 'HK$', 'NZD': 'NZ$', 'THB': '฿', 'VND': '₫',
+}
+
+
+def currency_symbol(code):
+    return CURRENCY_SYMBOLS.get(code, f'{code} ')
+
+
+def normalize_currency(value):
+    code = (value or '').strip().upper()
+    if not CURRENCY_RE.match(code):
+        raise ValueError(f'Invalid currency {value!r}; expected a three-letter code such as USD.')
+    return code
+
+
+def parse_rate(value):
+    try:
+        rate = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid exchange rate {value!r}.')
+    if not rate.is_finite() or rate <= 0 or rate >= Decimal('1e10'): # NUMERIC(20, 10)
+        raise ValueError(f'Exchange rate {value!r} must be a positive number.')
+    return rate
+
+
+def parse_rates_file(stream):
+    # Returns {currency: rate}; raises ValueError naming the first bad line
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    rates = {}
+    reader = csv.reader(stream)
+    for values in reader:
+        if not values or not ''.join(values).strip() or values[0].lstrip().startswith('#'):
+            continue
+        if reader.line_num == 1 and values[0].strip().lower() == 'currency':
+            continue # Header
+        if len(values) < 2:
+            raise ValueError(f'line {reader.line_num}: expected "currency,rate".')
+        try:
+            rates[normalize_currency(values[0])] = parse_rate(values[1])
+        except ValueError as e:
+            raise ValueError(f'line {reader.line_num}: {e}')
+    return rates
@@ -0,0 +1,34 @@
+# --- Gunicorn Configuration ---
+# Loaded by the Procfile (`gunicorn -c gunicorn.conf.py app:app`); every setting can be
+# overridden from the environment, and PORT / WEB_CONCURRENCY are read by gunicorn itself.
+#
+# WEB_WORKER_CLASS=sync (default): one request per worker process at a time.
+# WEB_WORKER_CLASS=gevent: each worker serves up to WEB_WORKER_CONNECTIONS requests
+#     concurrently, switching between them while they wait on Postgres. Needs the optional
+#     `gevent` and `psycogreen` packages (pip install gevent psycogreen); psycopg2 is made
+#     cooperative in post_worker_init, otherwise one slow query would block the whole worker.
+
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+
+if worker_class == 'gevent':
+    # Concurrent requests in one worker each hold a pooled connection while they query, so give
+    # the pool more room than the sync default; requests beyond it wait up to DB_POOL_TIMEOUT.
+    # Keep workers * (size + overflow) under the database's connection limit (see README).
+    os.environ.setdefault('DB_POOL_SIZE', '10')
+    os.environ.setdefault('DB_MAX_OVERFLOW', '20')
+
+
+def post_worker_init(worker):
+    # Runs after the gevent worker has monkey-patched the standard library, before any
+    # request is served (the app opens its database connections lazily)
+    if worker.__class__.__module__ != 'gunicorn.workers.ggevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        raise RuntimeError('WEB_WORKER_CLASS=gevent needs the psycogreen package (pip install psycogreen).')
+    patch_psycopg()
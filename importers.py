@@ -0,0 +1,165 @@
+# --- Transaction Importers ---
+# Streaming parsers for bank exports. Each parser reads the upload incrementally and
+# yields (line_number, raw_row) pairs, so memory use doesn't grow with file size.
+# parse_import_row() turns a raw row into the values app.py inserts, or raises
+# ValueError with a message suitable for the per-row error report.
+#
+# CSV columns (header names are case-insensitive; only date and amount are required):
+#     date, amount, type, category, description, currency
+# When `type` is missing, negative amounts are expenses and positive ones income. Rows without
+# a currency (and OFX statements without CURDEF) are in the user's base currency.
+
+import codecs
+import csv
+import io
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+IMPORT_FORMATS = ('csv', 'ofx')
+
+# Tried after ISO 8601 (datetime.fromisoformat)
+DATE_FORMATS = ('%m/%d/%Y', '%Y%m%d', '%Y-%m-%d')
+
+# Common alternative header names found in bank exports
+CSV_HEADER_ALIASES = {
+    'transaction date': 'date', 'posted date': 'date', 'posting date': 'date',
+    'value': 'amount', 'transaction amount': 'amount',
+    'memo': 'description', 'details': 'description', 'payee': 'description', 'name': 'description',
+    'category name': 'category',
+    'currency code': 'currency',
+}
+
+
+def detect_format(filename, explicit=None):
+    if not explicit and filename and '.' in filename:
+        explicit = filename.rsplit('.', 1)[-1]
+    fmt = (explicit or '').lower()
+    if fmt == 'qfx': # Quicken's OFX variant
+        fmt = 'ofx'
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported import format {fmt!r}; use one of: {", ".join(IMPORT_FORMATS)}.')
+    return fmt
+
+
+def _text_stream(stream):
+    # Decodes a binary upload lazily; utf-8-sig drops the BOM Excel likes to add
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return codecs.getreader('utf-8-sig')(stream, errors='replace')
+
+
+def iter_csv_rows(stream):
+    reader = csv.reader(_text_stream(stream))
+    try:
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = [CSV_HEADER_ALIASES.get(h.strip().lower(), h.strip().lower()) for h in header]
+        if 'date' not in columns or 'amount' not in columns:
+            raise ValueError('CSV header must include "date" and "amount" columns.')
+        for values in reader:
+            if not any(v.strip() for v in values):
+                continue # Skip blank lines
+            yield reader.line_num, dict(zip(columns, values))
+    except csv.Error as e:
+        # Malformed file (e.g. a field over csv.field_size_limit()); the rest can't be read reliably
+        raise ValueError(f'Unreadable CSV at line {reader.line_num}: {e}.') from e
+
+
+OFX_TAG_RE = re.compile(r'<(/?)(\w+)>([^<\r\n]*)')
+
+def iter_ofx_rows(stream):
+    # OFX 1.x is SGML (element closing tags optional) and 2.x is XML (possibly all on one line);
+    # both are handled by scanning <TAG>value tokens and emitting one row per <STMTTRN> block.
+    current = None
+    start_line = 0
+    currency = '' # Statement currency (CURDEF), which precedes its transactions
+    for line_number, line in enumerate(_text_stream(stream), start=1):
+        for closing, tag, value in OFX_TAG_RE.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if current: # Closing tag, or a new block after an unclosed one
+                    yield start_line, _ofx_to_row(current, currency)
+                current = None if closing else {}
+                start_line = line_number
+                if closing:
+                    continue
+            elif tag == 'CURDEF' and not closing:
+                currency = value.strip()
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+    if current: # Last block of an SGML file without a closing tag
+        yield start_line, _ofx_to_row(current, currency)
+
+
+def _ofx_to_row(fields, currency=''):
+    return {
+        'date': fields.get('DTPOSTED', '')[:8], # YYYYMMDD[HHMMSS[.XXX][TZ]]
+        'amount': fields.get('TRNAMT', ''),
+        'description': fields.get('NAME') or fields.get('MEMO') or '',
+        'currency': currency,
+    }
+
+
+def iter_import_rows(stream, fmt):
+    return iter_csv_rows(stream) if fmt == 'csv' else iter_ofx_rows(stream)
+
+
+def parse_amount(value):
+    text = (value or '').strip()
+    negative = text.startswith('(') and text.endswith(')') # Accounting notation
+    text = re.sub(r'[^0-9.\-]', '', text) # Drop currency symbols, thousands separators, spaces
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount {value!r}.')
+    return -abs(amount) if negative else amount
+
+
+def parse_date(value):
+    text = (value or '').strip()
+    try:
+        return datetime.fromisoformat(text) # Fast path for the common YYYY-MM-DD[THH:MM:SS]
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'Invalid date {value!r}; expected YYYY-MM-DD.')
+
+
+def parse_import_row(raw):
+    # Returns {'date', 'amount' (positive), 'type', 'category', 'description', 'currency' (or None)}
+    amount = parse_amount(raw.get('amount'))
+    transaction_type = (raw.get('type') or '').strip().lower()
+    if not transaction_type:
+        transaction_type = 'expense' if amount < 0 else 'income'
+    elif transaction_type not in ('income', 'expense'):
+        raise ValueError(f'Invalid type {raw.get("type")!r}; expected income or expense.')
+    amount = abs(amount)
+    if amount == 0:
+        raise ValueError('Amount must not be zero.')
+    if amount >= Decimal('1e13'): # Numeric(15, 2)
+        raise ValueError(f'Amount {amount} is too large.')
+
+    return {
+        'date': parse_date(raw.get('date')),
+        'amount': amount.quantize(Decimal('0.01')),
+        'type': transaction_type,
+        'category': (raw.get('category') or '').strip(),
+        'description': (raw.get('description') or '').strip() or None,
+        'currency': (raw.get('currency') or '').strip() or None, # Validated by app.py against the loaded rates
+    }
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,121 @@
+# --- Spending Insights ---
+# Trends, forecasts and unusual days computed with NumPy from one user's daily expense series
+# (the daily_rollups rows app.py fetches as three arrays in one query), as whole-array operations
+# rather than loops over rows. Everything here is pure: arrays in, plain Python values out.
+#
+# The series is laid out as a dense (category x day) matrix from the first day with spending to
+# today, so a few years of history is a few thousand cells per category:
+#   - rolling averages: trailing 7- and 30-day means of the daily totals, from a cumulative sum
+#   - month over month: each category's month-to-date spending against the same days last month
+#   - forecast: month-to-date plus the remaining days at the average spend of their weekday over
+#     the last FORECAST_WEEKS weeks, with a range from the spread of those days
+#   - unusual days: per category, the z-score of each recent day's spending against the
+#     category's days with spending before the window; app.py looks up the largest
+#     transactions of the flagged days
+
+from datetime import date, timedelta
+
+import numpy as np
+
+ROLLING_WINDOWS = (7, 30)
+FORECAST_WEEKS = 8
+FORECAST_Z = 1.645 # ~90% range, treating the remaining days as independent
+OUTLIER_DAYS = 30 # Recent days checked for unusual spending
+OUTLIER_Z = 3.0
+OUTLIER_MIN_DAYS = 8 # Days with spending a category needs before the window to be scored
+
+
+class DailySeries:
+    def __init__(self, day_ordinals, category_ids, amounts, today):
+        # Parallel per-row sequences: date.toordinal() of the day, category id (0 = uncategorized)
+        # and amount. Rows for the same (day, category) are summed.
+        self.today = today
+        ordinals = np.asarray(day_ordinals, dtype=np.int64)
+        # At least from the start of last month, for the month-over-month comparison
+        previous_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        self.first_day = min(date.fromordinal(int(ordinals.min())), previous_month) if len(ordinals) else previous_month
+        n_days = today.toordinal() - self.first_day.toordinal() + 1
+
+        self.category_ids, category_index = np.unique(np.asarray(category_ids, dtype=np.int64), return_inverse=True)
+        keep = ordinals <= today.toordinal() # Future-dated transactions are left out
+        cells = category_index[keep] * n_days + (ordinals[keep] - self.first_day.toordinal())
+        self.matrix = np.bincount(cells, weights=np.asarray(amounts, dtype=np.float64)[keep],
+                                  minlength=len(self.category_ids) * n_days).reshape(len(self.category_ids), n_days)
+        self.totals = self.matrix.sum(axis=0)
+        self.weekdays = (self.first_day.weekday() + np.arange(n_days)) % 7
+
+    def day_index(self, day):
+        return day.toordinal() - self.first_day.toordinal()
+
+    def day(self, index):
+        return self.first_day + timedelta(days=int(index))
+
+
+def rolling_averages(series, n_days):
+    # Last n_days of daily totals with their trailing means (over fewer days at the start of history)
+    cumulative = np.concatenate(([0.0], np.cumsum(series.totals)))
+    end = np.arange(1, len(series.totals) + 1)[-n_days:]
+    result = {
+        'labels': [series.day(i - 1).isoformat() for i in end],
+        'amounts': np.round(series.totals[-n_days:], 2).tolist(),
+    }
+    for window in ROLLING_WINDOWS:
+        start = np.maximum(end - window, 0)
+        result[f'rolling{window}'] = np.round((cumulative[end] - cumulative[start]) / (end - start), 2).tolist()
+    return result
+
+
+def month_over_month(series):
+    # {category_id: (this month to date, same days of last month, all of last month)}
+    month_start = series.today.replace(day=1)
+    previous_start = (month_start - timedelta(days=1)).replace(day=1)
+    # Same span of last month, clipped to its length (March 31 compares with February 1-28/29)
+    previous_same = min(previous_start + timedelta(days=series.today.day - 1), month_start - timedelta(days=1))
+    this_month = series.matrix[:, series.day_index(month_start):].sum(axis=1)
+    previous_cumulative = np.cumsum(series.matrix[:, series.day_index(previous_start):series.day_index(month_start)], axis=1)
+    same_days = previous_cumulative[:, series.day_index(previous_same) - series.day_index(previous_start)]
+    full_month = previous_cumulative[:, -1]
+    return {int(c): (round(float(a), 2), round(float(b), 2), round(float(m), 2))
+            for c, a, b, m in zip(series.category_ids, this_month, same_days, full_month)}
+
+
+def month_forecast(series):
+    today = series.today
+    month_start = today.replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    month_to_date = float(series.totals[series.day_index(month_start):].sum())
+
+    # Complete days only (not today) from the last FORECAST_WEEKS weeks, by weekday
+    first = max(0, len(series.totals) - 1 - FORECAST_WEEKS * 7)
+    history, weekdays = series.totals[first:-1], series.weekdays[first:-1]
+    profile = np.bincount(weekdays, weights=history, minlength=7) / np.maximum(np.bincount(weekdays, minlength=7), 1)
+    remaining = (today.weekday() + np.arange(1, (month_end - today).days + 1)) % 7
+    projected_rest = float(profile[remaining].sum())
+    spread = FORECAST_Z * float(history.std(ddof=1) if len(history) > 1 else 0.0) * float(np.sqrt(len(remaining)))
+    return {
+        'monthToDate': round(month_to_date, 2),
+        'projected': round(month_to_date + projected_rest, 2),
+        'low': round(month_to_date + max(0.0, projected_rest - spread), 2),
+        'high': round(month_to_date + projected_rest + spread, 2),
+        'daysRemaining': len(remaining),
+    }
+
+
+def unusual_days(series, limit=20):
+    # [(day, category_id, amount, category mean, z-score)], highest z first
+    window_start = max(0, len(series.totals) - OUTLIER_DAYS)
+    baseline = series.matrix[:, :window_start]
+    spent = baseline > 0
+    n = spent.sum(axis=1)
+    mean = baseline.sum(axis=1) / np.maximum(n, 1)
+    variance = ((baseline - mean[:, None]) ** 2 * spent).sum(axis=1) / np.maximum(n - 1, 1)
+    std = np.sqrt(variance)
+
+    recent = series.matrix[:, window_start:]
+    scored = (n >= OUTLIER_MIN_DAYS) & (std > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(scored[:, None] & (recent > 0), (recent - mean[:, None]) / std[:, None], 0.0)
+    rows, columns = np.nonzero(z >= OUTLIER_Z)
+    order = np.argsort(-z[rows, columns])[:limit]
+    return [(series.day(window_start + columns[i]), int(series.category_ids[rows[i]]), round(float(recent[rows[i], columns[i]]), 2),
+             round(float(mean[rows[i]]), 2), round(float(z[rows[i], columns[i]]), 2)) for i in order]
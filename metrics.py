@@ -0,0 +1,194 @@
+# --- Request Metrics ---
+# Per-endpoint request latency, SQL statement counts, DB time and template render
+# time, rendered in the Prometheus text exposition format by app.py's /metrics route.
+#
+# init_metrics(app) wires everything up:
+#   - before/after_request hooks time each request by endpoint, method and status
+#   - SQLAlchemy cursor events count statements and DB time for the current request,
+#     and log statements slower than SLOW_QUERY_MS (default 500; 0 disables the log)
+#   - Flask's template signals time each render by template name
+#
+# Values are kept in-process, so with several gunicorn workers each scrape sees one
+# worker; every sample carries a `pid` label so the series don't overwrite each other.
+
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values -> total
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self, extra_labels=()):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = tuple(zip(self.labelnames, key)) + extra_labels
+                lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {} # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self, extra_labels=()):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                labels = tuple(zip(self.labelnames, key)) + extra_labels
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('budget_http_request_duration_seconds',
+                            'Time spent handling a request, until the response headers are ready.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_STATEMENTS = Histogram('budget_db_statements_per_request',
+                               'SQL statements issued while handling one request.',
+                               ('endpoint',), buckets=STATEMENT_BUCKETS)
+DB_STATEMENTS = Counter('budget_db_statements_total', 'SQL statements executed, by endpoint.', ('endpoint',))
+DB_TIME = Counter('budget_db_time_seconds_total', 'Time spent waiting on SQL statements, by endpoint.', ('endpoint',))
+SLOW_QUERIES = Counter('budget_db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS, by endpoint.',
+                       ('endpoint',))
+TEMPLATE_RENDER = Histogram('budget_template_render_seconds', 'Time spent rendering a template.', ('template',))
+
+METRICS = [REQUEST_LATENCY, REQUEST_STATEMENTS, DB_STATEMENTS, DB_TIME, SLOW_QUERIES, TEMPLATE_RENDER]
+
+def gauge_lines(name, help_text, samples, extra_labels=()):
+    # Exposition lines for a gauge read at scrape time; samples are [(labels, value), ...]
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(tuple(labels) + tuple(extra_labels))} {value}')
+    return lines
+
+
+# Extra collectors registered by the app, each called with the extra labels (pid) and
+# returning a list of exposition lines
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+    return collector
+
+
+def render_metrics():
+    extra_labels = (('pid', os.getpid()),)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(extra_labels))
+    for collector in _collectors:
+        lines.extend(collector(extra_labels))
+    return '\n'.join(lines) + '\n'
+
+
+def _endpoint_label():
+    # Unmatched URLs (404s) have no endpoint; group them instead of one series per path
+    return request.endpoint or '<unmatched>'
+
+
+def init_metrics(app, slow_query_ms=None):
+    if slow_query_ms is None:
+        slow_query_ms = float(os.environ.get('SLOW_QUERY_MS', 500))
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = 0
+        g.metrics_db_time = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        endpoint = _endpoint_label()
+        REQUEST_LATENCY.observe(time.perf_counter() - started,
+                                endpoint=endpoint, method=request.method, status=str(response.status_code))
+        REQUEST_STATEMENTS.observe(g.metrics_statements, endpoint=endpoint)
+        if g.metrics_statements:
+            DB_STATEMENTS.inc(g.metrics_statements, endpoint=endpoint)
+            DB_TIME.inc(g.metrics_db_time, endpoint=endpoint)
+        return response
+
+    # Listening on the Engine class covers the engine Flask-SQLAlchemy creates lazily
+    # The start time lives on the statement's execution context, which is dropped with the
+    # statement, so one that raises (and never reaches after_cursor_execute) leaves nothing behind
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_query_start = time.perf_counter()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_query_start', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        in_request = has_request_context() and 'metrics_started' in g
+        if in_request:
+            g.metrics_statements += 1
+            g.metrics_db_time += elapsed
+        if slow_query_ms and elapsed * 1000 >= slow_query_ms:
+            endpoint = _endpoint_label() if in_request else '<cli>'
+            SLOW_QUERIES.inc(endpoint=endpoint)
+            app.logger.warning('Slow query (%.0f ms, %s): %s', elapsed * 1000, endpoint, ' '.join(statement.split()))
+
+    @before_render_template.connect_via(app)
+    def start_template_timer(sender, template, context, **extra):
+        g.setdefault('metrics_template_starts', []).append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def record_template_render(sender, template, context, **extra):
+        starts = g.get('metrics_template_starts')
+        if starts:
+            TEMPLATE_RENDER.observe(time.perf_counter() - starts.pop(), template=template.name or '<string>')
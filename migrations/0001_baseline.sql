@@ -0,0 +1,50 @@
+-- Baseline schema. Uses IF NOT EXISTS so it can be applied to the existing
+-- Supabase database (where users/categories/transactions already exist).
+
+CREATE TABLE IF NOT EXISTS users (
+    id BIGSERIAL PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL, -- 'income' or 'expense'
+    color TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT _user_name_uc UNIQUE (user_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    category_id BIGINT REFERENCES categories (id) ON DELETE SET NULL,
+    type TEXT NOT NULL, -- 'income' or 'expense'
+    amount NUMERIC(15, 2) NOT NULL,
+    description TEXT,
+    date TIMESTAMPTZ NOT NULL DEFAULT now(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Materialized per-user totals (see UserBalance in app.py)
+CREATE TABLE IF NOT EXISTS user_balances (
+    user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+    total_income NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    total_expense NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    transaction_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Pre-aggregated chart data (see DailyRollup in app.py). category_id 0 = uncategorized.
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    type TEXT NOT NULL,
+    category_id BIGINT NOT NULL DEFAULT 0,
+    total_amount NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    transaction_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, type, category_id)
+);
@@ -0,0 +1,17 @@
+-- Composite indexes matching the per-user access patterns in app.py.
+
+-- Type + date range filters (chart 'today' bucket, rollup rebuilds, filtered history pages)
+CREATE INDEX IF NOT EXISTS ix_transactions_user_type_date
+    ON transactions (user_id, type, date);
+
+-- History ordering and its keyset cursor: ORDER BY date DESC, created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS ix_transactions_user_date_created
+    ON transactions (user_id, date DESC, created_at DESC, id DESC);
+
+-- Category filters, and the ON DELETE SET NULL performed when a category is deleted
+CREATE INDEX IF NOT EXISTS ix_transactions_user_category
+    ON transactions (user_id, category_id);
+
+-- Category dropdowns filter by type; (user_id, name) is already covered by _user_name_uc
+CREATE INDEX IF NOT EXISTS ix_categories_user_type
+    ON categories (user_id, type);
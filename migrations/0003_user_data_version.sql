@@ -0,0 +1,3 @@
+-- Per-user counter bumped by every transaction/category write; cached chart
+-- responses and their ETags are tied to it (see cached_json_response in app.py).
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
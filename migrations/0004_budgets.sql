@@ -0,0 +1,28 @@
+-- Spending limits per expense category (or on all expenses when category_id is NULL),
+-- per calendar month or ISO week, and the spending within each period. budget_usage is
+-- maintained incrementally by the transaction write routes (see apply_transaction_deltas
+-- in app.py) and can be rebuilt from daily_rollups with `flask rebuild-aggregates`.
+CREATE TABLE IF NOT EXISTS budgets (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    category_id BIGINT REFERENCES categories (id) ON DELETE CASCADE,
+    period TEXT NOT NULL CHECK (period IN ('month', 'week')),
+    amount NUMERIC(15, 2) NOT NULL CHECK (amount > 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- One budget per category (or overall) and period; 0 stands in for NULL so overall budgets are unique too
+CREATE UNIQUE INDEX IF NOT EXISTS ux_budgets_user_category_period
+    ON budgets (user_id, COALESCE(category_id, 0), period);
+
+CREATE INDEX IF NOT EXISTS ix_budgets_user_category ON budgets (user_id, category_id);
+CREATE INDEX IF NOT EXISTS ix_budgets_category ON budgets (category_id);
+
+CREATE TABLE IF NOT EXISTS budget_usage (
+    budget_id BIGINT NOT NULL REFERENCES budgets (id) ON DELETE CASCADE,
+    period_start DATE NOT NULL,
+    spent NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    transaction_count BIGINT NOT NULL DEFAULT 0,
+    over_limit BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (budget_id, period_start)
+);
@@ -0,0 +1,26 @@
+-- Schedules that materialize into ordinary transactions (see `flask run-recurring` in app.py).
+-- next_date is the first occurrence not yet written; the job advances it after each run.
+CREATE TABLE IF NOT EXISTS recurring_transactions (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    category_id BIGINT REFERENCES categories (id) ON DELETE SET NULL,
+    type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
+    amount NUMERIC(15, 2) NOT NULL CHECK (amount > 0),
+    description TEXT,
+    frequency TEXT NOT NULL CHECK (frequency IN ('daily', 'weekly', 'monthly', 'custom')),
+    interval INTEGER NOT NULL DEFAULT 1 CHECK (interval > 0),
+    start_date DATE NOT NULL,
+    end_date DATE,
+    next_date DATE NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_recurring_transactions_next_date ON recurring_transactions (next_date);
+CREATE INDEX IF NOT EXISTS ix_recurring_transactions_user ON recurring_transactions (user_id);
+
+-- Links a materialized transaction to its schedule. The unique index makes the job idempotent:
+-- re-running it (or two runs racing) can't write the same occurrence twice.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS recurring_id BIGINT
+    REFERENCES recurring_transactions (id) ON DELETE SET NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_transactions_recurring_date
+    ON transactions (recurring_id, date) WHERE recurring_id IS NOT NULL;
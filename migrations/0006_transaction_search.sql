@@ -0,0 +1,27 @@
+-- Description search for /search_transactions (see app.py).
+-- Word search uses a generated tsvector column with a GIN index; the 'simple' configuration
+-- lowercases but doesn't stem, so it behaves the same for English and Filipino descriptions.
+-- Adding a stored generated column rewrites the table once.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS description_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED;
+CREATE INDEX IF NOT EXISTS ix_transactions_description_tsv ON transactions USING gin (description_tsv);
+
+-- Substring search (ILIKE '%...%', single-word queries only) uses a trigram index when pg_trgm
+-- is available (it is on Supabase). Without it substrings still match, but by filtering every
+-- one of the user's rows, which takes most of a second for a rare word at 1M rows.
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm is not available; skipping the trigram index on transactions.description';
+END
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS ix_transactions_description_trgm
+            ON transactions USING gin (description gin_trgm_ops);
+    END IF;
+END
+$$;
@@ -0,0 +1,31 @@
+-- Multi-currency: every transaction and recurring schedule has a currency, and every user a
+-- base currency that their totals, charts and budgets are reported in. Existing rows are PHP,
+-- the currency the app has always displayed.
+--
+-- exchange_rates holds one rate per currency: the value of one unit in a common reference
+-- currency, loaded with `flask load-rates` / `flask set-rate` (there is no network source).
+-- Aggregates keep amounts in their own currency and are converted when read, by joining this
+-- table (see currencies.py and to_base_currency in app.py). Rates are never deleted by the app.
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    currency TEXT PRIMARY KEY CHECK (currency ~ '^[A-Z]{3}$'),
+    rate NUMERIC(20, 10) NOT NULL CHECK (rate > 0),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO exchange_rates (currency, rate) VALUES ('PHP', 1) ON CONFLICT (currency) DO NOTHING;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS base_currency TEXT NOT NULL DEFAULT 'PHP'
+    REFERENCES exchange_rates (currency);
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS currency TEXT NOT NULL DEFAULT 'PHP'
+    REFERENCES exchange_rates (currency);
+ALTER TABLE recurring_transactions ADD COLUMN IF NOT EXISTS currency TEXT NOT NULL DEFAULT 'PHP'
+    REFERENCES exchange_rates (currency);
+
+-- The aggregates gain currency as a key column: one balance row per user and currency, and
+-- rollups per (user, day, type, category, currency)
+ALTER TABLE user_balances ADD COLUMN IF NOT EXISTS currency TEXT NOT NULL DEFAULT 'PHP';
+ALTER TABLE user_balances DROP CONSTRAINT IF EXISTS user_balances_pkey;
+ALTER TABLE user_balances ADD PRIMARY KEY (user_id, currency);
+
+ALTER TABLE daily_rollups ADD COLUMN IF NOT EXISTS currency TEXT NOT NULL DEFAULT 'PHP';
+ALTER TABLE daily_rollups DROP CONSTRAINT IF EXISTS daily_rollups_pkey;
+ALTER TABLE daily_rollups ADD PRIMARY KEY (user_id, day, type, category_id, currency);
@@ -0,0 +1,11 @@
+-- Failed sign-ins per throttling key, for login throttling (see "Login Throttling" in app.py).
+-- Keys are 'user:<lowercased username>' and 'ip:<client address>'. A key is locked out once its
+-- failures within the current window reach the limit, until the window ends; expired rows are
+-- pruned by the statement that records a failure, through the window_start index.
+CREATE TABLE IF NOT EXISTS login_failures (
+    key TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    window_start TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_login_failures_window_start ON login_failures (window_start);
@@ -0,0 +1,35 @@
+-- Monthly and yearly account statements (see "Statements" in app.py). A row is both the
+-- statement and its generation job: the web app and `flask queue-statements` queue it, and
+-- `flask run-statements` workers claim queued rows with SKIP LOCKED and render them.
+-- run_after is when a worker may take the row next: now or a retry backoff while 'queued', and
+-- the end of the worker's claim while 'running', so a crashed worker's job is picked up again.
+CREATE TABLE IF NOT EXISTS statements (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    period TEXT NOT NULL CHECK (period IN ('month', 'year')),
+    period_start DATE NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'ready', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    error TEXT,
+    -- The user's data_version when the files were last checked, and a digest of the data they
+    -- were rendered from; a write only leads to re-rendering if the period's digest changed
+    data_version BIGINT,
+    source_digest TEXT,
+    generated_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    UNIQUE (user_id, period, period_start)
+);
+
+-- The workers' claim order, over the rows that still need work
+CREATE INDEX IF NOT EXISTS ix_statements_pending ON statements (run_after, id)
+    WHERE status IN ('queued', 'running');
+
+-- Rendered files, one per format. A regenerated statement replaces them in the same transaction
+-- that marks it ready, so downloads never see a mix of versions.
+CREATE TABLE IF NOT EXISTS statement_files (
+    statement_id BIGINT NOT NULL REFERENCES statements (id) ON DELETE CASCADE,
+    format TEXT NOT NULL,
+    content BYTEA NOT NULL,
+    PRIMARY KEY (statement_id, format)
+);
@@ -0,0 +1,123 @@
+# --- Password Hashing ---
+# Hashes and checks passwords under a machine-wide cap: at most PASSWORD_HASH_SLOTS hashes run at
+# once across all worker processes on this host, so a burst of logins can only occupy that many
+# cores and the rest of the requests keep moving. A hash that can't get a slot within
+# PASSWORD_HASH_WAIT raises PasswordHashBusy, which app.py answers with 503 and Retry-After.
+#
+#   PASSWORD_HASH_METHOD   werkzeug method string (default scrypt:32768:8:1, werkzeug's own
+#                          default). Stored hashes made with other parameters are upgraded on
+#                          the user's next successful login (see needs_rehash).
+#   PASSWORD_HASH_SLOTS    hashes computed at once on this machine (default: half its cores,
+#                          at least 1; 0 hashes inline without a limit)
+#   PASSWORD_HASH_WAIT     seconds a hash may wait for a free slot (default 0.25)
+#   PASSWORD_HASH_LOCK_DIR directory of the slot lock files (default: the temp directory)
+#
+# The slots are flock()ed files shared by every gunicorn worker, whatever the worker class; the
+# kernel releases a slot when its holder exits, so a killed worker never leaks one. Without
+# fcntl (Windows) the cap only covers the current process.
+#
+# hashlib's scrypt and PBKDF2 release the GIL, so gthread workers hash in parallel on their own
+# threads. Under gevent workers the hash runs on one of gevent's native thread pools, so the
+# worker keeps serving other requests while it runs instead of blocking its event loop. A sync
+# worker waits for its own hash, but a login burst can hold at most PASSWORD_HASH_SLOTS workers
+# for the length of a hash; the others get their 503 within PASSWORD_HASH_WAIT.
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows; slots are then counted per process
+    fcntl = None
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+def normalize_method(method):
+    # The method as werkzeug writes it into the hash, defaults filled in: 'scrypt' -> 'scrypt:32768:8:1'
+    name, *args = method.split(':')
+    if name == 'scrypt' and len(args) in (0, 3):
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    if name == 'pbkdf2' and len(args) <= 2:
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f'Unsupported PASSWORD_HASH_METHOD {method!r}; use scrypt[:n:r:p] or pbkdf2[:hash[:iterations]].')
+
+
+def _gevent_patched():
+    if 'gevent.monkey' not in sys.modules:
+        return False
+    return sys.modules['gevent.monkey'].is_module_patched('threading')
+
+
+class PasswordHasher:
+    def __init__(self, method=None, slots=None, wait=None, lock_dir=None):
+        self.method = normalize_method(method or os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        default_slots = max(1, (os.cpu_count() or 2) // 2)
+        self.slots = int(os.environ.get('PASSWORD_HASH_SLOTS', default_slots)) if slots is None else slots
+        self.wait = float(os.environ.get('PASSWORD_HASH_WAIT', 0.25)) if wait is None else wait
+        self.lock_dir = lock_dir or os.environ.get('PASSWORD_HASH_LOCK_DIR') or tempfile.gettempdir()
+        self._local_slots = threading.BoundedSemaphore(self.slots) if self.slots and fcntl is None else None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def _run(self, fn, *args):
+        if not self.slots:
+            return fn(*args)
+        release = self._acquire_slot()
+        try:
+            if _gevent_patched():
+                return self._get_pool().apply(fn, args)
+            return fn(*args)
+        finally:
+            release()
+
+    def _acquire_slot(self):
+        # Returns a function that gives the slot back; raises PasswordHashBusy after self.wait
+        if self._local_slots is not None:
+            if not self._local_slots.acquire(timeout=self.wait):
+                raise PasswordHashBusy()
+            return self._local_slots.release
+        deadline = time.monotonic() + self.wait
+        while True:
+            for slot in range(self.slots):
+                path = os.path.join(self.lock_dir, f'budget-tracker-password-hash-{slot}.lock')
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                return lambda: os.close(fd) # Closing the file releases its lock
+            if time.monotonic() >= deadline:
+                raise PasswordHashBusy()
+            time.sleep(0.01) # Cooperative under gevent
+
+    def _get_pool(self):
+        # Created on first use, i.e. in the gunicorn worker after the fork and gevent's patching
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    from gevent.threadpool import ThreadPool
+                    self._pool = ThreadPool(self.slots)
+        return self._pool
@@ -0,0 +1,150 @@
+# --- Period Windows ---
+# Date arithmetic for the period selectors (today/week/month/year/all) and custom date ranges,
+# in the app's timezone rather than the server's. app.py turns a PeriodWindow into SQL filters
+# and a generate_series of buckets; this module has no database code.
+#
+# APP_TIMEZONE (an IANA name such as Asia/Manila, default UTC) decides where "today" starts and
+# which calendar day a transaction belongs to. Rollups are bucketed by it, so run
+# `flask rebuild-aggregates` after changing it.
+
+import os
+from datetime import datetime, time, timedelta
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+PERIODS = ('today', 'week', 'month', 'year', 'all')
+
+APP_TIMEZONE_NAME = os.environ.get('APP_TIMEZONE', 'UTC')
+APP_TIMEZONE = ZoneInfo(APP_TIMEZONE_NAME)
+
+# Longest custom range that is still charted by hour / by day / by month
+HOURLY_MAX_DAYS = 2
+DAILY_MAX_DAYS = 62
+MONTHLY_MAX_DAYS = 3 * 366
+
+
+def now():
+    return datetime.now(APP_TIMEZONE)
+
+
+def today():
+    return now().date()
+
+
+def localize(value):
+    # Naive datetimes (form dates, imported rows) are wall-clock times in APP_TIMEZONE
+    if value.tzinfo is None:
+        return value.replace(tzinfo=APP_TIMEZONE)
+    return value.astimezone(APP_TIMEZONE)
+
+
+def local_day(value):
+    # Calendar day a transaction falls on; dates pass through unchanged
+    if isinstance(value, datetime):
+        return localize(value).date()
+    return value
+
+
+def day_start(day):
+    return datetime.combine(day, time.min, tzinfo=APP_TIMEZONE)
+
+
+def bucket_start(value, unit):
+    # Truncates a local date (or naive local datetime, for hours) to the start of its bucket
+    if unit == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    if unit == 'month':
+        return value.replace(day=1)
+    if unit == 'year':
+        return value.replace(month=1, day=1)
+    return value
+
+
+class PeriodWindow(NamedTuple):
+    period: str                 # One of PERIODS, or 'custom'
+    start: Optional[datetime]   # First instant included (aware); None = since the first transaction
+    end: datetime               # First instant excluded (aware)
+    unit: str                   # Bucket size: 'hour', 'day', 'month' or 'year'
+    first_bucket: Optional[object] # Series bounds: naive local datetimes for hours, dates otherwise;
+    last_bucket: object            # first_bucket is None for 'all' (starts at the first transaction)
+
+    @property
+    def first_day(self):
+        return self.start.date() if self.start else None
+
+    @property
+    def last_day(self):
+        return (self.end - timedelta(microseconds=1)).date()
+
+
+def period_window(period, current=None):
+    # The window charted for a period selector: it starts at the beginning of the current
+    # day/week/month/year and runs up to `current` (default now). The bucket series covers the
+    # whole day/week/year, but only up to today for 'month', as the month chart always has.
+    current = localize(current) if current else now()
+    current_day = current.date()
+    if period == 'today':
+        start_day = current_day
+        midnight = datetime.combine(current_day, time.min)
+        return PeriodWindow(period, day_start(start_day), current, 'hour', midnight, midnight + timedelta(hours=23))
+    if period == 'week':
+        start_day = current_day - timedelta(days=current_day.weekday()) # Monday
+        return PeriodWindow(period, day_start(start_day), current, 'day', start_day, start_day + timedelta(days=6))
+    if period == 'month':
+        start_day = current_day.replace(day=1)
+        return PeriodWindow(period, day_start(start_day), current, 'day', start_day, current_day)
+    if period == 'year':
+        start_day = current_day.replace(month=1, day=1)
+        return PeriodWindow(period, day_start(start_day), current, 'month', start_day, current_day.replace(month=12, day=1))
+    if period == 'all':
+        return PeriodWindow(period, None, current, 'year', None, current_day.replace(month=1, day=1))
+    raise ValueError(f'period must be one of: {", ".join(PERIODS)}.')
+
+
+def custom_window(start_day, end_day):
+    # Both days inclusive; the bucket size grows with the length of the range
+    if end_day < start_day:
+        raise ValueError('end_date must not be before start_date.')
+    days = (end_day - start_day).days + 1
+    if days <= HOURLY_MAX_DAYS:
+        unit = 'hour'
+        first_bucket = datetime.combine(start_day, time.min)
+        last_bucket = datetime.combine(end_day, time.min) + timedelta(hours=23)
+    else:
+        unit = 'day' if days <= DAILY_MAX_DAYS else 'month' if days <= MONTHLY_MAX_DAYS else 'year'
+        first_bucket = bucket_start(start_day, unit)
+        last_bucket = bucket_start(end_day, unit)
+    return PeriodWindow('custom', day_start(start_day), day_start(end_day + timedelta(days=1)), unit,
+                        first_bucket, last_bucket)
+
+
+def parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format.')
+
+
+def window_from_args(args, default_period='month'):
+    # start_date and end_date (YYYY-MM-DD) select a custom range, otherwise `period` does
+    if args.get('start_date') or args.get('end_date'):
+        return custom_window(parse_day(args.get('start_date'), 'start_date'),
+                             parse_day(args.get('end_date'), 'end_date'))
+    return period_window(args.get('period') or default_period)
+
+
+def bucket_label_format(window, first_bucket=None):
+    # PostgreSQL to_char() pattern for bucket labels. Labels only repeat if the window spans more
+    # than one of the next larger unit, so those windows get a longer label ("Mar 31", "Jan 2024").
+    first_bucket = first_bucket or window.first_bucket
+    last_bucket = window.last_bucket
+    if window.unit == 'hour':
+        return 'HH24:00' if first_bucket.date() == last_bucket.date() else 'Mon DD HH24:00'
+    if window.unit == 'day':
+        if window.period == 'week':
+            return 'Dy DD'
+        same_month = first_bucket is not None and (first_bucket.year, first_bucket.month) == (last_bucket.year, last_bucket.month)
+        return 'DD' if same_month else 'Mon DD'
+    if window.unit == 'month':
+        return 'Mon' if first_bucket is not None and first_bucket.year == last_bucket.year else 'Mon YYYY'
+    return 'YYYY'
@@ -0,0 +1,58 @@
+# --- Recurring Schedules ---
+# Date arithmetic for recurring transactions; app.py owns the model and the job that
+# writes the occurrences (materialize_recurring / `flask run-recurring`).
+#
+# A schedule is (start_date, frequency, interval):
+#     daily   - every `interval` days
+#     weekly  - every `interval` weeks, on start_date's weekday
+#     monthly - every `interval` months, on start_date's day (clamped to shorter months,
+#               so a schedule starting Jan 31 falls on Feb 28/29, then Mar 31)
+#     custom  - every `interval` days (for schedules like "every 10 days")
+# Occurrences are always computed from start_date, never from the previous occurrence,
+# so month-end clamping doesn't drift.
+
+import calendar
+from datetime import date, timedelta
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'custom')
+
+_DAYS_PER_STEP = {'daily': 1, 'weekly': 7, 'custom': 1}
+
+
+def add_months(value, months):
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence(start, frequency, interval, index):
+    # The index-th occurrence (0 = start)
+    if frequency == 'monthly':
+        return add_months(start, index * interval)
+    return start + timedelta(days=_DAYS_PER_STEP[frequency] * interval * index)
+
+
+def first_index_on_or_after(start, frequency, interval, value):
+    if value <= start:
+        return 0
+    if frequency == 'monthly':
+        index = ((value.year - start.year) * 12 + value.month - start.month) // interval
+    else:
+        index = (value - start).days // (_DAYS_PER_STEP[frequency] * interval)
+    while occurrence(start, frequency, interval, index) < value: # At most one step short
+        index += 1
+    return index
+
+
+def due_occurrences(start, frequency, interval, next_date, through, end_date=None):
+    # Occurrences from next_date up to `through` (and end_date, if any), plus the first
+    # occurrence after them, which becomes the schedule's new next_date
+    last = min(through, end_date) if end_date else through
+    index = first_index_on_or_after(start, frequency, interval, next_date)
+    dates = []
+    current = occurrence(start, frequency, interval, index)
+    while current <= last:
+        dates.append(current)
+        index += 1
+        current = occurrence(start, frequency, interval, index)
+    return dates, current
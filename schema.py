@@ -0,0 +1,71 @@
+# --- Schema Migrations ---
+# Minimal migration runner for the plain-SQL files in migrations/.
+# Each file is applied once, in filename order, inside its own transaction,
+# and recorded in the schema_migrations table.
+#
+# Used by the `flask db-upgrade` / `flask db-status` commands in app.py.
+
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Arbitrary constant for pg_advisory_xact_lock, so two deploys can't apply migrations at once
+MIGRATIONS_LOCK_ID = 720415
+
+
+def list_migrations():
+    # [(version, path), ...] sorted by filename, e.g. ('0002_composite_indexes', '.../0002_composite_indexes.sql')
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith('.sql'):
+            migrations.append((filename[:-len('.sql')], os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        '    version TEXT PRIMARY KEY,'
+        '    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()'
+        ')'
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as connection:
+        _ensure_migrations_table(connection)
+        return {row[0] for row in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [(version, path) for version, path in list_migrations() if version not in applied]
+
+
+def apply_migrations(engine, echo=print):
+    # Returns the list of versions applied by this call
+    applied_now = []
+    for version, path in list_migrations():
+        with engine.begin() as connection:
+            _ensure_migrations_table(connection)
+            connection.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': MIGRATIONS_LOCK_ID})
+            already_applied = connection.execute(
+                text('SELECT 1 FROM schema_migrations WHERE version = :version'), {'version': version}
+            ).first()
+            if already_applied:
+                continue
+
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            # no_parameters: run the file as-is, so '%' in SQL isn't treated as a bind placeholder
+            connection.execution_options(no_parameters=True).exec_driver_sql(sql)
+            connection.execute(
+                text('INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)'),
+                {'version': version, 'applied_at': datetime.now()}
+            )
+            echo(f'Applied {version}')
+            applied_now.append(version)
+    return applied_now
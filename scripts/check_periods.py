@@ -0,0 +1,163 @@
+# Period-window check: asserts the windows, bucket series and labels periods.py
+# produces for each period selector and for custom ranges (including DST changes
+# and month/year boundaries), then drives the chart endpoints against a local
+# PostgreSQL database to check that the SQL gap-filling returns one bucket per
+# label, in order, and that the buckets add up to the category totals.
+#
+# Usage (DATABASE_URL must point at a local, disposable database):
+#     python scripts/check_periods.py [--transactions 2000]
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from route_probe import delete_seeded_users, logged_in_client, prepare_database, seed_users
+
+import periods
+
+failures = []
+
+
+def check(condition, message):
+    if not condition:
+        failures.append(message)
+        print(f'FAIL {message}')
+
+
+def check_period_windows():
+    current = datetime(2024, 3, 31, 15, 30, tzinfo=periods.APP_TIMEZONE) # A Sunday, in a leap year
+
+    today = periods.period_window('today', current)
+    check(today.start == periods.day_start(date(2024, 3, 31)) and today.end == current, 'today starts at local midnight')
+    check(today.unit == 'hour' and today.last_bucket - today.first_bucket == timedelta(hours=23),
+          'today has 24 hour buckets')
+    check(periods.bucket_label_format(today) == 'HH24:00', 'today is labelled by hour')
+
+    week = periods.period_window('week', current)
+    check(week.first_bucket == date(2024, 3, 25) and week.last_bucket == date(2024, 3, 31), 'week runs Monday to Sunday')
+    check(periods.bucket_label_format(week) == 'Dy DD', 'week days are labelled with their weekday')
+
+    month = periods.period_window('month', current)
+    check(month.first_bucket == date(2024, 3, 1) and month.last_bucket == date(2024, 3, 31), 'month runs to today')
+    check(month.first_day == date(2024, 3, 1) and month.last_day == date(2024, 3, 31), 'month covers whole days')
+
+    year = periods.period_window('year', current)
+    check(year.unit == 'month' and (year.first_bucket, year.last_bucket) == (date(2024, 1, 1), date(2024, 12, 1)),
+          'year has one bucket per month')
+    check(periods.bucket_label_format(year) == 'Mon', 'year months are labelled without the year')
+
+    everything = periods.period_window('all', current)
+    check(everything.start is None and everything.first_bucket is None and everything.unit == 'year',
+          'all starts at the first transaction')
+    check(periods.bucket_label_format(everything) == 'YYYY', 'all is labelled by year')
+
+    try:
+        periods.period_window('fortnight', current)
+        check(False, 'an unknown period is rejected')
+    except ValueError:
+        pass
+
+
+def check_custom_windows():
+    # Day labels only repeat across months, month labels across years
+    window = periods.custom_window(date(2024, 1, 20), date(2024, 2, 10))
+    check(window.unit == 'day' and periods.bucket_label_format(window) == 'Mon DD',
+          'a range crossing a month is labelled with month and day')
+    check(window.end == periods.day_start(date(2024, 2, 11)), 'custom ranges include their end date')
+
+    window = periods.custom_window(date(2024, 2, 1), date(2024, 2, 29))
+    check(periods.bucket_label_format(window) == 'DD', 'a range within one month is labelled by day')
+
+    window = periods.custom_window(date(2023, 6, 15), date(2024, 5, 2))
+    check(window.unit == 'month' and (window.first_bucket, window.last_bucket) == (date(2023, 6, 1), date(2024, 5, 1)),
+          'a range of months is bucketed from the first of each month')
+    check(periods.bucket_label_format(window) == 'Mon YYYY', 'a range crossing a year is labelled with the year')
+
+    window = periods.custom_window(date(2015, 1, 1), date(2024, 12, 31))
+    check(window.unit == 'year', 'a range of years is bucketed by year')
+
+    window = periods.custom_window(date(2024, 3, 9), date(2024, 3, 10))
+    check(window.unit == 'hour' and periods.bucket_label_format(window) == 'Mon DD HH24:00',
+          'a two-day range is bucketed by hour and labelled with the day')
+
+    for start, end in (('2024-03-10', '2024-03-09'), ('2024-02-30', '2024-03-01'), ('', '2024-03-01')):
+        try:
+            periods.window_from_args({'start_date': start, 'end_date': end})
+            check(False, f'start_date={start!r} end_date={end!r} is rejected')
+        except ValueError:
+            pass
+    check(periods.window_from_args({}).period == 'month', 'the default period is month')
+
+
+def check_dst():
+    # Windows are computed in APP_TIMEZONE; check one that observes DST
+    saved = periods.APP_TIMEZONE
+    periods.APP_TIMEZONE = ZoneInfo('America/New_York')
+    try:
+        current = datetime(2024, 3, 10, 12, 0, tzinfo=periods.APP_TIMEZONE) # Clocks went forward at 02:00
+        today = periods.period_window('today', current)
+        check(today.start.utcoffset() == timedelta(hours=-5) and current.utcoffset() == timedelta(hours=-4),
+              'the DST change day starts before the clocks change')
+        check(today.last_bucket - today.first_bucket == timedelta(hours=23), 'the DST change day keeps 24 wall-clock buckets')
+
+        week = periods.period_window('week', current)
+        check(week.start == datetime(2024, 3, 4, tzinfo=periods.APP_TIMEZONE), 'week starts at local midnight across DST')
+
+        check(periods.localize(datetime(2024, 11, 3, 23, 30)).date() == date(2024, 11, 3)
+              and periods.local_day(datetime(2024, 11, 4, 3, 30, tzinfo=ZoneInfo('UTC'))) == date(2024, 11, 3),
+              'UTC instants fall on the local calendar day')
+    finally:
+        periods.APP_TIMEZONE = saved
+
+
+def check_chart_endpoints(n_transactions, force=False):
+    prepare_database(force)
+    try:
+        [(user_id, username)] = seed_users(1, n_transactions)
+        client = logged_in_client(user_id, username)
+        expected_buckets = {'today': 24, 'week': 7, 'month': periods.today().day, 'year': 12}
+        for period in periods.PERIODS:
+            data = client.get(f'/get_dashboard_data?period={period}&dataTypes=both').get_json()
+            bar = data['byType']['both']['bar']['chartData']
+            pie = data['byType']['both']['pie']['chartData']
+            labels = bar['labels']
+            if period in expected_buckets:
+                check(len(labels) == expected_buckets[period], f'{period}: {len(labels)} buckets')
+            check(len(set(labels)) == len(labels), f'{period}: bucket labels are unique')
+            check(abs(sum(bar['datasets'][0]['data']) - sum(pie['datasets'][0]['data'])) < 0.01,
+                  f'{period}: buckets add up to the category totals')
+            standalone = client.get(f'/get_transactions_bar_data?period={period}&dataType=both').get_json()
+            check(standalone['chartData']['labels'] == labels, f'{period}: bar endpoint returns the same buckets')
+            print(f'ok   {period}: {len(labels)} buckets ({labels[0]} .. {labels[-1]})')
+
+        end = periods.today()
+        start = end - timedelta(days=40)
+        data = client.get(f'/get_dashboard_data?start_date={start}&end_date={end}&dataTypes=both').get_json()
+        check(data['period'] == 'custom' and len(data['byType']['both']['bar']['chartData']['labels']) == 41,
+              'custom range: one bucket per day')
+        check(client.get('/get_dashboard_data?start_date=2024-01-02&end_date=2024-01-01').status_code == 400,
+              'custom range: end before start is a 400')
+    finally:
+        delete_seeded_users()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check period windows, bucket labels and the gap-filled chart series.')
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--force', action='store_true', help='Allow a non-local database host.')
+    args = parser.parse_args()
+
+    check_period_windows()
+    check_custom_windows()
+    check_dst()
+    check_chart_endpoints(args.transactions, args.force)
+
+    if failures:
+        print(f'{len(failures)} check(s) failed.')
+        sys.exit(1)
+    print('All period checks passed.')
+
+
+if __name__ == '__main__':
+    main()
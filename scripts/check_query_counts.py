@@ -0,0 +1,77 @@
+# Query-count check: drives every route through the Flask test client against a
+# local PostgreSQL database and fails if a route issues more SQL statements than
+# its budget below. Catches N+1 patterns and duplicated lookups (e.g. loading the
+# same categories twice) that the query-plan check can't see.
+# Each route is requested twice; the budget applies to the second (warm-cache) request.
+#
+# Usage (DATABASE_URL must point at a local, disposable database):
+#     python scripts/check_query_counts.py [--users 20] [--transactions 200]
+
+import argparse
+import sys
+
+from route_probe import (capture_sql, delete_seeded_users, logged_in_client, perform,
+                         prepare_database, route_requests, seed_users)
+
+# Maximum statements per route, keyed by the names used in route_probe.route_requests().
+# Chart endpoints not listed here use CHART_QUERY_BUDGET.
+QUERY_BUDGETS = {
+    'dashboard': 3, # Balance row + budget status + the user's base currency (get_user_state)
+    'account': 3,
+    'income': 1,
+    'expense': 1,
+    'categories': 1,
+    'history': 1,
+    'budgets': 3,
+    'recurring': 2,
+    'statements': 4, # Version check, re-queue of stale statements, statements + their files
+    'request_statement': 1,
+    'get_transactions_page': 1,
+    'get_transactions_page (filtered)': 1,
+    'search_transactions': 2, # Probe of the search index + the page
+    'search_transactions (substring)': 2,
+    'add_transaction': 6, # Includes the base currency, the default when the form has none
+    'edit_transaction': 7,
+    'delete_transaction': 7,
+}
+CHART_QUERY_BUDGET = 1 # A warm cache only checks the user's data_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that no route issues more SQL statements than its budget.')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=200, help='Transactions per user')
+    parser.add_argument('--force', action='store_true', help='Allow a non-local DATABASE_URL')
+    args = parser.parse_args()
+
+    prepare_database(args.force)
+    user_id, username = seed_users(args.users, args.transactions)[0]
+    client = logged_in_client(user_id, username)
+
+    failures = 0
+    try:
+        for name, method, url, data in route_requests(user_id):
+            if method == 'GET':
+                perform(client, method, url, data) # Warm the caches
+            with capture_sql() as statements:
+                response = perform(client, method, url, data)
+            budget = QUERY_BUDGETS.get(name, CHART_QUERY_BUDGET)
+            if response.status_code >= 400:
+                print(f'FAIL {name}: HTTP {response.status_code}')
+                failures += 1
+            elif len(statements) > budget:
+                print(f'FAIL {name}: {len(statements)} statements (budget {budget})')
+                for statement, _ in statements:
+                    print('    ' + ' '.join(statement.split()))
+                failures += 1
+            else:
+                print(f'ok   {name}: {len(statements)}/{budget}')
+    finally:
+        delete_seeded_users()
+
+    print(f'{failures} route(s) over budget.' if failures else 'All routes within their query budgets.')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
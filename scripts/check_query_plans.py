@@ -0,0 +1,86 @@
+# Query-plan check: drives every route through the Flask test client against a
+# local PostgreSQL database, EXPLAINs each statement the route issued, and fails
+# if any of them sequentially scans one of the app's per-user tables.
+# Plans are taken with enable_seqscan off, so a Seq Scan in the output means no
+# index can serve the query (rather than the planner preferring a scan of a
+# small table, which the seeded data can't rule out).
+#
+# Usage (DATABASE_URL must point at a local, disposable database):
+#     python scripts/check_query_plans.py [--users 200] [--transactions 500]
+
+import argparse
+import re
+import sys
+
+from route_probe import (app, capture_sql, db, delete_seeded_users, logged_in_client, perform,
+                         prepare_database, route_requests, seed_users)
+
+# Tables that must always be reached through an index
+CHECKED_TABLES = ('users', 'categories', 'transactions', 'user_balances', 'daily_rollups', 'budgets', 'budget_usage',
+                  'recurring_transactions')
+
+SEQ_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+def explain(statement, parameters):
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.rollback()
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that every route reaches the per-user tables through an index.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=500, help='Transactions per user')
+    parser.add_argument('--force', action='store_true', help='Allow a non-local DATABASE_URL')
+    args = parser.parse_args()
+
+    prepare_database(args.force)
+    print(f'Seeding {args.users} users x {args.transactions} transactions...')
+    user_id, username = seed_users(args.users, args.transactions)[0]
+    client = logged_in_client(user_id, username)
+
+    failures = 0
+    try:
+        for name, method, url, data in route_requests(user_id):
+            with capture_sql() as statements:
+                response = perform(client, method, url, data)
+            if response.status_code >= 400:
+                print(f'FAIL {name}: HTTP {response.status_code}')
+                failures += 1
+                continue
+
+            route_failures = []
+            for statement, parameters in statements:
+                # INSERTs have no plan worth checking; executemany batches can't be EXPLAINed as-is
+                if parameters is None or not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                    continue
+                plan = explain(statement, parameters)
+                scanned = [table for table in SEQ_SCAN_RE.findall(plan) if table in CHECKED_TABLES]
+                if scanned:
+                    route_failures.append((statement, plan))
+
+            if route_failures:
+                failures += 1
+                print(f'FAIL {name}: sequential scan')
+                for statement, plan in route_failures:
+                    print('    ' + ' '.join(statement.split()))
+                    print('\n'.join('      ' + line for line in plan.splitlines()))
+            else:
+                print(f'ok   {name} ({len(statements)} statements)')
+    finally:
+        delete_seeded_users()
+
+    print(f'{failures} route(s) failed.' if failures else 'All routes use index scans.')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# Shared helpers for the scripts that drive app routes against a local PostgreSQL
+# database: seeding synthetic users, logging a test client in, and capturing
+# the SQL each request issues.
+
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date, timedelta
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text  # noqa: E402
+
+from app import app, db, rebuild_user_aggregates  # noqa: E402
+import schema  # noqa: E402
+
+PROBE_USER_PREFIX = 'probe_'
+
+
+def require_local_database(force=False):
+    # These scripts insert and delete rows; refuse to point them at a remote database by accident
+    url = urlparse(app.config['SQLALCHEMY_DATABASE_URI'] or '')
+    host = url.hostname or ''
+    if not force and host not in ('', 'localhost', '127.0.0.1', '::1'):
+        sys.exit(f'Refusing to run against non-local database host {host!r} (pass --force to override).')
+
+
+def seed_users(n_users, transactions_per_user, categories_per_user=10, years=3, prefix=PROBE_USER_PREFIX):
+    # Bulk-generates users, categories and transactions with generate_series, then
+    # builds their aggregates. Returns [(user_id, username), ...].
+    with app.app_context():
+        db.session.execute(text(
+            "INSERT INTO users (username, password_hash, created_at) "
+            "SELECT :prefix || n, 'x', now() FROM generate_series(1, :n_users) AS n"
+        ), {'prefix': prefix, 'n_users': n_users})
+        users = db.session.execute(text(
+            'SELECT id, username FROM users WHERE username LIKE :pattern ORDER BY id'
+        ), {'pattern': prefix + '%'}).all()
+        user_ids = [u.id for u in users]
+
+        db.session.execute(text(
+            "INSERT INTO categories (user_id, name, type, color, created_at) "
+            "SELECT u, 'Category ' || c, CASE WHEN c % 3 = 0 THEN 'income' ELSE 'expense' END, '#888888', now() "
+            "FROM unnest(CAST(:user_ids AS BIGINT[])) AS u, generate_series(1, :n_categories) AS c"
+        ), {'user_ids': user_ids, 'n_categories': categories_per_user})
+
+        # Spread transactions over the last `years` years; ~1 in 10 is uncategorized
+        db.session.execute(text(
+            "INSERT INTO transactions (user_id, category_id, type, amount, description, date, created_at) "
+            "SELECT c.user_id, CASE WHEN random() < 0.1 THEN NULL ELSE c.id END, c.type, "
+            "       round((random() * 500 + 1)::numeric, 2), 'Probe transaction ' || n, "
+            "       CAST(:today AS date) - (random() * :days)::int, now() "
+            "FROM unnest(CAST(:user_ids AS BIGINT[])) AS u "
+            "CROSS JOIN LATERAL generate_series(1, :per_user) AS n "
+            "CROSS JOIN LATERAL ("
+            "    SELECT id, user_id, type FROM categories WHERE user_id = u "
+            "    ORDER BY id OFFSET (n % :n_categories) LIMIT 1"
+            ") AS c"
+        ), {'user_ids': user_ids, 'per_user': transactions_per_user, 'n_categories': categories_per_user,
+            'today': date.today(), 'days': 365 * years})
+
+        # An overall monthly budget and a weekly one on the first expense category
+        db.session.execute(text(
+            "INSERT INTO budgets (user_id, category_id, period, amount, created_at) "
+            "SELECT u, NULL, 'month', 2000, now() FROM unnest(CAST(:user_ids AS BIGINT[])) AS u "
+            "UNION ALL "
+            "SELECT c.user_id, min(c.id), 'week', 300, now() FROM categories c "
+            "WHERE c.user_id = ANY(CAST(:user_ids AS BIGINT[])) AND c.type = 'expense' GROUP BY c.user_id"
+        ), {'user_ids': user_ids})
+
+        rebuild_user_aggregates(user_ids)
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        return [(u.id, u.username) for u in users]
+
+
+def delete_seeded_users(prefix=PROBE_USER_PREFIX):
+    with app.app_context():
+        user_ids = db.session.execute(text(
+            'SELECT id FROM users WHERE username LIKE :pattern'
+        ), {'pattern': prefix + '%'}).scalars().all()
+        if user_ids:
+            # Child tables cascade from users (see migrations/0001_baseline.sql)
+            db.session.execute(text('DELETE FROM users WHERE id = ANY(:ids)'), {'ids': user_ids})
+            db.session.commit()
+
+
+def prepare_database(force=False):
+    require_local_database(force)
+    with app.app_context():
+        schema.apply_migrations(db.engine, echo=lambda message: None)
+    delete_seeded_users()
+
+
+def logged_in_client(user_id, username):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = username
+    return client
+
+
+def sample_ids(user_id):
+    # A transaction id and an expense category id owned by the user, for the write routes
+    with app.app_context():
+        transaction_id = db.session.execute(text(
+            'SELECT id FROM transactions WHERE user_id = :u ORDER BY date DESC LIMIT 1'
+        ), {'u': user_id}).scalar()
+        category_id = db.session.execute(text(
+            "SELECT id FROM categories WHERE user_id = :u AND type = 'expense' ORDER BY id LIMIT 1"
+        ), {'u': user_id}).scalar()
+        return transaction_id, category_id
+
+
+def route_requests(user_id):
+    # (name, method, url, form data) for every route worth probing
+    transaction_id, category_id = sample_ids(user_id)
+    today = date.today().isoformat()
+    write_form = {'type': 'expense', 'category_id': str(category_id), 'amount': '12.34',
+                  'description': 'probe', 'date': today}
+    requests = [
+        ('dashboard', 'GET', '/dashboard', None),
+        ('account', 'GET', '/account', None),
+        ('income', 'GET', '/income', None),
+        ('expense', 'GET', '/expense', None),
+        ('categories', 'GET', '/categories', None),
+        ('history', 'GET', '/history', None),
+        ('budgets', 'GET', '/budgets', None),
+        ('get_budget_status', 'GET', '/get_budget_status', None),
+        ('get_spending_insights', 'GET', '/get_spending_insights', None),
+        ('recurring', 'GET', '/recurring', None),
+        ('statements', 'GET', '/statements', None),
+        ('get_transactions_page', 'GET', '/get_transactions_page', None),
+        ('search_transactions', 'GET', '/search_transactions?q=probe%20transaction%2012', None),
+        ('search_transactions (substring)', 'GET', '/search_transactions?q=ransaction', None),
+        ('get_transactions_page (filtered)', 'GET',
+         f'/get_transactions_page?type=expense&category_id={category_id}'
+         f'&start_date={(date.today() - timedelta(days=90)).isoformat()}&end_date={today}', None),
+    ]
+    for period in ('today', 'week', 'month', 'year', 'all'):
+        requests.append((f'get_transactions_data ({period})', 'GET',
+                         f'/get_transactions_data?period={period}&dataType=expense', None))
+        requests.append((f'get_transactions_bar_data ({period})', 'GET',
+                         f'/get_transactions_bar_data?period={period}&dataType=expense', None))
+        requests.append((f'get_dashboard_data ({period})', 'GET',
+                         f'/get_dashboard_data?period={period}&dataTypes=income,expense,both', None))
+    requests += [
+        ('request_statement', 'POST', '/request_statement', {'statement': f'month:{today[:7]}'}),
+        ('add_transaction', 'POST', '/add_transaction', write_form),
+        ('edit_transaction', 'POST', f'/edit_transaction/{transaction_id}', write_form),
+        ('delete_transaction', 'POST', f'/delete_transaction/{transaction_id}', None),
+    ]
+    return requests
+
+
+@contextmanager
+def capture_sql():
+    # Collects (statement, parameters) for every statement sent to the database inside the block
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, None if executemany else parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def perform(client, method, url, data):
+    if method == 'POST':
+        return client.post(url, data=data)
+    return client.get(url)
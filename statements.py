@@ -0,0 +1,152 @@
+# --- Statements ---
+# Period arithmetic and PDF rendering for account statements; app.py owns the statements
+# tables, the job queue and the workers (`flask run-statements`), and renders the HTML
+# (templates/statement.html) and CSV files itself.
+#
+# A statement covers one calendar month or year in APP_TIMEZONE and is identified by
+# (period, period_start), written as a key like 'month:2026-09' or 'year:2025' in forms.
+#
+# PDF files need the optional `fpdf2` package; without it statements are rendered as HTML and
+# CSV only. fpdf2's built-in fonts cover Latin-1, so other characters come out as '?' in the
+# PDF; the HTML and CSV files keep them.
+
+from datetime import date
+
+from recurring import add_months
+
+try:
+    from fpdf import FPDF
+except ImportError: # Optional dependency; PDF statements are skipped without it
+    FPDF = None
+
+PERIODS = ('month', 'year')
+FORMAT_MIMETYPES = {'html': 'text/html', 'csv': 'text/csv', 'pdf': 'application/pdf'}
+PDF_DESCRIPTION_CHARS = 40 # Longer descriptions and category names are cut in the PDF's transaction list
+PDF_CATEGORY_CHARS = 22
+LAYOUT_VERSION = 1 # Part of each statement's digest; bump it to regenerate every statement after a layout change
+
+
+def available_formats():
+    return ('html', 'csv', 'pdf') if FPDF is not None else ('html', 'csv')
+
+
+def period_start(period, day):
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'year':
+        return day.replace(month=1, day=1)
+    raise ValueError(f'period must be one of: {", ".join(PERIODS)}.')
+
+
+def period_end(period, start):
+    # First day after the period
+    return add_months(start, 1 if period == 'month' else 12)
+
+
+def previous_period_start(period, today):
+    # The last complete period, e.g. for the month-end batch
+    return add_months(period_start(period, today), -1 if period == 'month' else -12)
+
+
+def period_label(period, start):
+    return start.strftime('%B %Y') if period == 'month' else str(start.year)
+
+
+def statement_key(period, start):
+    return f'{period}:{start.strftime("%Y-%m") if period == "month" else start.year}'
+
+
+def parse_statement_key(value):
+    # 'month:2026-09' or 'year:2025' -> (period, period_start); raises ValueError
+    period, _, when = (value or '').partition(':')
+    try:
+        if period == 'month':
+            year, month = when.split('-')
+            return period, date(int(year), int(month), 1)
+        if period == 'year':
+            return period, date(int(when), 1, 1)
+    except ValueError:
+        pass
+    raise ValueError('Please choose a month or a year.')
+
+
+def recent_periods(today, months=24, years=5):
+    # [(period, period_start)] offered on the statements page, newest first; the current
+    # month and year are included and cover the days so far
+    this_month = period_start('month', today)
+    this_year = period_start('year', today)
+    return ([('month', add_months(this_month, -i)) for i in range(months)] +
+            [('year', this_year.replace(year=this_year.year - i)) for i in range(years)])
+
+
+def _latin1(value):
+    return str(value).encode('latin-1', 'replace').decode('latin-1')
+
+
+def _clip(value, length):
+    return value if len(value) <= length else value[:length - 3] + '...'
+
+
+def _money(value):
+    return f'{value:,.2f}'
+
+
+def render_pdf(statement):
+    # statement: the dict app.py also passes to templates/statement.html
+    pdf = FPDF(format='A4')
+    pdf.set_title(_latin1(f'Statement {statement["label"]}'))
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+
+    pdf.set_font('Helvetica', 'B', 16)
+    pdf.cell(0, 10, _latin1(f'Statement - {statement["label"]}'), new_x='LMARGIN', new_y='NEXT')
+    pdf.set_font('Helvetica', size=9)
+    pdf.cell(0, 5, _latin1(f'{statement["username"]}, {statement["first_day"]:%b %d, %Y} to '
+                           f'{statement["last_day"]:%b %d, %Y}. Amounts in {statement["currency"]}.'),
+             new_x='LMARGIN', new_y='NEXT')
+    pdf.ln(4)
+
+    pdf.set_font('Helvetica', size=10)
+    with pdf.table(col_widths=(50, 40), width=90, align='LEFT', text_align=('LEFT', 'RIGHT'),
+                   first_row_as_headings=False) as table:
+        for label, value in (('Income', _money(statement['income'])), ('Expenses', _money(statement['expense'])),
+                             ('Net', _money(statement['net'])), ('Transactions', str(statement['transaction_count']))):
+            table.row((label, value))
+    pdf.ln(6)
+
+    pdf.set_font('Helvetica', 'B', 12)
+    pdf.cell(0, 8, 'By category', new_x='LMARGIN', new_y='NEXT')
+    pdf.set_font('Helvetica', size=9)
+    with pdf.table(col_widths=(20, 70, 20, 35, 20), text_align=('LEFT', 'LEFT', 'RIGHT', 'RIGHT', 'RIGHT')) as table:
+        table.row(('Type', 'Category', 'Count', 'Amount', 'Share'))
+        for c in statement['categories']:
+            table.row((c['type'].title(), _latin1(c['name']), str(c['count']), _money(c['amount']), f'{c["share"]:.1%}'))
+    pdf.ln(6)
+
+    # Plain one-line cells rather than pdf.table(), which wraps every cell and is an order of
+    # magnitude slower for thousands of rows; long descriptions are cut instead
+    pdf.set_font('Helvetica', 'B', 12)
+    pdf.cell(0, 8, 'Transactions', new_x='LMARGIN', new_y='NEXT')
+    columns = ((20, 'L', 'Date'), (62, 'L', 'Description'), (35, 'L', 'Category'), (35, 'R', 'Amount'),
+               (28, 'R', statement['currency']))
+
+    def transaction_row(values, style=''):
+        pdf.set_font('Helvetica', style, 8)
+        for (width, align, _), value in zip(columns, values):
+            pdf.cell(width, 5, value, border='B', align=align)
+        pdf.ln()
+
+    transaction_row([heading for _, _, heading in columns], 'B')
+    for t in statement['transactions']:
+        if pdf.will_page_break(5):
+            pdf.add_page()
+            transaction_row([heading for _, _, heading in columns], 'B')
+        sign = '' if t['type'] == 'income' else '-'
+        transaction_row((t['date'], _latin1(_clip(t['description'], PDF_DESCRIPTION_CHARS)),
+                         _latin1(_clip(t['category'], PDF_CATEGORY_CHARS)),
+                         f'{sign}{_money(t["amount"])} {t["currency"]}', f'{sign}{_money(t["base_amount"])}'))
+    if statement['unlisted']:
+        pdf.ln(3)
+        pdf.cell(0, 5, f'{statement["unlisted"]} more transaction(s) are listed in the CSV file.',
+                 new_x='LMARGIN', new_y='NEXT')
+    return bytes(pdf.output())